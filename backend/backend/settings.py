@@ -1,7 +1,9 @@
 
 import os
+import json
 from pathlib import Path
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 # point to our root .env
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,6 +45,7 @@ INSTALLED_APPS += [
 
 
 MIDDLEWARE = [
+    'chat.utils.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,11 +85,61 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (default) or postgres.
+#
+# PostgreSQL keeps connections open for DB_CONN_MAX_AGE seconds, checked
+# before reuse when DB_CONN_HEALTH_CHECKS is on. With DB_POOL=True each
+# worker process draws from a psycopg pool of DB_POOL_MIN_SIZE to
+# DB_POOL_MAX_SIZE connections instead (Django requires CONN_MAX_AGE=0 then).
+#
+# SQLite connections get SQLITE_PRAGMAS when opened (see
+# chat.utils.db_profile.configure_sqlite): WAL lets readers run alongside the
+# writer, busy_timeout makes a writer wait for the lock instead of failing
+# with "database is locked", and IMMEDIATE transactions take the write lock
+# up front so waiting for it is always possible.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'agentica'),
+            'USER': os.getenv('POSTGRES_USER', 'agentica'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+                },
+            } if DB_POOL else {},
+        }
     }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / os.getenv('SQLITE_PATH', 'db.sqlite3'),
+            'OPTIONS': {
+                'transaction_mode': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE {DB_ENGINE!r}; use 'sqlite' or 'postgres'.")
+
+# Applied to every new SQLite connection, in order; remove one to keep
+# SQLite's default. mmap_size is in bytes (0 = no memory-mapped I/O).
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
 }
 
 
@@ -136,6 +189,171 @@ MEDIA_URL = "/media/"
 # Directory where uploaded files are stored
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Uploaded documents live in the "uploads" storage, content-addressed and
+# sharded by hash prefix (ab/cd/<sha256>.<ext>). The default backend writes
+# atomically under UPLOAD_STORAGE_ROOT; any Django storage works, e.g. an
+# S3-compatible one configured through UPLOAD_STORAGE_OPTIONS (JSON).
+# Uploads are spooled to FILE_UPLOAD_TEMP_DIR while hashed; on the same
+# filesystem as the storage, saving them is a rename.
+UPLOAD_STORAGE_ROOT = BASE_DIR / os.getenv("UPLOAD_STORAGE_ROOT", "uploads")
+FILE_UPLOAD_TEMP_DIR = os.getenv("FILE_UPLOAD_TEMP_DIR") or None
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "uploads": {
+        "BACKEND": os.getenv("UPLOAD_STORAGE_BACKEND", "chat.utils.upload_storage.ShardedFileSystemStorage"),
+        "OPTIONS": json.loads(os.getenv("UPLOAD_STORAGE_OPTIONS") or "{}") or {"location": str(UPLOAD_STORAGE_ROOT)},
+    },
+}
+
+
+# Vector stores (Chroma persist directories)
+PUBLIC_CHROMA_DB_PATH = BASE_DIR / os.getenv("PUBLIC_CHROMA_DB_PATH", "public_chroma_db")
+PRIVATE_CHROMA_DB_PATH = BASE_DIR / os.getenv("PRIVATE_CHROMA_DB_PATH", "private_chroma_db")
+
+# Vector backend per store: "chroma", "numpy" (in-process index kept under
+# <store path>/numpy_index/) or a dotted path to a VectorBackend class.
+# Switching a store's backend starts it empty; re-process its files.
+VECTOR_STORE_BACKENDS = {
+    "Public": os.getenv("PUBLIC_VECTOR_BACKEND", "chroma"),
+    "Private": os.getenv("PRIVATE_VECTOR_BACKEND", "chroma"),
+}
+# The numpy index searches exhaustively until a collection holds
+# NUMPY_INDEX_IVF_MIN_VECTORS vectors, then trains an IVF partition of
+# NUMPY_INDEX_IVF_LISTS lists (0 = sqrt(n)) and probes the
+# NUMPY_INDEX_IVF_NPROBE nearest lists per query.
+NUMPY_INDEX_IVF_MIN_VECTORS = int(os.getenv("NUMPY_INDEX_IVF_MIN_VECTORS", "20000"))
+NUMPY_INDEX_IVF_LISTS = int(os.getenv("NUMPY_INDEX_IVF_LISTS", "0"))
+NUMPY_INDEX_IVF_NPROBE = int(os.getenv("NUMPY_INDEX_IVF_NPROBE", "8"))
+# Compact storage for the numpy index: search the first NUMPY_INDEX_DIMS
+# dimensions (Matryoshka truncation, e.g. 256/512/1024; 0 = all) quantized
+# per NUMPY_INDEX_QUANTIZATION ("none", "int8" or "binary"), then re-rank the
+# NUMPY_INDEX_RESCORE * k best on the full vectors. NUMPY_INDEX_RESCORE=0
+# drops the full vectors. Fixed per collection when it is first written.
+NUMPY_INDEX_DIMS = int(os.getenv("NUMPY_INDEX_DIMS", "0"))
+NUMPY_INDEX_QUANTIZATION = os.getenv("NUMPY_INDEX_QUANTIZATION", "none")
+NUMPY_INDEX_RESCORE = int(os.getenv("NUMPY_INDEX_RESCORE", "4"))
+# Per-owner private stores and BM25 indexes (one entry each) kept open per
+# process, as each holds files and connections; the least recently used beyond
+# this are closed. Keep it above twice the number of owners served at once.
+PRIVATE_STORE_CACHE_SIZE = int(os.getenv("PRIVATE_STORE_CACHE_SIZE", "256"))
+
+# Embeddings
+# EMBEDDINGS_BACKEND: "openai", "fake" (deterministic, offline) or a dotted path
+# to a LangChain `Embeddings` class.
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "openai")
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "3072"))
+FAKE_EMBEDDING_LATENCY = float(os.getenv("FAKE_EMBEDDING_LATENCY", "0"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+
+# Chat model: "openai", "fake" (fixed answer after FAKE_CHAT_LATENCY seconds)
+# or a dotted path to a LangChain chat model class.
+CHAT_BACKEND = os.getenv("CHAT_BACKEND", "openai")
+FAKE_CHAT_LATENCY = float(os.getenv("FAKE_CHAT_LATENCY", "0"))
+
+# Streaming ingestion: pages split per window, and chunks buffered before
+# each embed + upsert flush
+INGEST_WINDOW_PAGES = int(os.getenv("INGEST_WINDOW_PAGES", "16"))
+INGEST_MAX_CHUNKS_IN_MEMORY = int(os.getenv("INGEST_MAX_CHUNKS_IN_MEMORY", "512"))
+INGEST_TEXT_SEGMENT_CHARS = int(os.getenv("INGEST_TEXT_SEGMENT_CHARS", "1000000"))
+
+# Bulk upload (/api/chat/files/bulk/): limits per request, counting zip members
+# and uncompressed bytes.
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "5000"))
+BULK_UPLOAD_MAX_BYTES = int(os.getenv("BULK_UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+DATA_UPLOAD_MAX_NUMBER_FILES = BULK_UPLOAD_MAX_FILES
+
+# Parsing and splitting run in a pool of INGEST_PARSE_WORKERS processes
+# (0 = one per CPU, 1 = in the calling process). Large PDFs are fanned out
+# across the pool in ranges of INGEST_PDF_PAGES_PER_TASK pages.
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", "0"))
+INGEST_PDF_PAGES_PER_TASK = int(os.getenv("INGEST_PDF_PAGES_PER_TASK", "8"))
+
+# Local state for the RAG pipeline (caches, indexes)
+RAG_STATE_DIR = BASE_DIR / os.getenv("RAG_STATE_DIR", "rag_state")
+
+# Content-addressed embedding cache (SQLite, LRU-capped)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "True") == "True"
+EMBEDDING_CACHE_PATH = RAG_STATE_DIR / "embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+
+# Public chat answer cache (per process): exact match on the normalized
+# question, then cosine similarity of query embeddings >= ANSWER_CACHE_SIMILARITY.
+# Invalidated whenever the public collection changes.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "True") == "True"
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_GENERATION_PATH = RAG_STATE_DIR / "public_store.generation"
+
+# Hybrid retrieval: dense (Chroma) and sparse (BM25) results, RETRIEVAL_FETCH_K
+# each, fused by reciprocal rank fusion. A weight of 0 disables that signal.
+BM25_INDEX_DIR = RAG_STATE_DIR / "bm25"
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+RETRIEVAL_DENSE_WEIGHT = float(os.getenv("RETRIEVAL_DENSE_WEIGHT", "1.0"))
+RETRIEVAL_SPARSE_WEIGHT = float(os.getenv("RETRIEVAL_SPARSE_WEIGHT", "1.0"))
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+
+# Rerank stage per chat endpoint: the fused top `candidates` are reranked
+# (cosine + lexical overlap, then MMR with `mmr_lambda`; 1.0 = no diversity
+# penalty) and the top `k` go into the prompt. candidates <= k skips it.
+# The k chunks are then merged where adjacent and packed, most relevant
+# first, into at most `context_tokens` tokens (0 = no packing).
+RETRIEVAL_ENDPOINTS = {
+    endpoint: {
+        "k": int(os.getenv(f"RETRIEVAL_{endpoint.upper()}_K", "3")),
+        "candidates": int(os.getenv(f"RETRIEVAL_{endpoint.upper()}_CANDIDATES", "12")),
+        "mmr_lambda": float(os.getenv(f"RETRIEVAL_{endpoint.upper()}_MMR_LAMBDA", "0.7")),
+        "context_tokens": int(os.getenv(f"RETRIEVAL_{endpoint.upper()}_CONTEXT_TOKENS", "1500")),
+    }
+    for endpoint in ("public", "private")
+}
+RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.3"))
+
+# Private chat memory: the last CHAT_MEMORY_TURNS turns (0 = no memory) plus a
+# rolling summary of older ones (at most CHAT_MEMORY_SUMMARY_TOKENS, written by
+# a background thread after the response), sent to the model within
+# CHAT_MEMORY_TOKENS. Follow-ups are condensed into a standalone query for
+# retrieval unless CHAT_MEMORY_CONDENSE is off. Memory is kept per user in the
+# CHAT_MEMORY_CACHE cache alias for CHAT_MEMORY_TTL seconds; the default
+# local-memory cache is per process, so configure a shared CACHES backend when
+# running several workers.
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", "6"))
+CHAT_MEMORY_TOKENS = int(os.getenv("CHAT_MEMORY_TOKENS", "1000"))
+CHAT_MEMORY_SUMMARY_TOKENS = int(os.getenv("CHAT_MEMORY_SUMMARY_TOKENS", "300"))
+CHAT_MEMORY_CONDENSE = os.getenv("CHAT_MEMORY_CONDENSE", "True") == "True"
+CHAT_MEMORY_CACHE = os.getenv("CHAT_MEMORY_CACHE", "default")
+CHAT_MEMORY_TTL = int(os.getenv("CHAT_MEMORY_TTL", "86400"))
+
+# Chat turns are written behind the response: queued per process (and appended
+# to a spool file under CONVERSATION_LOG_SPOOL_DIR, replayed if the worker
+# dies) and bulk-inserted every CONVERSATION_LOG_FLUSH_SECONDS or once
+# CONVERSATION_LOG_MAX_RECORDS are waiting. Until then every worker reads a
+# user's queued turns from the spool files, so keep the spool directory shared
+# by all workers. CONVERSATION_LOG_SPOOL=False keeps the queue in memory only
+# and writes private turns inline; CONVERSATION_LOG_BUFFERED=False writes each
+# turn inline.
+CONVERSATION_LOG_BUFFERED = os.getenv("CONVERSATION_LOG_BUFFERED", "True") == "True"
+CONVERSATION_LOG_SPOOL_DIR = None
+if os.getenv("CONVERSATION_LOG_SPOOL", "True") == "True":
+    CONVERSATION_LOG_SPOOL_DIR = BASE_DIR / (os.getenv("CONVERSATION_LOG_SPOOL_DIR") or RAG_STATE_DIR / "conversation_log")
+CONVERSATION_LOG_MAX_RECORDS = int(os.getenv("CONVERSATION_LOG_MAX_RECORDS", "100"))
+CONVERSATION_LOG_FLUSH_SECONDS = float(os.getenv("CONVERSATION_LOG_FLUSH_SECONDS", "1.0"))
+
+# Private chat history API: default and maximum `page_size` per cursor page
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "10"))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", "100"))
+
+# Tracing: per-stage spans (embedding, vector search, LLM, DB writes) feed
+# p50/p95/p99 summaries served in Prometheus format at /metrics. Requests
+# slower than TRACING_SLOW_REQUEST_SECONDS are logged with their spans
+# (0 = never). Set METRICS_TOKEN to require it as a bearer token on /metrics.
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "True") == "True"
+TRACING_SLOW_REQUEST_SECONDS = float(os.getenv("TRACING_SLOW_REQUEST_SECONDS", "5"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -7,6 +7,8 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 
+from chat.views import prometheus_metrics
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Agentica API",
@@ -21,6 +23,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/users/", include("users.urls", namespace="users")),
     path("api/chat/", include("chat.urls", namespace="chat")),
+    path("metrics", prometheus_metrics, name="metrics"),
 
     # Swagger schema endpoints
     re_path(
@@ -1,7 +1,7 @@
 # chat/admin.py
 
 from django.contrib import admin
-from .models import File, Conversation
+from .models import File, Conversation, IngestionBatch, IngestionJob
 
 
 @admin.register(File)
@@ -18,3 +18,18 @@ class ConversationAdmin(admin.ModelAdmin):
     list_filter = ('conversation_type',)
     search_fields = ('query', 'answer', 'user__username')
     ordering = ('-id',)
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'file', 'batch', 'status', 'stage', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'stage')
+    search_fields = ('file__filename', 'worker')
+    ordering = ('-id',)
+
+
+@admin.register(IngestionBatch)
+class IngestionBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'created_at')
+    search_fields = ('user__username',)
+    ordering = ('-id',)
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from .utils.db_profile import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='chat.configure_sqlite')
@@ -0,0 +1,159 @@
+# chat/async_views.py
+#
+# Async counterparts of PublicChatView / PrivateChatView, and the streaming
+# chat endpoints. DRF views are sync-only, so these are plain Django async
+# views; deploy them on `backend.asgi:application` (e.g. gunicorn -k
+# uvicorn.workers.UvicornWorker) so one worker can serve many chat requests
+# while they wait on OpenAI/Chroma, and streamed tokens go out as they come.
+
+import json
+import time
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .models import Conversation
+from .serializers import ConversationSerializer, serialize_source_documents
+from .utils import tracing
+from .utils.conversation_log import alog_conversation, arecent_conversations
+from .utils.conversation_memory import aremember_turn
+from .utils.public_chat import public_ask_async, public_stream
+from .utils.private_chat import ask_async as private_ask_async, ask_stream as private_ask_stream
+from .utils.streaming import sse_response_stream
+
+logger = logging.getLogger(__name__)
+
+
+async def authenticate(request):
+    """
+    Resolve the JWT bearer token to a user, or None if missing/invalid.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+def read_message(request) -> str:
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return ''
+    else:
+        data = request.POST
+    return str(data.get('message', '')).strip()
+
+
+@csrf_exempt
+@require_POST
+async def public_chat(request):
+    """
+    POST /api/chat/chat/async/public/ → async PublicChatView.
+    """
+    message = read_message(request)
+    if not message:
+        return JsonResponse({'error': 'Message is required.'}, status=400)
+
+    output = await public_ask_async(message)
+    reply = output.get('result')
+    sources = serialize_source_documents(output.get('source_documents', []))
+
+    with tracing.span("db.conversation_write", endpoint="public"):
+        await alog_conversation(None, Conversation.PUBLIC, message, reply, sources)
+
+    return JsonResponse({'reply': reply})
+
+
+@csrf_exempt
+@require_POST
+async def private_chat(request):
+    """
+    POST /api/chat/chat/async/private/ → async PrivateChatView.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    message = read_message(request)
+    if not message:
+        return JsonResponse({'error': 'Message is required.'}, status=400)
+
+    output = await private_ask_async(message, user.id)
+    reply = output.get('result')
+    sources = serialize_source_documents(output.get('source_documents', []))
+
+    with tracing.span("db.conversation_write", endpoint="private"):
+        conversation = await alog_conversation(user, Conversation.PRIVATE, message, reply, sources)
+    await aremember_turn(user.id, conversation)
+
+    with tracing.span("db.history", endpoint="private"):
+        recent_history = await arecent_conversations(user.id, Conversation.PRIVATE, 4)
+        serialized = ConversationSerializer(recent_history, many=True)
+    return JsonResponse({
+        'reply': reply,
+        'sources': sources,
+        'history': serialized.data[::-1]  # Oldest first
+    })
+
+
+def event_stream_response(stream) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def public_chat_stream(request):
+    """
+    POST /api/chat/chat/public/stream/ →
+    Server-sent events: `sources`, then `token`s, then `done`.
+    """
+    started = time.perf_counter()
+    message = read_message(request)
+    if not message:
+        return JsonResponse({'error': 'Message is required.'}, status=400)
+
+    async def save(reply, sources):
+        with tracing.span("db.conversation_write", endpoint="public"):
+            return await alog_conversation(None, Conversation.PUBLIC, message, reply, sources)
+
+    return event_stream_response(
+        sse_response_stream(public_stream(message), 'public', save, started)
+    )
+
+
+@csrf_exempt
+@require_POST
+async def private_chat_stream(request):
+    """
+    POST /api/chat/chat/private/stream/ →
+    Server-sent events: `sources`, then `token`s, then `done`.
+    """
+    started = time.perf_counter()
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    message = read_message(request)
+    if not message:
+        return JsonResponse({'error': 'Message is required.'}, status=400)
+
+    async def save(reply, sources):
+        with tracing.span("db.conversation_write", endpoint="private"):
+            conversation = await alog_conversation(user, Conversation.PRIVATE, message, reply, sources)
+        await aremember_turn(user.id, conversation)
+        return conversation
+
+    return event_stream_response(
+        sse_response_stream(private_ask_stream(message, user.id), 'private', save, started)
+    )
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import resource
+import statistics
+
+
+def current_rss_mb() -> float:
+    """
+    Resident set size of this process in MB (falls back to peak RSS).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes everywhere else
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return peak / divisor
+
+
+def summarize(samples) -> dict:
+    """
+    Mean / median / min / max of a list of numbers.
+    """
+    samples = list(samples)
+    if not samples:
+        return {"n": 0}
+    return {
+        "n": len(samples),
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+    }
+
+
+def percentiles(samples, points=(50, 95, 99)) -> dict:
+    """
+    Nearest-rank percentiles, e.g. {'p50': ..., 'p95': ..., 'p99': ...}.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{p}": None for p in points}
+    result = {}
+    for p in points:
+        rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+        result[f"p{p}"] = ordered[rank]
+    return result
+
+
+def write_json(data: dict, path: str = None, stdout=None):
+    """
+    Dump benchmark results as JSON to `path`, or to `stdout` if no path is given.
+    """
+    payload = json.dumps(data, indent=2, sort_keys=True, default=str)
+    if path:
+        with open(path, "w") as f:
+            f.write(payload + "\n")
+    elif stdout is not None:
+        stdout.write(payload)
+    return payload
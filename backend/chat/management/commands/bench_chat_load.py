@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import tempfile
+import subprocess
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.benchmarks import percentiles, summarize, write_json
+from chat.utils.fakes import start_fake_openai_server
+
+
+# Ingests a small synthetic corpus into the public store so retrieval has
+# something to return.
+SEED_SCRIPT = r"""
+import os, sys
+import django
+django.setup()
+
+from chat.models import File
+from chat.utils.process_file import process_file
+
+folder = sys.argv[1]
+os.makedirs(folder, exist_ok=True)
+path = os.path.join(folder, "seed.txt")
+with open(path, "w") as f:
+    for i in range(200):
+        f.write(f"Paragraph {i} about topic{i % 17} and subject{i % 29}.\n\n")
+status = process_file(File(filename="seed.txt", information_type=File.PUBLIC), folder)
+assert status == "Processed", status
+"""
+
+SERVERS = {
+    "wsgi": ["backend.wsgi:application"],
+    "asgi": ["backend.asgi:application", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+ENDPOINTS = {
+    "wsgi": "/api/chat/chat/public/",
+    "asgi": "/api/chat/chat/async/public/",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_listening(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"Server on port {port} did not start within {timeout:.0f}s")
+
+
+async def drive_load(url: str, concurrency: int, requests: int, timeout: float) -> dict:
+    """
+    `concurrency` clients each POST questions back to back until
+    `requests` have been sent in total.
+    """
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def client(session):
+        nonlocal errors
+        for i in remaining:
+            started = time.perf_counter()
+            try:
+                response = await session.post(url, json={"message": f"What is topic{i % 17}?"})
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    throughput = len(latencies) / elapsed if elapsed else 0.0
+    mean_latency = sum(latencies) / len(latencies) if latencies else 0.0
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": elapsed,
+        "requests_per_s": throughput,
+        # Little's law: requests actually in flight on the server on average
+        "effective_concurrency": throughput * mean_latency,
+        "latency_s": {**summarize(latencies), **percentiles(latencies)},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the sync (WSGI) and async (ASGI/uvicorn) public chat endpoints "
+        "against a local fake OpenAI server and report throughput, latency "
+        "percentiles and effective concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--servers", default="wsgi,asgi")
+        parser.add_argument("--concurrency", default="1,8,32")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level.")
+        parser.add_argument("--workers", type=int, default=1, help="Gunicorn worker processes.")
+        parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake OpenAI seconds per request.")
+        parser.add_argument(
+            "--embedding-latency", type=float, default=0.05,
+            help="Fake seconds per query embedding (embeddings run in-process).",
+        )
+        parser.add_argument("--timeout", type=float, default=120.0)
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        fake_openai = start_fake_openai_server(latency=options["llm_latency"])
+        results = {
+            "workers": options["workers"],
+            "llm_latency_s": options["llm_latency"],
+            "embedding_latency_s": options["embedding_latency"],
+            "runs": [],
+        }
+
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                env = os.environ.copy()
+                env.update({
+                    "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings"),
+                    "SQLITE_PATH": os.path.join(workdir, "db.sqlite3"),
+                    "PUBLIC_CHROMA_DB_PATH": os.path.join(workdir, "public_chroma_db"),
+                    "PRIVATE_CHROMA_DB_PATH": os.path.join(workdir, "private_chroma_db"),
+                    "RAG_STATE_DIR": os.path.join(workdir, "state"),
+                    "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_openai.server_port}/v1",
+                    "OPENAI_API_KEY": "sk-fake",
+                    # OpenAIEmbeddings tokenizes with tiktoken, which needs network
+                    # access to fetch its encodings, so embed in-process instead.
+                    "EMBEDDINGS_BACKEND": "fake",
+                    "FAKE_EMBEDDING_DIM": "256",
+                    "FAKE_EMBEDDING_LATENCY": str(options["embedding_latency"]),
+                    "EMBEDDING_CACHE_ENABLED": "False",
+                    "ALLOWED_HOSTS": "127.0.0.1,localhost",
+                    "DEBUG": "False",
+                })
+                self._run([sys.executable, "manage.py", "migrate", "--noinput"], env)
+                self._run([sys.executable, "-c", SEED_SCRIPT, os.path.join(workdir, "uploads")], env)
+
+                for server in options["servers"].split(","):
+                    port = free_port()
+                    proc = subprocess.Popen(
+                        [sys.executable, "-m", "gunicorn", *SERVERS[server],
+                         "-w", str(options["workers"]), "-b", f"127.0.0.1:{port}",
+                         "--timeout", str(int(options["timeout"]))],
+                        cwd=settings.BASE_DIR,
+                        env=env,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                    )
+                    try:
+                        wait_until_listening(port)
+                        url = f"http://127.0.0.1:{port}{ENDPOINTS[server]}"
+                        for concurrency in [int(v) for v in options["concurrency"].split(",")]:
+                            run = asyncio.run(drive_load(url, concurrency, options["requests"], options["timeout"]))
+                            run["server"] = server
+                            results["runs"].append(run)
+                            self.stderr.write(
+                                f"{server} concurrency={concurrency:>3}: {run['requests_per_s']:.1f} req/s, "
+                                f"p50 {run['latency_s']['p50'] or 0:.3f}s, "
+                                f"p99 {run['latency_s']['p99'] or 0:.3f}s, "
+                                f"effective concurrency {run['effective_concurrency']:.1f}, "
+                                f"{run['errors']} errors"
+                            )
+                    finally:
+                        proc.terminate()
+                        proc.wait(timeout=30)
+        finally:
+            fake_openai.shutdown()
+
+        write_json(results, options.get("output"), self.stdout)
+
+    def _run(self, command, env):
+        proc = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            self.stderr.write(proc.stderr)
+            raise SystemExit(f"Command failed: {' '.join(command[:3])}")
@@ -0,0 +1,129 @@
+import os
+import time
+import random
+import platform
+import tempfile
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.benchmarks import write_json
+from chat.management.commands.bench_rag import drive_chat, isolated_pipeline, write_document
+from chat.models import Conversation, File
+from chat.utils.db_profile import describe
+from chat.utils.fakes import FakeChatModel, FakeEmbeddings
+from chat.utils.process_file import process_file
+
+# SQLite as this project ran it before database profiles: deferred
+# transactions and no pragmas (rollback journal, synchronous=FULL, Python's
+# 5 s busy timeout)
+SQLITE_PROFILES = {
+    "legacy": {"options": {}, "pragmas": {}},
+    "tuned": None,  # as configured in settings
+}
+
+
+@contextmanager
+def database_profile(name: str):
+    """
+    Open connections with the SQLite profile `name`, or as configured for
+    any other backend, and restore the configuration afterwards.
+    """
+    profile = SQLITE_PROFILES.get(name) if connection.vendor == "sqlite" else None
+    if profile is None:
+        yield
+        return
+
+    connections.close_all()
+    options = connection.settings_dict["OPTIONS"]
+    saved = dict(options)
+    options.clear()
+    options.update(profile["options"])
+    try:
+        with override_settings(SQLITE_PRAGMAS=profile["pragmas"]):
+            yield
+    finally:
+        connections.close_all()
+        options.clear()
+        options.update(saved)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the public and private chat endpoints with concurrent clients "
+        "(fake embeddings and LLM, every turn written inline) against the "
+        "configured database, as JSON. On SQLite the tuned profile (WAL, "
+        "busy timeout, IMMEDIATE transactions) is compared with the legacy "
+        "defaults; on PostgreSQL run it once per DB_POOL setting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default="legacy,tuned",
+                            help="SQLite profiles to compare (ignored on other backends).")
+        parser.add_argument("--endpoints", default="public,private")
+        parser.add_argument("--concurrency", default="1,8,32")
+        parser.add_argument("--requests", type=int, default=200, help="Chat requests per concurrency level.")
+        parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake seconds per LLM call.")
+        parser.add_argument("--dim", type=int, default=64)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        profiles = options["profiles"].split(",") if connection.vendor == "sqlite" else [connection.vendor]
+        unknown = [name for name in profiles if name not in SQLITE_PROFILES and connection.vendor == "sqlite"]
+        if unknown:
+            raise CommandError(f"Unknown SQLite profiles: {', '.join(unknown)}")
+
+        results = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                key: options[key] for key in ("endpoints", "concurrency", "requests", "llm_latency", "seed")
+            },
+            "profiles": {},
+        }
+        for name in profiles:
+            results["profiles"][name] = self.bench_profile(name, options)
+
+        write_json(results, options.get("output"), self.stdout)
+
+    def bench_profile(self, name: str, options: dict) -> dict:
+        rng = random.Random(options["seed"])
+        embeddings = FakeEmbeddings(size=options["dim"])
+        chat_model = FakeChatModel(latency=options["llm_latency"])
+
+        with tempfile.TemporaryDirectory() as workdir, database_profile(name), \
+                isolated_pipeline(workdir, embeddings, chat_model, answer_cache=False, buffered_log=False):
+            user = User.objects.create_user("bench", password=None)
+            token = str(AccessToken.for_user(user))
+            uploads = os.path.join(workdir, "uploads")
+            os.makedirs(uploads)
+            vocabulary = [f"word{i}" for i in range(2000)]
+            questions = {}
+            for endpoint, information_type in (("public", File.PUBLIC), ("private", File.PRIVATE)):
+                filename = f"{endpoint}.txt"
+                questions[endpoint] = write_document(os.path.join(uploads, filename), 20, 1500, rng, vocabulary)
+                file_record = File.objects.create(filename=filename, user=user, information_type=information_type)
+                process_file(file_record, uploads)
+
+            result = {"database": describe(connection), "runs": []}
+            for endpoint in options["endpoints"].split(","):
+                for concurrency in [int(v) for v in options["concurrency"].split(",")]:
+                    run = drive_chat(
+                        endpoint,
+                        rng.choices(questions[endpoint], k=options["requests"]),
+                        concurrency,
+                        token if endpoint == "private" else None,
+                    )
+                    result["runs"].append(run)
+                    self.stderr.write(
+                        f"{name} {endpoint} x{concurrency}: {run['requests_per_s']:.1f} req/s, "
+                        f"p95 {run['latency_s']['p95'] * 1000:.0f} ms, {run['errors']} errors"
+                    )
+            result["conversations_written"] = Conversation.objects.count()
+            return result
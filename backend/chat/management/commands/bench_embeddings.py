@@ -0,0 +1,82 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.benchmarks import write_json
+from chat.utils.embedding_pipeline import EmbeddingPipeline
+from chat.utils.fakes import FakeEmbeddings
+
+
+def synthetic_chunks(count: int, words: int = 160) -> list:
+    """
+    Roughly 1000-character chunks with distinct content.
+    """
+    return [
+        " ".join(f"term{(i * 7919 + j) % 5000}" for j in range(words))
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure embedding throughput for a grid of batch sizes and concurrency "
+        "levels using the offline fake embedder (per-request latency and a "
+        "simulated rate limit)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunks", type=int, default=2000)
+        parser.add_argument("--batch-sizes", default="16,64,256")
+        parser.add_argument("--concurrency", default="1,4,8")
+        parser.add_argument("--latency", type=float, default=0.05, help="Fake seconds per request.")
+        parser.add_argument(
+            "--max-in-flight", type=int, default=6,
+            help="Concurrent requests the fake endpoint accepts before answering 429.",
+        )
+        parser.add_argument("--dim", type=int, default=256)
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        texts = synthetic_chunks(options["chunks"])
+        results = {
+            "chunks": len(texts),
+            "latency_s": options["latency"],
+            "max_in_flight": options["max_in_flight"],
+            "runs": [],
+        }
+
+        for batch_size in [int(v) for v in options["batch_sizes"].split(",")]:
+            for concurrency in [int(v) for v in options["concurrency"].split(",")]:
+                embeddings = FakeEmbeddings(
+                    size=options["dim"],
+                    latency=options["latency"],
+                    max_in_flight=options["max_in_flight"],
+                )
+                pipeline = EmbeddingPipeline(
+                    embeddings=embeddings,
+                    batch_size=batch_size,
+                    max_concurrency=concurrency,
+                    max_retries=20,
+                    backoff_base=options["latency"] or 0.01,
+                    use_cache=False,
+                )
+                started = time.perf_counter()
+                vectors = pipeline.embed(texts)
+                elapsed = time.perf_counter() - started
+                assert len(vectors) == len(texts)
+
+                run = {
+                    "batch_size": batch_size,
+                    "concurrency": concurrency,
+                    "seconds": elapsed,
+                    "chunks_per_s": len(texts) / elapsed,
+                    "requests": embeddings.requests,
+                    **pipeline.stats,
+                }
+                results["runs"].append(run)
+                self.stderr.write(
+                    f"batch={batch_size:>4} concurrency={concurrency:>2}: "
+                    f"{run['chunks_per_s']:.0f} chunks/s, {run['retries']} retries"
+                )
+
+        write_json(results, options.get("output"), self.stdout)
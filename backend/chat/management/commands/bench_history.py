@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import json
+import random
+import tempfile
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from chat.benchmarks import percentiles, write_json
+from chat.models import Conversation
+from chat.views import PrivateChatHistoryView
+
+HISTORY_INDEX = Conversation._meta.indexes[0]
+INSERT_BATCH = 20_000
+
+
+@contextmanager
+def history_database(workdir: str):
+    """
+    A throwaway test database under `workdir` (a file for SQLite, so page
+    cache effects look like production), destroyed afterwards.
+    """
+    test_db_settings = connection.settings_dict.setdefault("TEST", {})
+    test_db_name = test_db_settings.get("NAME")
+    if connection.vendor == "sqlite":
+        test_db_settings["NAME"] = os.path.join(workdir, "history.sqlite3")
+    old_db_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_db_name, verbosity=0)
+        test_db_settings["NAME"] = test_db_name
+
+
+def fill(rows: int, users: list, heavy_share: float, rng: random.Random, progress):
+    """
+    Insert `rows` synthetic conversations: `heavy_share` of them belong to
+    the first user (the one the benchmark pages through), the rest are
+    spread over everyone. About one in five is public.
+    """
+    answers = [" ".join(rng.choices(["lorem", "ipsum", "dolor", "sit", "amet", "elit"], k=60)) for _ in range(64)]
+    sources = [json.dumps([{"source": f"doc{i}.pdf", "page": i, "tokens": 120}] * 3) for i in range(64)]
+    table = Conversation._meta.db_table
+    sql = (
+        f"INSERT INTO {table} (user_id, conversation_type, query, answer, sources) "
+        f"VALUES (%s, %s, %s, %s, %s)"
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, rows, INSERT_BATCH):
+            batch = []
+            for i in range(start, min(rows, start + INSERT_BATCH)):
+                user = users[0] if rng.random() < heavy_share else rng.choice(users)
+                kind = Conversation.PUBLIC if rng.random() < 0.2 else Conversation.PRIVATE
+                batch.append((user, kind, f"question {i}", rng.choice(answers), rng.choice(sources)))
+            cursor.executemany(sql, batch)
+            progress(f"inserted {start + len(batch)}/{rows} rows")
+
+
+def keyset_page(user_id: int, before_id, page_size: int, fields):
+    """
+    One page as CursorPagination queries it: an id range, newest first.
+    """
+    queryset = Conversation.objects.filter(user_id=user_id, conversation_type=Conversation.PRIVATE)
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    if fields:
+        queryset = queryset.only(*fields)
+    return list(queryset.order_by("-id")[:page_size + 1])
+
+
+def offset_page(user_id: int, page: int, page_size: int, fields):
+    """
+    The same page by LIMIT/OFFSET, which reads and skips every earlier row.
+    """
+    queryset = Conversation.objects.filter(user_id=user_id, conversation_type=Conversation.PRIVATE)
+    if fields:
+        queryset = queryset.only(*fields)
+    return list(queryset.order_by("-id")[page * page_size:(page + 1) * page_size])
+
+
+def timed(call, repeat: int) -> list:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def ms(latencies: list) -> dict:
+    return {key: value * 1000 for key, value in percentiles(latencies).items()}
+
+
+def query_plan(user_id: int, page_size: int) -> str:
+    queryset = (
+        Conversation.objects
+        .filter(user_id=user_id, conversation_type=Conversation.PRIVATE, id__lt=sys.maxsize)
+        .order_by("-id")[:page_size]
+    )
+    return queryset.explain()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure private chat history reads over a large synthetic Conversation "
+        "table: the latest page, deep keyset (cursor) pages versus OFFSET pages, "
+        "full rows versus `fields=id,query`, with and without the "
+        "(user, conversation_type, id) index, plus pages walked through the API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--heavy-share", type=float, default=0.05,
+                            help="Share of all rows belonging to the paged-through user.")
+        parser.add_argument("--page-size", type=int, default=10)
+        parser.add_argument("--samples", type=int, default=100, help="Pages timed per mode.")
+        parser.add_argument("--api-pages", type=int, default=50, help="Pages walked through the API.")
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def progress(self, message: str):
+        self.stderr.write(message)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        page_size = options["page_size"]
+        samples = options["samples"]
+        results = {
+            "rows": options["rows"],
+            "users": options["users"],
+            "page_size": page_size,
+            "vendor": connection.vendor,
+        }
+
+        with tempfile.TemporaryDirectory() as workdir, history_database(workdir):
+            User.objects.bulk_create(User(username=f"history{i}") for i in range(options["users"]))
+            users = list(User.objects.order_by("id").values_list("id", flat=True))
+            user_id = users[0]
+
+            with connection.schema_editor() as editor:
+                # Load without the index, then build it once
+                editor.remove_index(Conversation, HISTORY_INDEX)
+            if connection.vendor == "sqlite":
+                with connection.cursor() as cursor:
+                    # A throwaway database: don't wait for the disk while loading
+                    cursor.execute("PRAGMA synchronous = OFF")
+            started = time.perf_counter()
+            with transaction.atomic():
+                fill(options["rows"], users, options["heavy_share"], rng, self.progress)
+            results["fill_seconds"] = time.perf_counter() - started
+
+            ids = list(
+                Conversation.objects
+                .filter(user_id=user_id, conversation_type=Conversation.PRIVATE)
+                .order_by("-id").values_list("id", flat=True)
+            )
+            pages = max(1, len(ids) // page_size)
+            results["user_rows"] = len(ids)
+            results["user_pages"] = pages
+            deep = [rng.randrange(pages) for _ in range(samples)]
+            # The cursor of page p is the last id of page p - 1
+            before_ids = [ids[page * page_size - 1] if page else None for page in deep]
+
+            def measure(label: str):
+                run = {}
+                for name, fields in (("full", None), ("id_query", ["id", "query"])):
+                    run[f"latest_{name}_ms"] = ms(timed(lambda: keyset_page(user_id, None, page_size, fields), samples))
+                    cursors = iter(before_ids)
+                    run[f"keyset_deep_{name}_ms"] = ms(timed(
+                        lambda: keyset_page(user_id, next(cursors), page_size, fields), samples,
+                    ))
+                    offsets = iter(deep)
+                    run[f"offset_deep_{name}_ms"] = ms(timed(
+                        lambda: offset_page(user_id, next(offsets), page_size, fields), samples,
+                    ))
+                run["plan"] = query_plan(user_id, page_size)
+                results[label] = run
+                self.progress(f"{label}: " + ", ".join(
+                    f"{key} p50 {value['p50']:.2f}" for key, value in run.items() if key.endswith("_ms")
+                ))
+
+            measure("without_index")
+            started = time.perf_counter()
+            with connection.schema_editor() as editor:
+                editor.add_index(Conversation, HISTORY_INDEX)
+            results["index_build_seconds"] = time.perf_counter() - started
+            if connection.vendor == "sqlite":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+            measure("with_index")
+
+            # End to end: the view, serializer and cursor links, page after page
+            user = User.objects.get(pk=user_id)
+            factory = APIRequestFactory()
+            view = PrivateChatHistoryView.as_view()
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                for name, query in (("full", ""), ("id_query", "&fields=id,query")):
+                    url = f"/api/chat/chat/private/history/?page_size={page_size}{query}"
+                    latencies = []
+                    for _ in range(options["api_pages"]):
+                        request = factory.get(url)
+                        force_authenticate(request, user=user)
+                        started = time.perf_counter()
+                        response = view(request)
+                        response.render()
+                        latencies.append(time.perf_counter() - started)
+                        url = response.data["next"]
+                        if not url:
+                            break
+                    results[f"api_walk_{name}_ms"] = ms(latencies)
+                    results[f"api_{name}_bytes_per_page"] = len(response.content)
+
+        write_json(results, options.get("output"), self.stdout)
@@ -0,0 +1,134 @@
+import time
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from chat.benchmarks import percentiles, write_json
+from chat.utils import metrics, tracing, vector_stores
+from chat.utils.bm25 import SparseIndex
+from chat.utils.fakes import FakeEmbeddings
+from chat.utils.retrieval import HybridRetriever
+from chat.utils.vector_backends import build_backend
+
+
+def synthetic_corpus(docs: int, seed: int = 0):
+    """
+    Chunks of common vocabulary; every fifth one also mentions a product
+    code. Returns (ids, texts, queries) where each query is
+    (kind, text, relevant id): "code" queries ask for a code verbatim,
+    "topic" queries reuse a handful of the chunk's words.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(3000)]
+    ids, texts, queries = [], [], []
+    for i in range(docs):
+        words = rng.choices(vocabulary, k=80)
+        id_ = f"doc-{i}"
+        if i % 5 == 0:
+            code = f"SKU-{rng.randrange(10 ** 6):06d}"
+            words.insert(rng.randrange(len(words)), code)
+            queries.append(("code", f"Which manual covers part {code}?", id_))
+        else:
+            queries.append(("topic", " ".join(rng.sample(words, 8)), id_))
+        ids.append(id_)
+        texts.append(" ".join(words))
+    return ids, texts, queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline recall@k and latency of dense-only, BM25-only and hybrid (RRF) "
+        "retrieval on a synthetic corpus with exact-code and topical queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--docs", type=int, default=5000)
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--k", type=int, default=3)
+        parser.add_argument("--fetch-k", type=int, default=20)
+        parser.add_argument(
+            "--candidates", default="3,12",
+            help="Comma-separated candidate counts to rerank down to k (<= k skips the rerank).",
+        )
+        parser.add_argument("--mmr-lambda", type=float, default=0.7)
+        parser.add_argument(
+            "--weights", default="1:0,0:1,1:1,1:0.5,0.5:1",
+            help="Comma-separated dense:sparse weight pairs to evaluate.",
+        )
+        parser.add_argument("--dim", type=int, default=256)
+        parser.add_argument("--backend", default="chroma", help="Vector backend: chroma or numpy.")
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        embeddings = FakeEmbeddings(size=options["dim"])
+        ids, texts, queries = synthetic_corpus(options["docs"])
+        queries = random.Random(1).sample(queries, min(options["queries"], len(queries)))
+        results = {"backend": options["backend"], "docs": len(ids), "queries": len(queries), "k": options["k"], "runs": []}
+
+        with tempfile.TemporaryDirectory() as workdir:
+            store = build_backend(options["backend"], vector_stores.COLLECTION_NAME, workdir, embeddings)
+            for _ in vector_stores.upsert_vectors(
+                store, ids, embeddings.embed_documents(texts), texts, [{"source": "synthetic"} for _ in ids]
+            ):
+                pass
+
+            started = time.perf_counter()
+            index = SparseIndex(f"{workdir}/bm25")
+            index.add(ids, texts)
+            index.flush()
+            results["index_build_s"] = time.perf_counter() - started
+            started = time.perf_counter()
+            reopened = SparseIndex(index.path)
+            reopened.search("warm", 1)
+            results["index_open_s"] = time.perf_counter() - started
+            results["index"] = reopened.stats()
+
+            grid = [
+                (pair, int(candidates))
+                for pair in options["weights"].split(",")
+                for candidates in options["candidates"].split(",")
+            ]
+            for pair, candidates in grid:
+                dense_weight, sparse_weight = (float(v) for v in pair.split(":"))
+                retriever = HybridRetriever(
+                    vectorstore=store,
+                    sparse_index=reopened,
+                    search_kwargs={"k": options["k"]},
+                    fetch_k=max(options["fetch_k"], candidates),
+                    candidates=candidates,
+                    mmr_lambda=options["mmr_lambda"],
+                    dense_weight=dense_weight,
+                    sparse_weight=sparse_weight,
+                )
+                metrics.reset()
+                hits = {"code": [], "topic": []}
+                latencies = []
+                for kind, query, relevant in queries:
+                    started = time.perf_counter()
+                    docs = retriever.search(query)
+                    latencies.append(time.perf_counter() - started)
+                    hits[kind].append(relevant in {doc.id for doc in docs})
+
+                run = {
+                    "dense_weight": dense_weight,
+                    "sparse_weight": sparse_weight,
+                    "candidates": candidates,
+                    "recall": sum(hits["code"] + hits["topic"]) / len(queries),
+                    **{f"recall_{kind}": sum(v) / len(v) for kind, v in hits.items() if v},
+                    **{f"latency_{key}_ms": value * 1000 for key, value in percentiles(latencies).items()},
+                    "step_p50_ms": {
+                        series["labels"]["stage"].split(".", 1)[1]: series["p50"] * 1000
+                        for series in metrics.snapshot()
+                        if series["name"] == tracing.STAGE_METRIC and series["labels"]["stage"].startswith("retrieval.")
+                    },
+                }
+                results["runs"].append(run)
+                self.stderr.write(
+                    f"dense={dense_weight:<4g} sparse={sparse_weight:<4g} candidates={candidates:<3}: recall@{options['k']} "
+                    f"{run['recall']:.3f} (code {run.get('recall_code', 0):.3f}, "
+                    f"topic {run.get('recall_topic', 0):.3f}), p50 {run['latency_p50_ms']:.2f} ms, "
+                    f"p95 {run['latency_p95_ms']:.2f} ms"
+                )
+
+        write_json(results, options.get("output"), self.stdout)
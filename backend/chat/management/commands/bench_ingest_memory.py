@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import random
+import tempfile
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.benchmarks import write_json
+
+
+# Runs in a fresh interpreter per measurement so peak RSS is not polluted
+# by earlier runs.
+WORKER_SCRIPT = r"""
+import os, sys, json, time
+import django
+django.setup()
+
+from chat.benchmarks import current_rss_mb, peak_rss_mb
+from chat.models import File
+from chat.utils import vector_stores
+from chat.utils.process_file import process_file
+
+path, store_dir = sys.argv[1], sys.argv[2]
+vector_stores.STORE_PATHS[vector_stores.PUBLIC] = store_dir
+vector_stores.get_public_store()  # exclude client setup from the measurement
+
+baseline = current_rss_mb()
+started = time.perf_counter()
+status = process_file(
+    File(filename=os.path.basename(path), information_type=File.PUBLIC),
+    os.path.dirname(path),
+)
+print(json.dumps({
+    "status": status,
+    "seconds": time.perf_counter() - started,
+    "baseline_rss_mb": baseline,
+    "peak_rss_mb": peak_rss_mb(),
+}))
+"""
+
+# Settings that make the streaming pipeline hold the whole file at once,
+# i.e. the previous load() -> split_documents() -> add_documents() behaviour.
+MATERIALIZE_ENV = {
+    "INGEST_WINDOW_PAGES": str(10 ** 9),
+    "INGEST_MAX_CHUNKS_IN_MEMORY": str(10 ** 9),
+    "INGEST_TEXT_SEGMENT_CHARS": str(10 ** 12),
+}
+
+
+def write_synthetic_text(path: str, size_mb: float, seed: int = 0):
+    """
+    Write paragraphs of pseudo-random words until the file reaches `size_mb`.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(20000)]
+    target = int(size_mb * 1024 * 1024)
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            paragraph = " ".join(rng.choices(vocabulary, k=120)) + "\n\n"
+            f.write(paragraph)
+            written += len(paragraph)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report peak RSS against file size for streaming ingestion versus "
+        "loading the whole document first (offline, fake embeddings)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1,10,50", help="Comma-separated file sizes in MB.")
+        parser.add_argument("--modes", default="streaming,materialized")
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        results = {"runs": []}
+        with tempfile.TemporaryDirectory() as workdir:
+            for size_mb in [float(v) for v in options["sizes"].split(",")]:
+                path = os.path.join(workdir, f"synthetic_{size_mb:g}mb.txt")
+                write_synthetic_text(path, size_mb)
+
+                for mode in options["modes"].split(","):
+                    env = os.environ.copy()
+                    env.update({
+                        "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings"),
+                        "EMBEDDINGS_BACKEND": "fake",
+                        "FAKE_EMBEDDING_DIM": "256",
+                        "EMBEDDING_CACHE_ENABLED": "False",
+                        "RAG_STATE_DIR": os.path.join(workdir, "state"),
+                    })
+                    if mode == "materialized":
+                        env.update(MATERIALIZE_ENV)
+
+                    store_dir = os.path.join(workdir, f"chroma_{mode}_{size_mb:g}")
+                    proc = subprocess.run(
+                        [sys.executable, "-c", WORKER_SCRIPT, path, store_dir],
+                        cwd=settings.BASE_DIR,
+                        env=env,
+                        capture_output=True,
+                        text=True,
+                    )
+                    if proc.returncode != 0:
+                        self.stderr.write(proc.stderr)
+                        raise SystemExit(f"Benchmark worker failed for {mode} / {size_mb} MB")
+
+                    run = {
+                        "mode": mode,
+                        "file_mb": os.path.getsize(path) / (1024 * 1024),
+                        **json.loads(proc.stdout.strip().splitlines()[-1]),
+                    }
+                    results["runs"].append(run)
+                    self.stderr.write(
+                        f"{mode:>12} {run['file_mb']:7.1f} MB: peak RSS {run['peak_rss_mb']:.0f} MB "
+                        f"(baseline {run['baseline_rss_mb']:.0f} MB), {run['seconds']:.1f}s"
+                    )
+
+        write_json(results, options.get("output"), self.stdout)
@@ -0,0 +1,153 @@
+import os
+import time
+import random
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.benchmarks import write_json
+from chat.utils.parse_pool import init_worker, ordered_results, parse_tasks
+from chat.utils.process_file import iter_split_windows
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int, rng: random.Random, vocabulary: list):
+    """
+    Write a plain text-only PDF (Helvetica, one content stream per page)
+    without any PDF library.
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choices(vocabulary, k=12)) for _ in range(lines_per_page)]
+        text = " Tj T* ".join(f"({line})" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 36 806 Td {text} Tj ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids),
+    )
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure PDF parse + split throughput of one large synthetic PDF in "
+        "this process versus the process pool at several worker counts, as JSON "
+        "(speedup relative to the in-process parse)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=400)
+        parser.add_argument("--lines-per-page", type=int, default=60)
+        parser.add_argument("--workers", default="1,2,4,8")
+        parser.add_argument("--pages-per-task", type=int, default=8)
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration; the fastest is kept.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        vocabulary = [f"word{i}" for i in range(5000)]
+        results = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {
+                key: options[key] for key in ("pages", "lines_per_page", "pages_per_task", "repeat", "seed")
+            },
+            "runs": [],
+        }
+
+        with tempfile.TemporaryDirectory() as workdir, \
+                override_settings(INGEST_PDF_PAGES_PER_TASK=options["pages_per_task"]):
+            path = os.path.join(workdir, "large.pdf")
+            write_pdf(path, options["pages"], options["lines_per_page"], rng, vocabulary)
+            results["config"]["pdf_bytes"] = os.path.getsize(path)
+
+            baseline = self.best_of(options["repeat"], lambda: self.parse_inline(path))
+            results["inline"] = baseline
+            self.report("inline", baseline)
+
+            for workers in [int(v) for v in options["workers"].split(",")]:
+                started = time.perf_counter()
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                ) as pool:
+                    # Start every worker before timing, as a long-lived pool would be
+                    list(pool.map(abs, range(workers)))
+                    startup = time.perf_counter() - started
+                    run = self.best_of(options["repeat"], lambda: self.parse_pooled(path, pool, workers))
+                if run["chunks"] != baseline["chunks"]:
+                    raise SystemExit(f"{workers} workers produced {run['chunks']} chunks, expected {baseline['chunks']}")
+                run.update(
+                    workers=workers,
+                    pool_startup_s=startup,
+                    speedup=baseline["seconds"] / run["seconds"],
+                )
+                results["runs"].append(run)
+                self.report(f"workers={workers}", run)
+
+        write_json(results, options.get("output"), self.stdout)
+
+    @staticmethod
+    def best_of(repeat: int, run) -> dict:
+        return min((run() for _ in range(max(1, repeat))), key=lambda result: result["seconds"])
+
+    @staticmethod
+    def parse_inline(path: str) -> dict:
+        started = time.perf_counter()
+        pages = chunks = 0
+        for window_pages, window_chunks in iter_split_windows(path, {}):
+            pages += window_pages
+            chunks += len(window_chunks)
+        return Command.result(pages, chunks, time.perf_counter() - started)
+
+    @staticmethod
+    def parse_pooled(path: str, pool, workers: int) -> dict:
+        started = time.perf_counter()
+        pages = chunks = 0
+        for task_pages, task_chunks in ordered_results(pool, parse_tasks(path, {}), 2 * workers):
+            pages += task_pages
+            chunks += len(task_chunks)
+        return Command.result(pages, chunks, time.perf_counter() - started)
+
+    @staticmethod
+    def result(pages: int, chunks: int, elapsed: float) -> dict:
+        return {
+            "pages": pages,
+            "chunks": chunks,
+            "seconds": elapsed,
+            "pages_per_s": pages / elapsed if elapsed else 0.0,
+        }
+
+    def report(self, label: str, run: dict):
+        speedup = f", {run['speedup']:.2f}x" if "speedup" in run else ""
+        self.stderr.write(
+            f"{label}: {run['pages']} pages / {run['chunks']} chunks in {run['seconds']:.2f}s "
+            f"({run['pages_per_s']:.1f} pages/s{speedup})"
+        )
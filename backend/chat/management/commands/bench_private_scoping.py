@@ -0,0 +1,98 @@
+import time
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from chat.benchmarks import percentiles, write_json
+from chat.management.commands.bench_embeddings import synthetic_chunks
+from chat.utils import vector_stores
+from chat.utils.fakes import FakeEmbeddings
+from chat.utils.vector_backends import ChromaBackend
+
+
+def open_store(client, collection_name: str, embeddings):
+    return ChromaBackend(collection_name, embeddings, client=client)
+
+
+def fill(store, embeddings, user: int, texts: list):
+    for _ in vector_stores.upsert_vectors(
+        store,
+        ids=[f"u{user}-{i}" for i in range(len(texts))],
+        vectors=embeddings.embed_documents(texts),
+        texts=texts,
+        metadatas=[{"source": f"user{user}.txt", "owner_id": user} for _ in texts],
+    ):
+        pass
+
+
+def time_queries(search, queries, owner_ids) -> list:
+    latencies = []
+    for query, owner_id in zip(queries, owner_ids):
+        started = time.perf_counter()
+        search(query, owner_id)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure private query latency as the number of users grows: one shared "
+        "collection searched unscoped or with an owner_id filter, versus one "
+        "collection per owner (offline, fake embeddings)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", default="1,10,100")
+        parser.add_argument("--chunks-per-user", type=int, default=200)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=3)
+        parser.add_argument("--dim", type=int, default=256)
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        import chromadb
+
+        embeddings = FakeEmbeddings(size=options["dim"])
+        k = options["k"]
+        per_user = options["chunks_per_user"]
+        rng = random.Random(0)
+        results = {"chunks_per_user": per_user, "k": k, "runs": []}
+
+        for users in [int(v) for v in options["users"].split(",")]:
+            with tempfile.TemporaryDirectory() as path:
+                client = chromadb.PersistentClient(path=path)
+                shared = open_store(client, vector_stores.COLLECTION_NAME, embeddings)
+                owned = {}
+                texts = synthetic_chunks(users * per_user, words=60)
+                for user in range(users):
+                    batch = texts[user * per_user:(user + 1) * per_user]
+                    fill(shared, embeddings, user, batch)
+                    owned[user] = open_store(client, vector_stores.private_collection_name(user), embeddings)
+                    fill(owned[user], embeddings, user, batch)
+
+                modes = {
+                    "shared_unscoped": lambda q, owner: shared.query(embeddings.embed_query(q), k),
+                    "shared_owner_filter": lambda q, owner: shared.query(
+                        embeddings.embed_query(q), k, where={"owner_id": owner}
+                    ),
+                    "per_owner_collection": lambda q, owner: owned[owner].query(embeddings.embed_query(q), k),
+                }
+                queries = [f"term{rng.randrange(5000)} term{rng.randrange(5000)}" for _ in range(options["queries"])]
+                owner_ids = [rng.randrange(users) for _ in queries]
+
+                for mode, search in modes.items():
+                    time_queries(search, queries[:10], owner_ids[:10])  # warm up
+                    latencies = time_queries(search, queries, owner_ids)
+                    run = {
+                        "users": users,
+                        "total_chunks": users * per_user,
+                        "mode": mode,
+                        **{f"{key}_ms": value * 1000 for key, value in percentiles(latencies).items()},
+                    }
+                    results["runs"].append(run)
+                    self.stderr.write(
+                        f"users={users:>4} {mode:>20}: p50 {run['p50_ms']:.2f} ms, p95 {run['p95_ms']:.2f} ms"
+                    )
+
+        write_json(results, options.get("output"), self.stdout)
@@ -0,0 +1,109 @@
+import time
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from chat.benchmarks import percentiles, write_json
+from chat.management.commands.bench_vector_backends import clustered_corpus, directory_mb, exact_neighbours, recall
+from chat.utils import vector_stores
+from chat.utils.numpy_index import NumpyIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Recall versus memory of the numpy index's vector formats on a synthetic "
+        "corpus: Matryoshka truncation, int8 and binary quantization, with and "
+        "without the full-precision rescoring pass. Reports bytes per vector "
+        "searched and stored, disk size, query latency and recall@k against "
+        "exact search on the full vectors, as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vectors", type=int, default=20_000)
+        parser.add_argument("--dim", type=int, default=3072)
+        parser.add_argument("--clusters", type=int, default=500)
+        parser.add_argument("--decay", type=float, default=0.5,
+                            help="Per-dimension scale (1 + i) ** -decay, imitating Matryoshka embeddings.")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--dims", default="0,256,512,1024", help="Truncated dimensions to try (0 = all).")
+        parser.add_argument("--quantizations", default="none,int8,binary")
+        parser.add_argument("--rescore", default="0,4,10", help="Rescoring multipliers to try (0 = none).")
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        dim = options["dim"]
+        corpus, queries = clustered_corpus(
+            options["vectors"], dim, options["clusters"], options["queries"], decay=options["decay"],
+        )
+        ids = [f"v{i}" for i in range(len(corpus))]
+        truth = exact_neighbours(corpus, queries, k)
+        results = {
+            "vectors": len(corpus),
+            "dim": dim,
+            "decay": options["decay"],
+            "queries": len(queries),
+            "k": k,
+            "runs": [],
+        }
+
+        rescores = [int(v) for v in options["rescore"].split(",")]
+        for dims in [int(v) for v in options["dims"].split(",")]:
+            if dims >= dim:
+                continue
+            for quantization in options["quantizations"].split(","):
+                identity = not dims and quantization == "none"
+                # Rescoring needs the full vectors kept: one index with them, one without
+                for keep in sorted({bool(r) for r in rescores} if not identity else {False}):
+                    with tempfile.TemporaryDirectory() as workdir:
+                        index = NumpyIndex(
+                            workdir, ivf_min_vectors=len(corpus) + 1,
+                            dims=dims, quantization=quantization, rescore=int(keep),
+                        )
+                        started = time.perf_counter()
+                        for _ in vector_stores.upsert_vectors(
+                            index, ids, corpus, [""] * len(ids), [{}] * len(ids)
+                        ):
+                            pass
+                        build_seconds = time.perf_counter() - started
+                        disk_mb = directory_mb(workdir)
+                        for rescore in [r for r in rescores if bool(r) == keep] if not identity else [0]:
+                            index.rescore = rescore
+                            run = {
+                                "dims": dims or dim,
+                                "quantization": quantization,
+                                "rescore": rescore,
+                                "search_bytes_per_vector": dim * 4 if identity else index.codec.row_bytes(dim),
+                                "stored_bytes_per_vector": (
+                                    (dim * 4 if index.keep_vectors else 0)
+                                    + (0 if identity else index.codec.row_bytes(dim))
+                                ),
+                                "disk_mb": disk_mb,
+                                "build_s": build_seconds,
+                                **self.measure(index, queries, k, truth),
+                            }
+                            results["runs"].append(run)
+                            self.stderr.write(
+                                f"dims={run['dims']:>5} {quantization:>6} rescore={rescore:>2}: "
+                                f"{run['search_bytes_per_vector']:>6} B searched, "
+                                f"{run['stored_bytes_per_vector']:>6} B stored per vector, "
+                                f"recall@{k} {run['recall']:.3f}, p50 {run['latency_ms']['p50']:.2f} ms"
+                            )
+
+        write_json(results, options.get("output"), self.stdout)
+
+    @staticmethod
+    def measure(index, queries, k: int, truth: list) -> dict:
+        index.query(queries[0], k)  # warm up
+        latencies = []
+        found = []
+        for query in queries:
+            started = time.perf_counter()
+            records = index.query(query, k)
+            latencies.append(time.perf_counter() - started)
+            found.append([int(record.id[1:]) for record in records])
+        return {
+            "latency_ms": {key: value * 1000 for key, value in percentiles(latencies).items()},
+            "recall": recall(found, truth),
+        }
@@ -0,0 +1,300 @@
+import os
+import time
+import random
+import platform
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.benchmarks import percentiles, summarize, write_json
+from chat.models import File
+from chat.utils import metrics, tracing, vector_stores
+from chat.utils.conversation_log import get_conversation_log
+from chat.utils.fakes import FakeChatModel, FakeEmbeddings
+from chat.utils.private_chat import ask as private_ask
+from chat.utils.process_file import process_file
+from chat.utils.progress import RecordingProgress
+from chat.utils.public_chat import public_ask
+
+ENDPOINTS = {
+    "public": "/api/chat/chat/public/",
+    "private": "/api/chat/chat/private/",
+}
+
+
+def write_document(path: str, pages: int, page_chars: int, rng: random.Random, vocabulary: list) -> list:
+    """
+    Write `pages` paragraphs of about `page_chars` characters each. Returns
+    one eight-word run per page to use as a query against this document.
+    """
+    queries = []
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(pages):
+            words = []
+            size = 0
+            while size < page_chars:
+                word = rng.choice(vocabulary)
+                words.append(word)
+                size += len(word) + 1
+            start = rng.randrange(max(1, len(words) - 8))
+            queries.append(" ".join(words[start:start + 8]))
+            f.write(" ".join(words) + "\n")
+    return queries
+
+
+@contextmanager
+def isolated_pipeline(workdir: str, embeddings, chat_model, answer_cache: bool, buffered_log: bool = True):
+    """
+    Point the RAG pipeline at empty Chroma stores, indexes and a test
+    database under `workdir`, with the given fake backends, and restore
+    everything afterwards.
+    """
+    store_paths = dict(vector_stores.STORE_PATHS)
+    state_dir = os.path.join(workdir, "state")
+    overrides = override_settings(
+        RAG_STATE_DIR=state_dir,
+        BM25_INDEX_DIR=os.path.join(state_dir, "bm25"),
+        ANSWER_CACHE_GENERATION_PATH=os.path.join(state_dir, "public_store.generation"),
+        CONVERSATION_LOG_BUFFERED=buffered_log,
+        CONVERSATION_LOG_SPOOL_DIR=os.path.join(state_dir, "conversation_log"),
+        ANSWER_CACHE_ENABLED=answer_cache,
+        EMBEDDING_CACHE_ENABLED=False,
+        TRACING_ENABLED=True,
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+    )
+    test_db_settings = connection.settings_dict.setdefault("TEST", {})
+    test_db_name = test_db_settings.get("NAME")
+    if connection.vendor == "sqlite":
+        # A file rather than shared-cache memory, so concurrent writers lock
+        # like they would in production
+        test_db_settings["NAME"] = os.path.join(workdir, "bench.sqlite3")
+
+    os.makedirs(state_dir)
+    vector_stores.STORE_PATHS[vector_stores.PUBLIC] = os.path.join(workdir, "public_chroma_db")
+    vector_stores.STORE_PATHS[vector_stores.PRIVATE] = os.path.join(workdir, "private_chroma_db")
+    vector_stores.reset()
+    vector_stores.get_or_create("embeddings", lambda: embeddings)
+    vector_stores.get_or_create("chat_model", lambda: chat_model)
+    metrics.reset()
+    old_db_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with overrides:
+            try:
+                yield
+            finally:
+                # Write buffered turns before the test database goes away
+                get_conversation_log().close()
+    finally:
+        connection.creation.destroy_test_db(old_db_name, verbosity=0)
+        test_db_settings["NAME"] = test_db_name
+        vector_stores.STORE_PATHS.update(store_paths)
+        vector_stores.reset()
+
+
+def stage_p50_ms(prefix: str) -> dict:
+    """
+    {stage: p50 ms} for the traced stages starting with `prefix`.
+    """
+    return {
+        "/".join(filter(None, [series["labels"].get("endpoint"), series["labels"]["stage"]])): series["p50"] * 1000
+        for series in metrics.snapshot()
+        if series["name"] == tracing.STAGE_METRIC and series["labels"]["stage"].startswith(prefix)
+    }
+
+
+def drive_chat(endpoint: str, questions: list, concurrency: int, token: str = None) -> dict:
+    """
+    `concurrency` threads POST questions back to back through the full
+    Django stack (middleware, DRF view, Conversation write) until all are sent.
+    """
+    remaining = iter(questions)
+    lock = threading.Lock()
+    latencies = []
+    errors = 0
+
+    def client():
+        nonlocal errors
+        session = Client(raise_request_exception=False)
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        try:
+            while True:
+                with lock:
+                    question = next(remaining, None)
+                if question is None:
+                    return
+                started = time.perf_counter()
+                response = session.post(ENDPOINTS[endpoint], {"message": question}, content_type="application/json", **headers)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if response.status_code == 200:
+                        latencies.append(elapsed)
+                    else:
+                        errors += 1
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(client) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(questions),
+        "errors": errors,
+        "seconds": elapsed,
+        "requests_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_s": {**summarize(latencies), **percentiles(latencies)},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline end-to-end benchmark of the RAG pipeline on temporary Chroma "
+        "stores with fake embeddings and a fake LLM: ingestion throughput, "
+        "query latency percentiles and concurrent chat throughput, as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--docs", type=int, default=20, help="Documents to ingest (every fourth is private).")
+        parser.add_argument("--pages", type=int, default=20, help="Pages per document.")
+        parser.add_argument("--page-chars", type=int, default=3000)
+        parser.add_argument("--queries", type=int, default=200, help="Sequential queries per endpoint.")
+        parser.add_argument("--concurrency", default="1,8,32")
+        parser.add_argument("--requests", type=int, default=200, help="Chat requests per concurrency level.")
+        parser.add_argument("--dim", type=int, default=256)
+        parser.add_argument("--embedding-latency", type=float, default=0.0, help="Fake seconds per embedding request.")
+        parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake seconds per LLM call.")
+        parser.add_argument("--answer-cache", action="store_true", help="Keep the public answer cache on.")
+        parser.add_argument("--unbuffered-log", action="store_true",
+                            help="Write each chat turn inline instead of through the write-behind buffer.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        embeddings = FakeEmbeddings(size=options["dim"], latency=options["embedding_latency"])
+        chat_model = FakeChatModel(latency=options["llm_latency"])
+        results = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                key: options[key] for key in (
+                    "docs", "pages", "page_chars", "queries", "requests", "dim",
+                    "embedding_latency", "llm_latency", "answer_cache", "unbuffered_log", "seed",
+                )
+            },
+        }
+
+        with tempfile.TemporaryDirectory() as workdir, \
+                isolated_pipeline(
+                    workdir, embeddings, chat_model, options["answer_cache"], not options["unbuffered_log"],
+                ), \
+                override_settings(INGEST_TEXT_SEGMENT_CHARS=options["page_chars"]):
+            user = User.objects.create_user("bench", password=None)
+            questions = {"public": [], "private": []}
+            files = []
+            uploads = os.path.join(workdir, "uploads")
+            os.makedirs(uploads)
+            vocabulary = [f"word{i}" for i in range(5000)]
+            for i in range(options["docs"]):
+                information_type = File.PRIVATE if i % 4 == 3 else File.PUBLIC
+                filename = f"doc_{i}.txt"
+                questions[information_type.lower()] += write_document(
+                    os.path.join(uploads, filename), options["pages"], options["page_chars"], rng, vocabulary,
+                )
+                files.append(File.objects.create(filename=filename, user=user, information_type=information_type))
+
+            results["ingest"] = self.bench_ingest(files, uploads)
+            results["query"] = self.bench_queries(questions, user, options["queries"], rng)
+            results["chat"] = self.bench_chat(questions, user, options, rng)
+
+        write_json(results, options.get("output"), self.stdout)
+
+    def bench_ingest(self, files, uploads) -> dict:
+        metrics.reset()
+        pages = chunks = 0
+        started = time.perf_counter()
+        for file_record in files:
+            progress = RecordingProgress()
+            status = process_file(file_record, uploads, progress)
+            if status != "Processed":
+                raise SystemExit(f"Ingestion failed for {file_record.filename}: {progress.error}")
+            pages += progress.stages["load"]["done"]
+            chunks += progress.stages["split"]["done"]
+        elapsed = time.perf_counter() - started
+
+        result = {
+            "files": len(files),
+            "pages": pages,
+            "chunks": chunks,
+            "seconds": elapsed,
+            "pages_per_s": pages / elapsed,
+            "chunks_per_s": chunks / elapsed,
+            "stage_p50_ms": stage_p50_ms("ingest."),
+        }
+        self.stderr.write(
+            f"ingest: {pages} pages / {chunks} chunks in {elapsed:.2f}s "
+            f"({result['pages_per_s']:.1f} pages/s, {result['chunks_per_s']:.1f} chunks/s)"
+        )
+        return result
+
+    def bench_queries(self, questions: dict, user, count: int, rng: random.Random) -> dict:
+        ask = {
+            "public": public_ask,
+            "private": lambda question: private_ask(question, user.id),
+        }
+        result = {}
+        for endpoint, pool in questions.items():
+            if not pool:
+                continue
+            metrics.reset()
+            latencies = []
+            for question in rng.choices(pool, k=count):
+                started = time.perf_counter()
+                ask[endpoint](question)
+                latencies.append(time.perf_counter() - started)
+            result[endpoint] = {
+                "queries": count,
+                "latency_ms": {key: value * 1000 for key, value in percentiles(latencies).items()},
+                "stage_p50_ms": stage_p50_ms(""),
+            }
+            self.stderr.write(
+                f"query {endpoint}: p50 {result[endpoint]['latency_ms']['p50']:.1f} ms, "
+                f"p95 {result[endpoint]['latency_ms']['p95']:.1f} ms, "
+                f"p99 {result[endpoint]['latency_ms']['p99']:.1f} ms"
+            )
+        return result
+
+    def bench_chat(self, questions: dict, user, options: dict, rng: random.Random) -> list:
+        token = str(AccessToken.for_user(user))
+        runs = []
+        for endpoint, pool in questions.items():
+            if not pool:
+                continue
+            for concurrency in [int(v) for v in options["concurrency"].split(",")]:
+                run = drive_chat(
+                    endpoint,
+                    rng.choices(pool, k=options["requests"]),
+                    concurrency,
+                    token if endpoint == "private" else None,
+                )
+                runs.append(run)
+                self.stderr.write(
+                    f"chat {endpoint} concurrency={concurrency:>3}: {run['requests_per_s']:.1f} req/s, "
+                    f"p50 {run['latency_s']['p50'] or 0:.3f}s, p99 {run['latency_s']['p99'] or 0:.3f}s, "
+                    f"{run['errors']} errors"
+                )
+        return runs
@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.benchmarks import summarize, write_json
+
+
+# Runs in a fresh interpreter so every trial pays the full import cost,
+# exactly like a freshly forked gunicorn worker loading `backend.wsgi`.
+WORKER_SCRIPT = r"""
+import os, sys, json, time
+t0 = time.perf_counter()
+
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns  # imports chat.views -> chat.utils.*
+
+mode = sys.argv[1]
+if mode == "eager":
+    # What every worker used to do at import time: three embedding clients,
+    # two Chroma clients per persist directory and two chat models + chains.
+    from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+    from langchain_chroma import Chroma
+    from langchain.chains import RetrievalQA
+    from chat.utils import vector_stores as vs
+
+    stores = []
+    for path in (vs.PRIVATE_DB_PATH, vs.PUBLIC_DB_PATH, vs.PUBLIC_DB_PATH, vs.PRIVATE_DB_PATH):
+        stores.append(Chroma(
+            collection_name=vs.COLLECTION_NAME,
+            embedding_function=OpenAIEmbeddings(model=vs.EMBEDDING_MODEL),
+            persist_directory=path,
+        ))
+    for store in stores[2:]:
+        RetrievalQA.from_chain_type(
+            llm=ChatOpenAI(model_name=vs.CHAT_MODEL, temperature=0),
+            chain_type="stuff",
+            retriever=store.as_retriever(search_kwargs={"k": 3}),
+            return_source_documents=True,
+        )
+elif mode == "warm":
+    # Lazy startup followed by the first request on each endpoint.
+    from chat.utils.public_chat import get_public_qa_chain
+    from chat.utils.private_chat import get_private_answer_chain
+    get_public_qa_chain()
+    get_private_answer_chain()
+
+elapsed = time.perf_counter() - t0
+
+from chat.benchmarks import current_rss_mb, peak_rss_mb
+print(json.dumps({
+    "startup_s": elapsed,
+    "rss_mb": current_rss_mb(),
+    "peak_rss_mb": peak_rss_mb(),
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure worker startup time and resident memory with lazy vector store "
+        "initialization against the previous eager, import-time setup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--trials", type=int, default=5, help="Fresh interpreters per mode.")
+        parser.add_argument(
+            "--modes",
+            default="eager,lazy,warm",
+            help="Comma-separated subset of: eager (old behaviour), lazy (startup only), warm (lazy + first use).",
+        )
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        env = os.environ.copy()
+        env.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+        # Client construction needs a key but never calls the API.
+        env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+        results = {"trials": options["trials"], "modes": {}}
+        for mode in options["modes"].split(","):
+            mode = mode.strip()
+            samples = []
+            for _ in range(options["trials"]):
+                proc = subprocess.run(
+                    [sys.executable, "-c", WORKER_SCRIPT, mode],
+                    cwd=settings.BASE_DIR,
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                )
+                if proc.returncode != 0:
+                    self.stderr.write(proc.stderr)
+                    raise SystemExit(f"Benchmark worker failed in mode '{mode}'")
+                samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+            results["modes"][mode] = {
+                key: summarize(sample[key] for sample in samples)
+                for key in ("startup_s", "rss_mb", "peak_rss_mb")
+            }
+            self.stderr.write(
+                f"{mode:>6}: startup {results['modes'][mode]['startup_s']['median']:.3f}s, "
+                f"rss {results['modes'][mode]['rss_mb']['median']:.1f} MB"
+            )
+
+        write_json(results, options.get("output"), self.stdout)
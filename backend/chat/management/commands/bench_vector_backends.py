@@ -0,0 +1,144 @@
+import os
+import time
+import tempfile
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from chat.benchmarks import percentiles, write_json
+from chat.utils.numpy_index import NumpyIndex
+from chat.utils.vector_backends import ChromaBackend
+from chat.utils import vector_stores
+
+GROUPS = 10
+
+
+def clustered_corpus(vectors: int, dim: int, clusters: int, queries: int, seed: int = 0, decay: float = 0.0):
+    """
+    Synthetic embeddings drawn around `clusters` random topics (real
+    embeddings cluster too, which is what IVF relies on) plus queries near
+    random corpus vectors. With `decay`, dimension i is scaled by
+    (1 + i) ** -decay, so leading dimensions carry most of the signal as in
+    Matryoshka-trained models. Returns (corpus, queries) as float32 matrices.
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((clusters, dim)).astype(np.float32)
+    corpus = topics[rng.integers(0, clusters, vectors)] + 0.6 * rng.standard_normal((vectors, dim)).astype(np.float32)
+    picked = corpus[rng.integers(0, vectors, queries)]
+    queries = picked + 0.3 * rng.standard_normal(picked.shape).astype(np.float32)
+    scale = ((1 + np.arange(dim)) ** -decay).astype(np.float32)
+    return corpus * scale, queries * scale
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int, allowed=None) -> list:
+    """
+    Row numbers of the true top `k` by cosine for each query (among the
+    `allowed` rows if given).
+    """
+    unit = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    rows = np.arange(len(corpus)) if allowed is None else allowed
+    truth = []
+    for query in queries:
+        scores = unit[rows] @ query
+        truth.append(rows[np.argsort(-scores)[:k]])
+    return truth
+
+
+def recall(found: list, truth: list) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def directory_mb(path: str) -> float:
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    ) / (1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare vector backends on a synthetic clustered corpus: Chroma (HNSW) "
+        "versus the in-process numpy index searched exhaustively and through "
+        "IVF at several nprobe values. Reports build time, disk size, query "
+        "latency and recall@k against exact search, unfiltered and with a "
+        "metadata filter, as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vectors", type=int, default=50_000)
+        parser.add_argument("--dim", type=int, default=768)
+        parser.add_argument("--clusters", type=int, default=500)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--nprobe", default="4,8,16", help="Comma-separated IVF nprobe values.")
+        parser.add_argument("--backends", default="chroma,numpy_flat,numpy_ivf")
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        corpus, queries = clustered_corpus(options["vectors"], options["dim"], options["clusters"], options["queries"])
+        ids = [f"v{i}" for i in range(len(corpus))]
+        metadatas = [{"source": f"doc{i % 997}.txt", "group": i % GROUPS} for i in range(len(corpus))]
+        documents = [f"chunk {i}" for i in range(len(corpus))]
+        truth = exact_neighbours(corpus, queries, k)
+        filtered_truth = exact_neighbours(corpus, queries, k, np.arange(0, len(corpus), GROUPS))
+        results = {
+            "vectors": len(corpus),
+            "dim": options["dim"],
+            "clusters": options["clusters"],
+            "queries": len(queries),
+            "k": k,
+            "runs": [],
+        }
+
+        for backend in options["backends"].split(","):
+            with tempfile.TemporaryDirectory() as workdir:
+                if backend == "chroma":
+                    store = ChromaBackend(vector_stores.COLLECTION_NAME, None, persist_directory=workdir)
+                    variants = {"chroma": store}
+                else:
+                    ivf = backend == "numpy_ivf"
+                    store = NumpyIndex(workdir, ivf_min_vectors=0 if ivf else len(corpus) + 1)
+                    variants = {f"numpy_ivf_nprobe{n}": n for n in options["nprobe"].split(",")} if ivf \
+                        else {"numpy_flat": store}
+
+                started = time.perf_counter()
+                for _ in vector_stores.upsert_vectors(store, ids, corpus, documents, metadatas):
+                    pass
+                build_seconds = time.perf_counter() - started
+
+                for name, variant in variants.items():
+                    if isinstance(variant, str):
+                        store.ivf_nprobe = int(variant)
+                    run = {
+                        "backend": name,
+                        "build_s": build_seconds,
+                        "disk_mb": directory_mb(workdir),
+                        **self.measure(store, queries, k, truth, None),
+                        **{
+                            f"filtered_{key}": value
+                            for key, value in self.measure(store, queries, k, filtered_truth, {"group": 0}).items()
+                        },
+                    }
+                    results["runs"].append(run)
+                    self.stderr.write(
+                        f"{name:>20}: build {build_seconds:.1f}s, p50 {run['latency_ms']['p50']:.2f} ms, "
+                        f"recall@{k} {run['recall']:.3f}; filtered p50 "
+                        f"{run['filtered_latency_ms']['p50']:.2f} ms, recall@{k} {run['filtered_recall']:.3f}"
+                    )
+
+        write_json(results, options.get("output"), self.stdout)
+
+    @staticmethod
+    def measure(store, queries, k: int, truth: list, where) -> dict:
+        store.query(queries[0], k, where=where)  # warm up
+        latencies = []
+        found = []
+        for query in queries:
+            started = time.perf_counter()
+            records = store.query(query, k, where=where)
+            latencies.append(time.perf_counter() - started)
+            found.append([int(record.id[1:]) for record in records])
+        return {
+            "latency_ms": {key: value * 1000 for key, value in percentiles(latencies).items()},
+            "recall": recall(found, truth),
+        }
@@ -0,0 +1,82 @@
+import signal
+import threading
+import multiprocessing
+from datetime import timedelta
+
+from django.db import connections
+from django.core.management.base import BaseCommand
+
+from chat.utils import ingestion_queue
+from chat.views import UPLOAD_DIR
+
+
+class Command(BaseCommand):
+    help = "Run background workers that process queued file ingestion jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Number of worker processes (1 runs in this process).",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=ingestion_queue.POLL_INTERVAL,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+        parser.add_argument(
+            "--stale-after", type=int, default=int(ingestion_queue.STALE_AFTER.total_seconds()),
+            help="Seconds without a heartbeat before a running job is requeued.",
+        )
+        parser.add_argument(
+            "--heartbeat-interval", type=float, default=ingestion_queue.HEARTBEAT_INTERVAL,
+            help="Seconds between heartbeats of running jobs (keep well below --stale-after).",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Drain the queue and exit instead of polling forever.",
+        )
+
+    def handle(self, *args, **options):
+        worker_options = {
+            "upload_folder": UPLOAD_DIR,
+            "poll_interval": options["poll_interval"],
+            "stale_after": timedelta(seconds=options["stale_after"]),
+            "exit_when_idle": options["once"],
+            "heartbeat_interval": options["heartbeat_interval"],
+        }
+
+        if options["workers"] <= 1:
+            stop_event = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+            try:
+                ingestion_queue.run_worker(stop_event=stop_event, **worker_options)
+            except KeyboardInterrupt:
+                pass
+            return
+
+        # Children must open their own DB connections.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=ingestion_queue.worker_process_main,
+                args=(index, worker_options),
+                name=f"ingest-worker-{index}",
+            )
+            for index in range(options["workers"])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} ingestion workers.")
+
+        def stop(*_):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop()
+            for process in processes:
+                process.join()
@@ -0,0 +1,61 @@
+import os
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from chat.models import File
+from chat.utils.blobs import spool_blob, store_blob
+from chat.utils.bulk_upload import iter_chunks
+from chat.utils.upload_storage import get_upload_storage
+from chat.views import UPLOAD_DIR
+
+
+class Command(BaseCommand):
+    help = (
+        "Move files saved flat in uploads/ into the content-addressed upload "
+        "storage, filling in stored_name and content_hash on every File that "
+        "used them. Flat files are removed once copied unless --keep-flat is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--folder", default=UPLOAD_DIR, help="The flat uploads folder.")
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--keep-flat", action="store_true")
+
+    def handle(self, *args, **options):
+        storage = get_upload_storage()
+        # Sharded names always have a directory part; anything else is flat
+        flat = File.objects.filter(Q(stored_name='') | ~Q(stored_name__contains='/'))
+        files = defaultdict(list)
+        for file_record in flat.only('id', 'filename', 'stored_name'):
+            files[file_record.stored_name or file_record.filename].append(file_record.pk)
+
+        migrated = missing = 0
+        for name, pks in sorted(files.items()):
+            path = os.path.join(options["folder"], name)
+            if not os.path.isfile(path):
+                missing += len(pks)
+                self.stderr.write(f"{name}: not found at {path}; {len(pks)} file(s) left as they are")
+                continue
+            migrated += len(pks)
+            if options["dry_run"]:
+                continue
+
+            with open(path, "rb") as source:
+                blob = spool_blob(iter_chunks(source), name)
+            with blob:
+                # Rows first, so deleting another File with this content keeps the blob
+                previous = list(File.objects.filter(pk__in=pks).only('id', 'stored_name', 'content_hash'))
+                File.objects.filter(pk__in=pks).update(stored_name=blob.stored_name, content_hash=blob.content_hash)
+                try:
+                    store_blob(blob, storage)
+                except Exception:
+                    File.objects.bulk_update(previous, ['stored_name', 'content_hash'])
+                    raise
+            if not options["keep_flat"]:
+                os.remove(path)
+            self.stdout.write(f"{name} -> {blob.stored_name} ({len(pks)} file(s))")
+
+        verb = "Would migrate" if options["dry_run"] else "Migrated"
+        self.stdout.write(f"{verb} {migrated} files to upload storage; {missing} missing on disk.")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import File
+from chat.utils import vector_stores
+from chat.utils.bm25 import get_sparse_index
+
+PAGE_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the BM25 indexes from the chunks already in the vector stores (public, "
+        "legacy shared private, and every owner's private collection)."
+    )
+
+    def handle(self, *args, **options):
+        targets = [(vector_stores.PUBLIC, None), (vector_stores.PRIVATE, None)]
+        owners = File.objects.filter(information_type=File.PRIVATE).values_list("user_id", flat=True).distinct()
+        targets += [(vector_stores.PRIVATE, owner_id) for owner_id in owners]
+
+        for information_type, owner_id in targets:
+            store = vector_stores.get_vector_store(information_type, owner_id)
+            index = get_sparse_index(information_type, owner_id)
+            index.clear()
+            offset = 0
+            while True:
+                page = store.get(include=("documents",), limit=PAGE_SIZE, offset=offset)
+                if not page:
+                    break
+                index.add([record.id for record in page], [record.document for record in page])
+                offset += len(page)
+            index.flush()
+            self.stdout.write(f"{store.name} ({information_type}): indexed {offset} chunks")
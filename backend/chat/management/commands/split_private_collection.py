@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from chat.models import File
+from chat.utils import vector_stores
+from chat.utils.bm25 import get_sparse_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Move chunks from the legacy shared private collection into per-owner "
+        "collections, tagging them with owner_id. Filenames uploaded by several "
+        "users cannot be attributed and are left for re-processing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        legacy = vector_stores.get_private_store()
+        legacy_index = get_sparse_index(vector_stores.PRIVATE)
+        owners = defaultdict(set)
+        for filename, user_id in File.objects.filter(information_type=File.PRIVATE).values_list("filename", "user_id"):
+            owners[filename].add(user_id)
+
+        moved = skipped = 0
+        for filename, user_ids in owners.items():
+            records = legacy.get(where={"source": filename})
+            if not records:
+                continue
+            ids = [record.id for record in records]
+            documents = [record.document for record in records]
+            if len(user_ids) > 1:
+                skipped += len(ids)
+                self.stderr.write(
+                    f"{filename}: shared by users {sorted(user_ids)}; re-process their files instead"
+                )
+                continue
+
+            owner_id = next(iter(user_ids))
+            if not options["dry_run"]:
+                for _ in vector_stores.upsert_vectors(
+                    vector_stores.get_private_store(owner_id),
+                    ids=ids,
+                    vectors=[record.vector for record in records],
+                    texts=documents,
+                    metadatas=[{**record.metadata, "owner_id": owner_id} for record in records],
+                ):
+                    pass
+                index = get_sparse_index(vector_stores.PRIVATE, owner_id)
+                index.add(ids, documents)
+                index.flush()
+                vector_stores.delete_ids(legacy, ids)
+                legacy_index.delete(ids)
+            moved += len(ids)
+
+        verb = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(f"{verb} {moved} chunks to per-owner collections; {skipped} left in the shared one.")
@@ -0,0 +1,102 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from chat.models import File
+from chat.utils import ingestion_queue, vector_stores
+from chat.utils.answer_cache import invalidate_public_answers
+
+
+class Command(BaseCommand):
+    help = (
+        "Tag chunks ingested by older versions with what they belong to (see "
+        "File.vector_filter): the blob every File with that content shares, or the "
+        "File for rows without a blob. Chunks keyed by their File are merged into "
+        "one set per blob. Chunks that only carry the display name (source) cannot "
+        "be attributed when files with different content share that name in one "
+        "store: they are deleted and those files are queued for re-processing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        # One list of files per store, oldest first
+        stores = defaultdict(list)
+        for file_record in File.objects.order_by("id"):
+            owner_id = file_record.user_id if file_record.information_type == File.PRIVATE else None
+            stores[(file_record.information_type, owner_id)].append(file_record)
+
+        counts = {"stamped": 0, "merged": 0, "dropped": 0}
+        requeue = []
+        for (information_type, owner_id), files in stores.items():
+            store = vector_stores.get_vector_store(information_type, owner_id)
+            index = files[0].sparse_index()
+
+            def restamp(records, file_record):
+                counts["stamped"] += len(records)
+                if not dry_run:
+                    metadata = file_record.chunk_metadata()
+                    vector_stores.update_metadatas(
+                        store,
+                        [record.id for record in records],
+                        [{**record.metadata, **metadata} for record in records],
+                    )
+
+            def drop(records, counter):
+                counts[counter] += len(records)
+                if not dry_run:
+                    ids = [record.id for record in records]
+                    vector_stores.delete_ids(store, ids)
+                    index.delete(ids)
+
+            # Chunks keyed by their display name only
+            by_name = defaultdict(list)
+            for file_record in files:
+                by_name[file_record.filename].append(file_record)
+            for filename, named in by_name.items():
+                legacy = [
+                    record for record in store.get(where={"source": filename}, include=("metadatas",))
+                    if "blob" not in record.metadata and "file_id" not in record.metadata
+                ]
+                if not legacy:
+                    continue
+                if len({tuple(f.vector_filter().items()) for f in named}) > 1:
+                    self.stderr.write(f"{filename}: shared by files {[f.pk for f in named]}; re-processing them")
+                    drop(legacy, "dropped")
+                    requeue.extend(named)
+                else:
+                    restamp(legacy, named[0])
+
+            # Chunks keyed by their File, for files whose content now has a blob
+            claimed = set()
+            for file_record in files:
+                if not file_record.stored_name:
+                    continue
+                per_file = [
+                    record for record in store.get(where={"file_id": file_record.pk}, include=("metadatas",))
+                    if "blob" not in record.metadata
+                ]
+                if not per_file:
+                    continue
+                shared = store.get(where=file_record.vector_filter(), include=(), limit=1)
+                if file_record.stored_name in claimed or shared:
+                    # Another file with the same content already holds them
+                    drop(per_file, "merged")
+                else:
+                    restamp(per_file, file_record)
+                    claimed.add(file_record.stored_name)
+
+        if not dry_run:
+            for file_record in requeue:
+                ingestion_queue.enqueue(file_record)
+            if any(information_type == File.PUBLIC for information_type, _ in stores):
+                invalidate_public_answers()
+
+        verb = "Would stamp" if dry_run else "Stamped"
+        self.stdout.write(
+            f"{verb} {counts['stamped']} chunks; {counts['merged']} duplicate chunks of shared content and "
+            f"{counts['dropped']} unattributable chunks of {len(requeue)} files "
+            f"{'would be' if dry_run else 'were'} dropped."
+        )
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # See 0002_ingestionjob
+    initial = True
+
+    dependencies = [
+        ('chat', '0003_ingestionbatch'),
+    ]
+
+    operations = [
+        # Existing rows get empty values: files saved flat in uploads/ until
+        # `migrate_uploads` moves them into upload storage
+        migrations.AddField(
+            model_name='file',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='stored_name',
+            field=models.CharField(blank=True, default='', max_length=256),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['content_hash'], name='chat_file_content_ddbb57_idx'),
+        ),
+    ]
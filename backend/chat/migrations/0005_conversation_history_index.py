@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_file_content_hash_stored_name'),
+    ]
+
+    operations = [
+        # IF NOT EXISTS: databases created before the app had migrations may
+        # already have it (SQLite and PostgreSQL both support the clause)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='conversation',
+                    index=models.Index(fields=['user', 'conversation_type', 'id'], name='chat_conver_user_id_a27866_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX IF NOT EXISTS "chat_conver_user_id_a27866_idx" '
+                    'ON "chat_conversation" ("user_id", "conversation_type", "id")',
+                    reverse_sql='DROP INDEX IF EXISTS "chat_conver_user_id_a27866_idx"',
+                ),
+            ],
+        ),
+    ]
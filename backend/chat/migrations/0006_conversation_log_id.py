@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # See 0002_ingestionjob
+    initial = True
+
+    dependencies = [
+        ('chat', '0005_conversation_history_index'),
+    ]
+
+    operations = [
+        # Null for turns written before the conversation log (unique allows
+        # any number of nulls)
+        migrations.AddField(
+            model_name='conversation',
+            name='log_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+def fail_duplicate_pending_jobs(apps, schema_editor):
+    """
+    Keep the newest pending job of each file (the one `enqueue` returned)
+    and fail the others, which the constraint would otherwise reject.
+    """
+    IngestionJob = apps.get_model('chat', 'IngestionJob')
+    pending = IngestionJob.objects.filter(status__in=['Queued', 'Running'])
+    duplicates = (
+        pending.values('file_id')
+        .annotate(newest=models.Max('id'), count=models.Count('id'))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        pending.filter(file_id=row['file_id'], id__lt=row['newest']).update(
+            status='Failed',
+            error='Superseded by a newer job for the same file.',
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_conversation_log_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_pending_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingestionjob',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('status__in', ['Queued', 'Running'])),
+                fields=('file',),
+                name='chat_ingestionjob_one_pending_per_file',
+            ),
+        ),
+    ]
@@ -1,14 +1,17 @@
 import os
 import logging
-from django.db import models
+from contextlib import contextmanager
+
+from django.db import models, transaction
 from django.conf import settings
+from chat.utils.vector_stores import get_vector_store, get_ids, get_metadatas, update_metadatas, delete_ids
+from chat.utils.answer_cache import invalidate_public_answers
+from chat.utils.bm25 import get_sparse_index
+from chat.utils.upload_storage import get_upload_storage
 
 # Optional: use Python's logging module for better debugging
 logger = logging.getLogger(__name__)
 
-from chat.utils.public_chat import public_vector_store
-from chat.utils.private_chat import private_vector_store
-
 class File(models.Model):
     PUBLIC = 'Public'
     PRIVATE = 'Private'
@@ -30,43 +33,132 @@ class File(models.Model):
         choices=INFO_TYPE_CHOICES,
         default=PUBLIC
     )
+    # SHA-256 of the uploaded bytes, and the name of their blob in upload
+    # storage (shared by every File with the same content). Both are empty
+    # for files saved flat in uploads/ that `migrate_uploads` hasn't moved.
+    content_hash = models.CharField(max_length=64, blank=True)
+    stored_name = models.CharField(max_length=256, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_hash']),
+        ]
 
     def __str__(self):
         return f'{self.filename} ({self.information_type})'
 
     def get_upload_path(self) -> str:
         """
-        Construct the full path to the uploaded file.
+        Construct the full path to a file saved flat in uploads/.
         """
         return os.path.join(settings.BASE_DIR, 'uploads', self.filename)
 
+    def vector_store(self):
+        """
+        The vector store holding this file's chunks (per-owner for private files).
+        """
+        owner_id = self.user_id if self.information_type == self.PRIVATE else None
+        return get_vector_store(self.information_type, owner_id)
+
+    def sparse_index(self):
+        """
+        The BM25 index mirroring `vector_store()`.
+        """
+        owner_id = self.user_id if self.information_type == self.PRIVATE else None
+        return get_sparse_index(self.information_type, owner_id)
+
+    def chunk_sharers(self):
+        """
+        Files whose chunks are this file's, oldest first: every File with the
+        same blob in the same store (this one included), or just this one
+        for rows saved without a blob.
+        """
+        if not self.stored_name:
+            return File.objects.filter(pk=self.pk)
+        files = File.objects.filter(stored_name=self.stored_name, information_type=self.information_type)
+        if self.information_type == self.PRIVATE:
+            files = files.filter(user_id=self.user_id)
+        return files.order_by('id')
+
+    def chunk_metadata(self) -> dict:
+        """
+        Metadata stamped on every chunk of this file. Chunks belong to their
+        content through `blob` (see `vector_filter`); `source` is the display
+        name of the oldest file sharing them and is only shown to users.
+        Private chunks carry the owner's id so retrieval can be scoped to
+        that user.
+        """
+        source = self.chunk_sharers().values_list('filename', flat=True).first() or self.filename
+        metadata = {"source": source, **self.vector_filter()}
+        if self.information_type == self.PRIVATE:
+            metadata["owner_id"] = self.user_id
+        return metadata
+
+    def vector_filter(self) -> dict:
+        """
+        Metadata `where` filter matching exactly this file's chunks: those of
+        its blob, which every File with the same content in the store
+        shares, or of this File for rows saved without a blob.
+        """
+        if self.stored_name:
+            return {"blob": self.stored_name}
+        return {"file_id": self.pk}
+
     def delete_embeddings(self) -> bool:
         """
-        Delete all embeddings associated with this file from the correct Chroma store.
+        Delete this file's embeddings from the correct vector store, unless
+        another File still shares them; then only their `source` moves to
+        the next file's name if it was this one's.
         Returns True on success, False on failure.
         """
         try:
-            store = (
-                private_vector_store
-                if self.information_type == self.PRIVATE
-                else public_vector_store
-            )
-            col = store._collection
-            results = col.get(where={"source": self.filename})
-            vector_ids = results.get("ids", [])
-            if vector_ids:
-                store.delete(ids=vector_ids)
+            store = self.vector_store()
+            sharers = list(self.chunk_sharers().exclude(pk=self.pk).values_list('filename', flat=True)[:1])
+            if sharers:
+                metadatas = get_metadatas(store, where=self.vector_filter())
+                moved = {id_: {**metadata, "source": sharers[0]} for id_, metadata in metadatas.items()
+                         if metadata.get("source") != sharers[0]}
+                update_metadatas(store, list(moved), list(moved.values()))
+            else:
+                ids = get_ids(store, where=self.vector_filter())
+                delete_ids(store, ids)
+                self.sparse_index().delete(ids)
+            if self.information_type == self.PUBLIC:
+                invalidate_public_answers()
             return True
         except Exception as e:
             logger.exception(f"Error deleting embeddings for {self.filename}")
             return False
 
+    def blob_shared(self) -> bool:
+        """
+        Whether another File still points at this file's blob.
+        """
+        if self.stored_name:
+            others = File.objects.filter(stored_name=self.stored_name)
+        else:
+            others = File.objects.filter(stored_name='', filename=self.filename)
+        return others.exclude(pk=self.pk).exists()
+
     def delete_from_filesystem(self) -> bool:
         """
-        Delete the file from the filesystem.
-        Returns True if file was deleted, False otherwise.
+        Delete the file from the filesystem, unless its blob is shared with
+        another File. The check and the delete hold `blob_lock`, so an
+        upload of the same content either counts as a sharer or stores the
+        blob again. Returns True if file was deleted, False otherwise.
         """
         try:
+            if self.stored_name:
+                with blob_lock(self.stored_name):
+                    if self.blob_shared():
+                        return False
+                    storage = get_upload_storage()
+                    if storage.exists(self.stored_name):
+                        storage.delete(self.stored_name)
+                        return True
+                return False
+            if self.blob_shared():
+                return False
             file_path = self.get_upload_path()
             if os.path.exists(file_path):
                 os.remove(file_path)
@@ -84,6 +176,20 @@ class File(models.Model):
         super().delete(*args, **kwargs)
 
 
+@contextmanager
+def blob_lock(stored_name: str):
+    """
+    A transaction holding the Files that use blob `stored_name` locked
+    (SELECT ... FOR UPDATE), so storing the blob for a new File and
+    deleting it with its last File never interleave. SQLite has no row
+    locks; its transactions run one at a time instead (with the default
+    SQLITE_TRANSACTION_MODE=IMMEDIATE).
+    """
+    with transaction.atomic():
+        list(File.objects.select_for_update().filter(stored_name=stored_name).values_list('pk', flat=True))
+        yield
+
+
 class Conversation(models.Model):
     PUBLIC = 'Public'
     PRIVATE = 'Private'
@@ -107,6 +213,101 @@ class Conversation(models.Model):
     query = models.TextField()
     answer = models.TextField()
     sources = models.JSONField(null=True, blank=True)
+    # Set when the turn is logged, so a buffered turn is recognised before it
+    # has an id and a replayed spool never stores it twice
+    log_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Latest turns of one user's chat, and keyset pages of its history
+            models.Index(fields=['user', 'conversation_type', 'id']),
+        ]
 
     def __str__(self):
         return f'Conversation {self.id} ({self.conversation_type})'
+
+
+class IngestionBatch(models.Model):
+    """
+    Files uploaded together through the bulk endpoint, ingested as one unit
+    (see `bulk_ingest.ingest_batch`) and reported on together.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='ingestion_batches'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'IngestionBatch {self.id}'
+
+
+def default_job_progress():
+    return {stage: {'done': 0, 'total': None} for stage in IngestionJob.STAGES}
+
+
+class IngestionJob(models.Model):
+    QUEUED = 'Queued'
+    RUNNING = 'Running'
+    SUCCEEDED = 'Succeeded'
+    FAILED = 'Failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    LOAD = 'load'
+    SPLIT = 'split'
+    EMBED = 'embed'
+    UPSERT = 'upsert'
+    STAGES = [LOAD, SPLIT, EMBED, UPSERT]
+
+    file = models.ForeignKey(
+        File,
+        on_delete=models.CASCADE,
+        related_name='jobs'
+    )
+    batch = models.ForeignKey(
+        IngestionBatch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='jobs'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=QUEUED
+    )
+    stage = models.CharField(max_length=20, blank=True)
+    progress = models.JSONField(default=default_job_progress)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+        constraints = [
+            # At most one pending job per file (see `ingestion_queue.enqueue`)
+            models.UniqueConstraint(
+                fields=['file'],
+                condition=models.Q(status__in=['Queued', 'Running']),
+                name='chat_ingestionjob_one_pending_per_file',
+            ),
+        ]
+
+    def __str__(self):
+        return f'IngestionJob {self.id} ({self.status})'
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.SUCCEEDED, self.FAILED)
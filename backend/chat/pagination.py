@@ -0,0 +1,14 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class ConversationCursorPagination(CursorPagination):
+    """
+    Keyset pagination over conversations, newest first. The cursor encodes
+    the last id seen, so every page is one index range scan on
+    (user, conversation_type, id) however deep the client pages.
+    """
+    ordering = '-id'
+    page_size = settings.CHAT_HISTORY_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.CHAT_HISTORY_MAX_PAGE_SIZE
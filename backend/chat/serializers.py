@@ -1,5 +1,25 @@
+from collections import Counter
 from rest_framework import serializers
-from .models import File, Conversation
+from .models import File, Conversation, IngestionBatch, IngestionJob
+
+
+def serialize_source_documents(docs) -> list:
+    """
+    Compact JSON form of retrieved documents, as stored in Conversation.sources.
+    Packed context blocks also record their prompt tokens and the tokens
+    saved by merging overlapping chunks.
+    """
+    sources = []
+    for doc in docs:
+        source = {
+            'source': doc.metadata.get('source'),
+            'content': doc.page_content[:200]
+        }
+        for key in ('chunks', 'tokens', 'tokens_saved'):
+            if key in doc.metadata:
+                source[key] = doc.metadata[key]
+        sources.append(source)
+    return sources
 
 
 class FileSerializer(serializers.ModelSerializer):
@@ -16,12 +36,14 @@ class FileSerializer(serializers.ModelSerializer):
             'status',
             'information_type',
             'information_type_display',
-            'user'
+            'user',
+            'content_hash'
         ]
         read_only_fields = [
             'id',
             'uploaded_at',
             'status',
+            'content_hash',
             'user',
             'information_type_display'
         ]
@@ -34,10 +56,27 @@ class FileSerializer(serializers.ModelSerializer):
 
 
 class ConversationSerializer(serializers.ModelSerializer):
+    """
+    Pass `fields` to serialize only those fields (see `model_fields_for`).
+    """
     conversation_type_display = serializers.CharField(
         source='get_conversation_type_display', read_only=True
     )
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def model_fields_for(cls, fields) -> list:
+        """
+        Model fields to load for serializing `fields`, for `QuerySet.only`.
+        """
+        sources = {'conversation_type_display': 'conversation_type'}
+        return sorted({sources.get(name, name) for name in fields} | {'id'})
+
     class Meta:
         model = Conversation
         fields = [
@@ -57,3 +96,64 @@ class ConversationSerializer(serializers.ModelSerializer):
             'answer',
             'sources'
         ]
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    filename = serializers.CharField(source='file.filename', read_only=True)
+
+    class Meta:
+        model = IngestionJob
+        fields = [
+            'id',
+            'file',
+            'filename',
+            'status',
+            'stage',
+            'progress',
+            'error',
+            'attempts',
+            'created_at',
+            'started_at',
+            'finished_at'
+        ]
+        read_only_fields = fields
+
+
+class IngestionBatchSerializer(serializers.ModelSerializer):
+    """
+    Whole-batch view: overall status, job counts per status, per-stage
+    progress summed over the files, and every job.
+    """
+    status = serializers.SerializerMethodField()
+    counts = serializers.SerializerMethodField()
+    progress = serializers.SerializerMethodField()
+    jobs = IngestionJobSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = IngestionBatch
+        fields = ['id', 'created_at', 'status', 'counts', 'progress', 'jobs']
+        read_only_fields = fields
+
+    def get_counts(self, obj):
+        counts = Counter(job.status for job in obj.jobs.all())
+        return {'files': sum(counts.values()), **{status: counts[status] for status, _ in IngestionJob.STATUS_CHOICES}}
+
+    def get_status(self, obj):
+        counts = self.get_counts(obj)
+        if counts[IngestionJob.QUEUED] == counts['files']:
+            return IngestionJob.QUEUED
+        if counts[IngestionJob.QUEUED] or counts[IngestionJob.RUNNING]:
+            return IngestionJob.RUNNING
+        if counts[IngestionJob.FAILED]:
+            return IngestionJob.FAILED if not counts[IngestionJob.SUCCEEDED] else 'Partially failed'
+        return IngestionJob.SUCCEEDED
+
+    def get_progress(self, obj):
+        progress = {stage: {'done': 0, 'total': 0} for stage in IngestionJob.STAGES}
+        for job in obj.jobs.all():
+            for stage, entry in progress.items():
+                job_entry = job.progress.get(stage, {})
+                entry['done'] += job_entry.get('done', 0)
+                if entry['total'] is not None:
+                    entry['total'] = None if job_entry.get('total') is None else entry['total'] + job_entry['total']
+        return progress
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.test import override_settings
+
+from chat.utils import vector_stores
+
+
+class IsolatedStoresMixin:
+    """
+    Give each test its own vector stores, BM25 indexes, upload storage and
+    flat uploads folder, with offline fake embeddings, and drop the cached
+    clients afterwards.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.upload_folder = os.path.join(self.workdir, "uploads")
+        os.makedirs(self.upload_folder)
+
+        paths = mock.patch.dict(vector_stores.STORE_PATHS, {
+            vector_stores.PUBLIC: os.path.join(self.workdir, "public"),
+            vector_stores.PRIVATE: os.path.join(self.workdir, "private"),
+        })
+        paths.start()
+        self.addCleanup(paths.stop)
+
+        overrides = override_settings(
+            BM25_INDEX_DIR=os.path.join(self.workdir, "bm25"),
+            VECTOR_STORE_BACKENDS={vector_stores.PUBLIC: "numpy", vector_stores.PRIVATE: "numpy"},
+            EMBEDDINGS_BACKEND="fake",
+            FAKE_EMBEDDING_DIM=64,
+            FAKE_EMBEDDING_LATENCY=0,
+            EMBEDDING_CACHE_ENABLED=False,
+            INGEST_PARSE_WORKERS=1,
+            STORAGES={
+                **settings.STORAGES,
+                "uploads": {
+                    "BACKEND": "chat.utils.upload_storage.ShardedFileSystemStorage",
+                    "OPTIONS": {"location": os.path.join(self.workdir, "blobs")},
+                },
+            },
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        vector_stores.reset()
+        self.addCleanup(vector_stores.reset)
+
+    def make_file(self, name: str, text: str, user, information_type: str = "Public"):
+        """
+        A File whose `text` is stored as a blob in upload storage, as an upload would be.
+        """
+        from chat.models import File
+        from chat.utils.blobs import save_blob
+
+        stored_name, content_hash, _ = save_blob([text.encode("utf-8")], name)
+        return File.objects.create(
+            filename=name,
+            user=user,
+            information_type=information_type,
+            stored_name=stored_name,
+            content_hash=content_hash,
+        )
@@ -0,0 +1,96 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from chat.models import File, IngestionJob
+from chat.tests.base import IsolatedStoresMixin
+from chat.utils.blobs import spool_blob, store_blob
+from chat.utils.upload_storage import get_upload_storage
+
+
+class BlobTests(IsolatedStoresMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name: str, content: bytes) -> File:
+        response = self.client.post("/api/chat/files/", {"file": SimpleUploadedFile(name, content)})
+        self.assertEqual(response.status_code, 201)
+        return File.objects.get(pk=response.json()["id"])
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload("a.txt", b"same content")
+        second = self.upload("b.txt", b"same content")
+        self.assertEqual(first.stored_name, second.stored_name)
+        self.assertEqual(len(get_upload_storage().listdir(first.stored_name.rsplit("/", 1)[0])[1]), 1)
+
+    def test_an_upload_during_a_delete_keeps_its_blob(self):
+        existing = self.make_file("a.txt", "same content", self.user)
+        storage = get_upload_storage()
+
+        # The new File is written before its blob is stored, so a delete
+        # that checks for sharers afterwards keeps the blob
+        with spool_blob([b"same content"], "b.txt") as blob:
+            File.objects.create(
+                filename="b.txt", user=self.user, stored_name=blob.stored_name, content_hash=blob.content_hash
+            )
+            existing.delete()
+            self.assertTrue(storage.exists(blob.stored_name))
+            self.assertFalse(store_blob(blob))
+
+        # A delete that checked before the File was written removed the
+        # blob, which storing then writes again
+        with spool_blob([b"same content"], "c.txt") as blob:
+            File.objects.filter(stored_name=blob.stored_name).delete()
+            storage.delete(blob.stored_name)
+            File.objects.create(
+                filename="c.txt", user=self.user, stored_name=blob.stored_name, content_hash=blob.content_hash
+            )
+            self.assertTrue(store_blob(blob))
+        self.assertTrue(storage.exists(blob.stored_name))
+
+    def test_a_copy_stored_under_another_name_is_dropped(self):
+        storage = FileSystemStorage(location=self.workdir + "/plain")
+        with spool_blob([b"content"], "a.txt") as blob:
+            storage.save(blob.stored_name, ContentFile(b"content"))
+            # As if the other copy landed between the check and the save,
+            # so the storage picks another name for this one
+            with mock.patch.object(storage, "exists", side_effect=[False, True, False]):
+                self.assertTrue(store_blob(blob, storage))
+        directory, filename = blob.stored_name.rsplit("/", 1)
+        self.assertEqual(storage.listdir(directory)[1], [filename])
+
+    def test_failed_store_removes_the_file(self):
+        with mock.patch("chat.views.store_blob", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.client.post("/api/chat/files/", {"file": SimpleUploadedFile("a.txt", b"content")})
+        self.assertFalse(File.objects.exists())
+
+    def test_bulk_upload_stores_blobs_before_queueing(self):
+        stored = []
+        with mock.patch("chat.utils.bulk_upload.store_blob", side_effect=lambda blob: stored.append(
+            (blob.stored_name, IngestionJob.objects.count(), File.objects.filter(stored_name=blob.stored_name).count())
+        )):
+            response = self.client.post("/api/chat/files/bulk/", {
+                "files": [SimpleUploadedFile("a.txt", b"one"), SimpleUploadedFile("b.txt", b"two")],
+                "information_type": File.PUBLIC,
+            })
+        self.assertEqual(response.status_code, 202)
+        # Each blob stored once its File existed and before any job was queued
+        self.assertEqual([(jobs, files) for _, jobs, files in stored], [(0, 1), (0, 1)])
+        self.assertEqual(IngestionJob.objects.count(), 2)
+
+    def test_upload_rejects_an_unknown_information_type(self):
+        response = self.client.post(
+            "/api/chat/files/", {"file": SimpleUploadedFile("a.txt", b"content"), "information_type": "Secret"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Invalid information_type."})
+        self.assertFalse(File.objects.exists())
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chat.utils import bm25
+
+DOCS = {f"doc-{i}": f"widget number {i} ships in {'blue' if i % 2 else 'red'}" for i in range(10)}
+
+
+class SparseIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def index(self, name: str = "index", docs: dict = DOCS) -> bm25.SparseIndex:
+        index = bm25.SparseIndex(os.path.join(self.workdir, name))
+        index.add(list(docs), list(docs.values()))
+        index.flush()
+        return index
+
+    def test_tombstones_do_not_count_towards_statistics(self):
+        index = self.index()
+        self.assertEqual(index.delete(["doc-1"]), 1)
+        self.assertEqual(index.stats()["deleted"], 1)
+
+        live = {id_: text for id_, text in DOCS.items() if id_ != "doc-1"}
+        fresh = self.index("fresh", live)
+        results = index.search("blue widget", 10)
+        self.assertNotIn("doc-1", dict(results))
+        self.assertEqual([id_ for id_, _ in results], [id_ for id_, _ in fresh.search("blue widget", 10)])
+        for (_, score), (_, expected) in zip(results, fresh.search("blue widget", 10)):
+            self.assertAlmostEqual(score, expected, places=5)
+
+    def test_readding_an_id_replaces_it(self):
+        index = self.index()
+        index.add(["doc-0"], ["now about gears"])
+        index.flush()
+        self.assertEqual(index.search("gears", 5), [("doc-0", index.search("gears", 5)[0][1])])
+        self.assertNotIn("doc-0", dict(index.search("red", 10)))
+
+    def test_compaction_merges_segments_and_drops_tombstones(self):
+        index = self.index()
+        index.delete(["doc-2"])
+        for i in range(bm25.MAX_SEGMENTS):
+            index.add([f"extra-{i}"], [f"gear {i}"])
+            index.flush()
+
+        stats = index.stats()
+        self.assertEqual(stats["segments"], 1)
+        self.assertEqual(stats["deleted"], 0)
+        self.assertEqual(stats["docs"], len(DOCS) + bm25.MAX_SEGMENTS - 1)
+        self.assertEqual(len([name for name in os.listdir(index.path) if name.startswith("seg-")]), 1)
+        self.assertEqual({id_ for id_, _ in index.search("gear", 20)}, {f"extra-{i}" for i in range(bm25.MAX_SEGMENTS)})
+
+    def test_other_instances_see_writes_and_closed_indexes_reopen(self):
+        writer = self.index()
+        reader = bm25.SparseIndex(writer.path)
+        self.assertEqual(len(reader.search("widget", 20)), len(DOCS))
+
+        writer.delete(["doc-3"])
+        self.assertNotIn("doc-3", dict(reader.search("widget", 20)))
+        reader.close()
+        self.assertEqual(len(reader.search("widget", 20)), len(DOCS) - 1)
+
+    def test_writes_without_fcntl(self):
+        with mock.patch.object(bm25, "fcntl", None):
+            index = self.index()
+            index.delete(["doc-1"])
+        self.assertEqual(index.stats()["docs"] - index.stats()["deleted"], len(DOCS) - 1)
+        self.assertEqual(index.search("number 3", 1)[0][0], "doc-3")
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat.models import IngestionBatch, IngestionJob
+from chat.utils import ingestion_queue, vector_stores
+from chat.utils.bulk_ingest import ingest_batch
+from chat.utils.parse_pool import parse_file
+from chat.tests.base import IsolatedStoresMixin
+
+
+class RecordedJobProgress(ingestion_queue.JobProgress):
+    transitions = {}
+
+    def start(self, stage: str, total: int = None):
+        if stage != self.current:
+            self.transitions.setdefault(self.job.file.filename, []).append(stage)
+        super().start(stage, total)
+
+
+class IngestBatchTests(IsolatedStoresMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", "alice@example.com", "pw")
+        RecordedJobProgress.transitions = {}
+
+    def claim(self, *files) -> list:
+        batch = IngestionBatch.objects.create(user=self.user)
+        for file_record in files:
+            IngestionJob.objects.create(file=file_record, batch=batch)
+        return ingestion_queue.claim_batch(ingestion_queue.claim_next("worker-1"), "worker-1")
+
+    def test_stages_start_as_each_file_reaches_them(self):
+        jobs = self.claim(
+            self.make_file("a.txt", "Apples and pears. " * 100, self.user),
+            self.make_file("b.txt", "Boats and rivers. " * 100, self.user),
+        )
+        with mock.patch("chat.utils.bulk_ingest.JobProgress", RecordedJobProgress):
+            ingest_batch(jobs, self.upload_folder)
+
+        for job in jobs:
+            job.refresh_from_db()
+            self.assertEqual(job.status, IngestionJob.SUCCEEDED)
+            self.assertEqual(RecordedJobProgress.transitions[job.file.filename], IngestionJob.STAGES)
+            self.assertTrue(job.file.vector_store().get(where=job.file.vector_filter()))
+
+    def test_files_whose_content_is_processed_share_its_chunks(self):
+        text = "Apples and pears. " * 100
+        first = self.make_file("a.txt", text, self.user)
+        [job] = self.claim(first)
+        ingest_batch([job], self.upload_folder)
+        first.refresh_from_db()
+        store = first.vector_store()
+        count = store.count()
+
+        copy, other = self.claim(
+            self.make_file("a copy.txt", text, self.user), self.make_file("b.txt", "Boats. " * 100, self.user)
+        )
+        with mock.patch("chat.utils.bulk_ingest.parse_file", wraps=parse_file) as parse:
+            ingest_batch([copy, other], self.upload_folder)
+        self.assertEqual(parse.call_count, 1)
+        for job in (copy, other):
+            job.refresh_from_db()
+            self.assertEqual(job.status, IngestionJob.SUCCEEDED)
+        self.assertEqual(len(vector_stores.get_ids(store, copy.file.vector_filter())), count)
+
+    def test_copies_in_one_batch_are_parsed_once(self):
+        text = "Apples and pears. " * 100
+        first, copy = self.claim(self.make_file("a.txt", text, self.user), self.make_file("a copy.txt", text, self.user))
+        with mock.patch("chat.utils.bulk_ingest.parse_file", wraps=parse_file) as parse:
+            ingest_batch([first, copy], self.upload_folder)
+        self.assertEqual(parse.call_count, 1)
+        for job in (first, copy):
+            job.refresh_from_db()
+            self.assertEqual(job.status, IngestionJob.SUCCEEDED)
+            self.assertEqual(job.file.status, "Processed")
+
+        # One set of chunks, indexed once in the sparse index
+        ids = vector_stores.get_ids(first.file.vector_store(), first.file.vector_filter())
+        index = first.file.sparse_index()
+        index.flush()
+        stats = index.stats()
+        self.assertEqual(stats["docs"] - stats["deleted"], len(ids))
+
+    def test_copies_fail_with_the_file_parsed_for_them(self):
+        text = "Apples and pears. " * 100
+        first, copy = self.claim(self.make_file("a.txt", text, self.user), self.make_file("a copy.txt", text, self.user))
+        with mock.patch("chat.utils.bulk_ingest.parse_file", side_effect=ValueError("broken")):
+            ingest_batch([first, copy], self.upload_folder)
+        for job in (first, copy):
+            job.refresh_from_db()
+            self.assertEqual(job.status, IngestionJob.FAILED)
+            self.assertEqual(job.file.status, "Error")
@@ -0,0 +1,66 @@
+import math
+
+from django.test import SimpleTestCase
+from langchain_core.documents import Document
+
+from chat.utils.context_packer import CHARS_PER_TOKEN, TokenCounter, merge_adjacent, pack_context
+
+TEXT = "".join(f"Sentence number {i:02d} of the page. " for i in range(40))
+
+
+class CharCounter(TokenCounter):
+    """
+    The offline estimate, whatever tiktoken can load.
+    """
+
+    def __init__(self):
+        self.encoding = None
+
+
+def chunk(start: int, end: int, file_id: int = 1, page: int = 0) -> Document:
+    return Document(
+        page_content=TEXT[start:end],
+        metadata={"source": "a.txt", "file_id": file_id, "page": page, "start_index": start},
+        id=f"{file_id}:{page}:{start}",
+    )
+
+
+class MergeAdjacentTests(SimpleTestCase):
+    def test_merges_overlapping_chunks_without_repeating_the_overlap(self):
+        blocks = merge_adjacent([chunk(100, 300), chunk(0, 150), chunk(500, 600)])
+        self.assertEqual([block.text for block in blocks], [TEXT[0:300], TEXT[500:600]])
+        self.assertEqual(blocks[0].rank, 0)
+        self.assertEqual(len(blocks[0].docs), 2)
+
+    def test_touching_chunks_merge_and_contained_ones_are_dropped(self):
+        blocks = merge_adjacent([chunk(0, 200), chunk(200, 400), chunk(50, 150)])
+        self.assertEqual([block.text for block in blocks], [TEXT[0:400]])
+
+    def test_keeps_other_pages_and_files_apart(self):
+        blocks = merge_adjacent([chunk(0, 200), chunk(150, 300, page=1), chunk(150, 300, file_id=2)])
+        self.assertEqual(len(blocks), 3)
+
+    def test_blocks_keep_their_best_rank(self):
+        blocks = merge_adjacent([chunk(800, 900), chunk(300, 400), chunk(0, 200), chunk(200, 300)])
+        self.assertEqual([block.rank for block in blocks], [0, 1])
+        self.assertEqual(blocks[1].text, TEXT[0:400])
+
+
+class PackContextTests(SimpleTestCase):
+    def test_packs_most_relevant_blocks_within_budget(self):
+        docs = [chunk(0, 200), chunk(800, 1000), chunk(150, 400), chunk(1200, 1400)]
+        budget = (400 + 200) // CHARS_PER_TOKEN
+        packed, stats = pack_context(docs, budget, CharCounter())
+
+        self.assertEqual([doc.page_content for doc in packed], [TEXT[0:400], TEXT[800:1000]])
+        self.assertEqual(packed[0].metadata["chunks"], 2)
+        self.assertEqual(packed[0].metadata["start_index"], 0)
+        self.assertEqual(packed[0].metadata["tokens_saved"], math.ceil(50 / CHARS_PER_TOKEN))
+        self.assertLessEqual(stats["tokens"], budget)
+        self.assertEqual(stats["blocks"], 2)
+        self.assertEqual(stats["tokens_saved"], stats["tokens_in"] - stats["tokens"])
+
+    def test_truncates_a_first_block_over_budget(self):
+        packed, stats = pack_context([chunk(0, 400), chunk(800, 900)], 10, CharCounter())
+        self.assertEqual([doc.page_content for doc in packed], [TEXT[:10 * CHARS_PER_TOKEN]])
+        self.assertEqual(stats["tokens"], 10)
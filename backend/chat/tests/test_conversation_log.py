@@ -0,0 +1,156 @@
+import os
+import json
+import shutil
+import tempfile
+import uuid
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import TransactionTestCase, override_settings
+
+from chat.models import Conversation
+from chat.utils import conversation_log
+from chat.utils.conversation_log import (
+    DEAD_LETTER_FILE, SPOOL_SUFFIX, ConversationLog, log_conversation, recent_conversations, replay_spools,
+)
+
+
+def spool_record(user_id, query="Q") -> dict:
+    return {
+        "log_id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "conversation_type": Conversation.PRIVATE,
+        "query": query,
+        "answer": "A",
+        "sources": [],
+    }
+
+
+# TransactionTestCase: SQLite checks foreign keys when a transaction commits
+class ConversationLogTests(TransactionTestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+        self.user = User.objects.create_user("alice", password="pw")
+
+    def make_log(self) -> ConversationLog:
+        # Only flushed explicitly (and on close)
+        log = ConversationLog(self.spool_dir, max_records=1000, flush_seconds=3600)
+        self.addCleanup(log.close)
+        return log
+
+    def spools(self) -> list:
+        return [name for name in os.listdir(self.spool_dir) if name.endswith(SPOOL_SUFFIX)]
+
+    def dead_letters(self) -> list:
+        path = os.path.join(self.spool_dir, DEAD_LETTER_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_flush_writes_pending_turns_and_deletes_the_spool(self):
+        log = self.make_log()
+        turn = log.append(self.user.id, Conversation.PRIVATE, "Q", "A", [])
+        self.assertEqual([c.log_id for c in log.pending(self.user.id, Conversation.PRIVATE)], [turn.log_id])
+        self.assertEqual(len(self.spools()), 1)
+
+        self.assertEqual(log.flush(), 1)
+        self.assertEqual(log.pending(self.user.id, Conversation.PRIVATE), [])
+        self.assertEqual(Conversation.objects.get().log_id, turn.log_id)
+        self.assertEqual(self.spools(), [])
+
+    def test_a_refused_row_is_dead_lettered_without_blocking_the_others(self):
+        log = self.make_log()
+        log.append(self.user.id, Conversation.PRIVATE, "kept", "A", [])
+        log.append(self.user.id + 1000, Conversation.PRIVATE, "orphan", "A", [])
+        log.append(self.user.id, Conversation.PRIVATE, "kept too", "A", [])
+
+        with self.assertLogs(conversation_log.logger, "ERROR"):
+            self.assertEqual(log.flush(), 2)
+        self.assertEqual(sorted(Conversation.objects.values_list("query", flat=True)), ["kept", "kept too"])
+        self.assertEqual([entry["record"]["query"] for entry in self.dead_letters()], ["orphan"])
+        self.assertIn("IntegrityError", self.dead_letters()[0]["error"])
+        # Nothing left to retry
+        self.assertEqual(self.spools(), [])
+        self.assertEqual(log.flush(), 0)
+
+    def test_a_database_outage_keeps_the_turns_queued(self):
+        log = self.make_log()
+        log.append(self.user.id, Conversation.PRIVATE, "Q", "A", [])
+        with mock.patch.object(Conversation.objects, "bulk_create", side_effect=OperationalError("down")):
+            with self.assertRaises(OperationalError):
+                log.flush()
+        self.assertEqual(len(log.pending(self.user.id, Conversation.PRIVATE)), 1)
+        self.assertEqual(len(self.spools()), 1)
+        self.assertEqual(self.dead_letters(), [])
+
+        self.assertEqual(log.flush(), 1)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_replay_writes_dead_workers_spools_once(self):
+        good = spool_record(self.user.id, "good")
+        path = os.path.join(self.spool_dir, f"1-dead{SPOOL_SUFFIX}")
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps(good) + "\n")
+            handle.write(json.dumps(spool_record(self.user.id + 1000, "orphan")) + "\n")
+            handle.write(json.dumps({"log_id": "not a uuid"}) + "\n")
+            handle.write('{"log_id": "torn')
+
+        with self.assertLogs(conversation_log.logger, "ERROR"):
+            self.assertEqual(replay_spools(self.spool_dir), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(len(self.dead_letters()), 2)
+        self.assertEqual(replay_spools(self.spool_dir), 0)
+
+        # A spool replayed twice (the replaying worker died before deleting it)
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps(good) + "\n")
+        self.assertEqual(replay_spools(self.spool_dir), 1)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_a_failed_replay_keeps_the_spool(self):
+        path = os.path.join(self.spool_dir, f"1-dead{SPOOL_SUFFIX}")
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps(spool_record(self.user.id)) + "\n")
+        with mock.patch.object(Conversation.objects, "bulk_create", side_effect=OperationalError("down")):
+            with self.assertLogs(conversation_log.logger, "ERROR"):
+                self.assertEqual(replay_spools(self.spool_dir), 0)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(replay_spools(self.spool_dir), 1)
+
+    def test_building_the_log_survives_replay_errors(self):
+        with override_settings(CONVERSATION_LOG_SPOOL_DIR=self.spool_dir), \
+                mock.patch.object(conversation_log, "replay_spools", side_effect=OSError("disk gone")), \
+                mock.patch.object(conversation_log.atexit, "register"):
+            with self.assertLogs(conversation_log.logger, "ERROR"):
+                log = conversation_log.build_conversation_log()
+        self.addCleanup(log.close)
+        log.append(self.user.id, Conversation.PRIVATE, "Q", "A", [])
+        self.assertEqual(log.flush(), 1)
+
+    def test_other_workers_read_turns_still_in_the_spool(self):
+        # Two workers sharing the spool directory
+        first, second = self.make_log(), self.make_log()
+        older = first.append(self.user.id, Conversation.PRIVATE, "older", "A", [])
+        newer = second.append(self.user.id, Conversation.PRIVATE, "newer", "A", [])
+        first.append(self.user.id, Conversation.PUBLIC, "public", "A", [])
+        first.append(self.user.id + 1, Conversation.PRIVATE, "someone else", "A", [])
+
+        with override_settings(CONVERSATION_LOG_BUFFERED=True, CONVERSATION_LOG_SPOOL_DIR=self.spool_dir):
+            recent = recent_conversations(self.user.id, Conversation.PRIVATE, 10)
+            self.assertEqual([c.log_id for c in recent], [newer.log_id, older.log_id])
+
+            # Flushed turns come from the database, once
+            first.flush()
+            recent = recent_conversations(self.user.id, Conversation.PRIVATE, 10)
+            self.assertEqual([c.query for c in recent], ["newer", "older"])
+            self.assertIsNone(recent[0].id)
+            self.assertIsNotNone(recent[1].id)
+
+    @override_settings(CONVERSATION_LOG_BUFFERED=True, CONVERSATION_LOG_SPOOL_DIR=None)
+    def test_private_turns_are_written_inline_without_a_spool(self):
+        conversation = log_conversation(self.user, Conversation.PRIVATE, "Q", "A", [])
+        self.assertIsNotNone(conversation.id)
+        self.assertEqual(Conversation.objects.get().log_id, conversation.log_id)
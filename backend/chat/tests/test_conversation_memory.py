@@ -0,0 +1,78 @@
+import uuid
+import threading
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from chat.models import Conversation
+from chat.utils import conversation_memory
+from chat.utils.conversation_memory import ConversationMemory, get_memory_cache, load_memory, memory_key, remember_turn
+
+
+def turn(text: str) -> Conversation:
+    return Conversation(log_id=uuid.uuid4(), query=f"Q {text}", answer=f"A {text}")
+
+
+@override_settings(CHAT_MEMORY_TURNS=4, CONVERSATION_LOG_BUFFERED=False)
+class RememberTurnTests(TestCase):
+    user_id = 7
+
+    def setUp(self):
+        get_memory_cache().clear()
+        self.addCleanup(get_memory_cache().clear)
+        load_memory(self.user_id)
+
+    def memory(self) -> ConversationMemory:
+        return ConversationMemory(**get_memory_cache().get(memory_key(self.user_id)))
+
+    def test_summarizes_after_returning(self):
+        release = threading.Event()
+
+        def slow_summary(summary, turns):
+            release.wait(5)
+            return f"summary of {len(turns)} turns"
+
+        with mock.patch.object(conversation_memory, "summarize", side_effect=slow_summary):
+            futures = [remember_turn(self.user_id, turn(str(i))) for i in range(5)]
+            self.assertEqual(futures[:4], [None] * 4)
+            # Returned while the summary is still being written
+            self.assertFalse(futures[4].done())
+            self.assertEqual(len(self.memory().turns), 5)
+            release.set()
+            futures[4].result(timeout=5)
+
+        memory = self.memory()
+        self.assertEqual(memory.summary, "summary of 2 turns")
+        self.assertEqual([query for _, query, _ in memory.turns], ["Q 2", "Q 3", "Q 4"])
+
+    def test_concurrent_turns_are_all_kept(self):
+        with override_settings(CHAT_MEMORY_TURNS=100):
+            threads = [threading.Thread(target=remember_turn, args=(self.user_id, turn(str(i)))) for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(self.memory().turns), 20)
+
+    def test_a_fold_that_lost_the_race_is_discarded(self):
+        release = threading.Event()
+
+        def slow_summary(summary, turns):
+            release.wait(5)
+            return "stale"
+
+        with mock.patch.object(conversation_memory, "summarize", side_effect=slow_summary):
+            futures = [remember_turn(self.user_id, turn(str(i))) for i in range(5)]
+            # Meanwhile another worker folded the same turns
+            memory = self.memory()
+            memory.summary, memory.turns = "fresh", memory.turns[2:]
+            get_memory_cache().set(memory_key(self.user_id), memory.to_cache())
+            release.set()
+            futures[4].result(timeout=5)
+        self.assertEqual(self.memory().summary, "fresh")
+
+    def test_loading_never_replaces_an_updated_entry(self):
+        remember_turn(self.user_id, turn("kept"))
+        with mock.patch.object(get_memory_cache(), "get", return_value=None):
+            load_memory(self.user_id)
+        self.assertEqual([query for _, query, _ in self.memory().turns], ["Q kept"])
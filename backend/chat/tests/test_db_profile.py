@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import TestCase, override_settings
+
+from chat.utils.db_profile import describe
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite only")
+class SqlitePragmaTests(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def open(self) -> DatabaseWrapper:
+        """
+        A new connection to a database file, as a worker thread would open.
+        """
+        wrapper = DatabaseWrapper({**connection.settings_dict, "NAME": os.path.join(self.workdir, "db.sqlite3")})
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_new_connections_get_the_configured_pragmas(self):
+        pragmas = {"journal_mode": "WAL", "synchronous": "FULL", "busy_timeout": 1234, "mmap_size": 0}
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            profile = describe(self.open())
+        self.assertEqual(
+            (profile["journal_mode"], profile["synchronous"], profile["busy_timeout"], profile["mmap_size"]),
+            ("wal", 2, 1234, 0),
+        )
+        self.assertEqual(profile["transaction_mode"], settings.DATABASES["default"]["OPTIONS"]["transaction_mode"])
+
+    def test_pragmas_left_out_keep_sqlite_defaults(self):
+        with override_settings(SQLITE_PRAGMAS={"busy_timeout": 1234}):
+            profile = describe(self.open())
+        self.assertEqual((profile["journal_mode"], profile["busy_timeout"]), ("delete", 1234))
+
+    def test_the_test_database_connection_was_configured(self):
+        self.assertEqual(describe(connection)["busy_timeout"], settings.SQLITE_PRAGMAS["busy_timeout"])
@@ -0,0 +1,63 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from itertools import count
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chat.utils import embedding_cache
+from chat.utils.embedding_cache import EmbeddingCache
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.path = os.path.join(self.workdir, "cache.sqlite3")
+        # A clock that ticks once per read, so recency is never a tie
+        clock = mock.patch.object(embedding_cache, "time")
+        clock.start().time.side_effect = count(1)
+        self.addCleanup(clock.stop)
+
+    def test_hits_and_misses(self):
+        cache = EmbeddingCache(self.path, max_entries=10)
+        cache.put_many("model-a", ["one", "two"], [[1.0, 0.0], [0.0, 1.0]])
+
+        self.assertEqual(cache.get_many("model-a", ["two", "three", "two"]), {0: [0.0, 1.0], 2: [0.0, 1.0]})
+        # Vectors of another model never match
+        self.assertEqual(cache.get_many("model-b", ["one"]), {})
+
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["hits"], stats["misses"]), (2, 2, 2))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = EmbeddingCache(self.path, max_entries=3)
+        for text in ("a", "b", "c"):
+            cache.put_many("model", [text], [[1.0]])
+        cache.get_many("model", ["a"])
+        cache.put_many("model", ["d", "e"], [[1.0], [1.0]])
+
+        self.assertEqual(sorted(cache.get_many("model", ["a", "b", "c", "d", "e"])), [0, 3, 4])
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["evictions"]), (3, 2))
+
+    def test_storing_a_cached_text_again_adds_no_entry(self):
+        cache = EmbeddingCache(self.path, max_entries=10)
+        cache.put_many("model", ["a", "b"], [[1.0], [2.0]])
+        cache.put_many("model", ["b", "c"], [[9.0], [3.0]])
+        self.assertEqual(cache.stats()["entries"], 3)
+        self.assertEqual(cache.get_many("model", ["b"]), {0: [2.0]})
+
+        cache.clear()
+        self.assertEqual(cache.stats()["entries"], 0)
+        cache.put_many("model", ["a"], [[1.0]])
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_entry_count_is_seeded_for_older_cache_files(self):
+        EmbeddingCache(self.path, max_entries=10).put_many("model", ["a", "b"], [[1.0], [2.0]])
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("DELETE FROM counters")
+        self.assertEqual(EmbeddingCache(self.path, max_entries=10).stats()["entries"], 2)
@@ -0,0 +1,149 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from chat.utils.embedding_cache import EmbeddingCache
+from chat.utils.embedding_pipeline import Backpressure, EmbeddingError, EmbeddingPipeline
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: str = None):
+        super().__init__("429 Too Many Requests")
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+class FakeEmbedder:
+    """
+    Records each request as (started, texts) and answers [len(text), 1.0],
+    unless `fail(call_number)` returns an exception to raise instead.
+    """
+
+    def __init__(self, fail=None, latency: float = 0.0):
+        self.fail = fail or (lambda call: None)
+        self.latency = latency
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts: list) -> list:
+        with self.lock:
+            call = len(self.calls)
+            self.calls.append((time.monotonic(), list(texts)))
+        error = self.fail(call)
+        if error is not None:
+            raise error
+        time.sleep(self.latency)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def pipeline(embedder: FakeEmbedder, **options) -> EmbeddingPipeline:
+    options = {"batch_size": 3, "max_concurrency": 1, "max_retries": 2, "backoff_base": 0.01, **options}
+    return EmbeddingPipeline(embedder, use_cache=False, **options)
+
+
+class EmbeddingPipelineTests(SimpleTestCase):
+    texts = [f"text {'x' * i}" for i in range(7)]
+
+    def expected(self, texts: list) -> list:
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def test_texts_are_sent_in_batches_and_returned_in_order(self):
+        embedder = FakeEmbedder(latency=0.01)
+        vectors = pipeline(embedder, max_concurrency=3).embed(self.texts)
+        self.assertEqual(vectors, self.expected(self.texts))
+        self.assertEqual(sorted(len(texts) for _, texts in embedder.calls), [1, 3, 3])
+
+    def test_retry_after_is_honoured(self):
+        embedder = FakeEmbedder(fail=lambda call: RateLimitError("0.2") if call == 0 else None)
+        embedding = pipeline(embedder, backoff_base=30)
+        vectors = embedding.embed(self.texts[:2])
+
+        self.assertEqual(vectors, self.expected(self.texts[:2]))
+        (first, _), (retry, _) = embedder.calls
+        self.assertGreaterEqual(retry - first, 0.2)
+        # Not the 15-30 s exponential back-off
+        self.assertLess(retry - first, 5)
+        self.assertEqual(embedding.stats["rate_limited"], 1)
+        self.assertEqual(embedding.stats["retries"], 1)
+
+    def test_a_429_pauses_every_worker(self):
+        in_flight = threading.Barrier(2)
+        raised = []
+
+        def fail(call):
+            if call < 2:
+                # Both workers have a request in flight when the first is rate limited
+                in_flight.wait()
+                if call == 0:
+                    raised.append(time.monotonic())
+                    return RateLimitError("0.3")
+                time.sleep(0.05)
+
+        embedder = FakeEmbedder(fail=fail)
+        vectors = pipeline(embedder, batch_size=2, max_concurrency=2).embed(self.texts)
+
+        self.assertEqual(vectors, self.expected(self.texts))
+        later = [started for started, _ in embedder.calls[2:]]
+        self.assertEqual(len(later), 3)
+        self.assertTrue(all(started >= raised[0] + 0.3 for started in later))
+
+    def test_backpressure_holds_every_waiter(self):
+        gate = Backpressure()
+        gate.pause(0.1)
+        gate.pause(0.01)  # A shorter pause never cuts a longer one short
+        waited = []
+
+        def wait():
+            started = time.monotonic()
+            gate.wait()
+            waited.append(time.monotonic() - started)
+
+        threads = [threading.Thread(target=wait) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(seconds >= 0.09 for seconds in waited))
+
+    def test_gives_up_after_max_retries_and_on_other_errors(self):
+        embedder = FakeEmbedder(fail=lambda call: RateLimitError())
+        with self.assertRaises(EmbeddingError):
+            pipeline(embedder, max_retries=2).embed(self.texts[:1])
+        self.assertEqual(len(embedder.calls), 3)
+
+        embedder = FakeEmbedder(fail=lambda call: ValueError("bad input"))
+        with self.assertRaises(EmbeddingError):
+            pipeline(embedder).embed(self.texts[:1])
+        self.assertEqual(len(embedder.calls), 1)
+
+
+class CachedEmbeddingPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.cache = EmbeddingCache(os.path.join(self.workdir, "cache.sqlite3"), max_entries=100)
+
+    def pipeline(self, embedder: FakeEmbedder) -> EmbeddingPipeline:
+        embedding = pipeline(embedder)
+        embedding.cache = self.cache
+        return embedding
+
+    def test_each_batch_is_cached_as_it_completes(self):
+        texts = [f"chunk {i}" for i in range(7)]
+        # The third batch fails for good
+        embedder = FakeEmbedder(fail=lambda call: ValueError("bad input") if call == 2 else None)
+        with self.assertRaises(EmbeddingError):
+            self.pipeline(embedder).embed(texts)
+        self.assertEqual(self.cache.stats()["entries"], 6)
+
+        embedder = FakeEmbedder()
+        embedding = self.pipeline(embedder)
+        vectors = embedding.embed(texts)
+        self.assertEqual(vectors, [[float(len(text)), 1.0] for text in texts])
+        self.assertEqual([batch for _, batch in embedder.calls], [["chunk 6"]])
+        self.assertEqual(embedding.stats["cache_hits"], 6)
@@ -0,0 +1,53 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from chat.models import Conversation
+
+HISTORY_URL = "/api/chat/chat/private/history/"
+
+
+@override_settings(CONVERSATION_LOG_BUFFERED=False)
+class PrivateChatHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        other = User.objects.create_user("bob", password="pw")
+        self.ids = [
+            Conversation.objects.create(
+                user=self.user, conversation_type=Conversation.PRIVATE, query=f"Q{i}", answer=f"A{i}"
+            ).id
+            for i in range(5)
+        ]
+        Conversation.objects.create(user=self.user, conversation_type=Conversation.PUBLIC, query="Q", answer="A")
+        Conversation.objects.create(user=other, conversation_type=Conversation.PRIVATE, query="Q", answer="A")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_walk_the_private_turns_newest_first(self):
+        response = self.client.get(HISTORY_URL, {"page_size": 2, "fields": "id,query"})
+        seen = []
+        pages = 0
+        while response is not None:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            for result in body["results"]:
+                self.assertEqual(set(result), {"id", "query"})
+            seen.extend(result["id"] for result in body["results"])
+            pages += 1
+            # The cursor link keeps page_size and fields
+            response = self.client.get(body["next"]) if body["next"] else None
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, self.ids[::-1])
+
+    def test_previous_link_returns_to_the_first_page(self):
+        first = self.client.get(HISTORY_URL, {"page_size": 2, "fields": "query"}).json()
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([r["query"] for r in second["results"]], ["Q2", "Q1"])
+        back = self.client.get(second["previous"]).json()
+        self.assertEqual(back["results"], first["results"])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(HISTORY_URL, {"fields": "id,password"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("password", response.json()["error"])
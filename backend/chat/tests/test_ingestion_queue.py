@@ -0,0 +1,81 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db.models.query import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from chat.models import File, IngestionJob
+from chat.utils import ingestion_queue
+
+
+class HeartbeatTests(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create_user("alice", "alice@example.com", "pw")
+        file = File.objects.create(filename="notes.txt", user=user)
+        ingestion_queue.enqueue(file)
+        self.job = ingestion_queue.claim_next("worker-1")
+        self.long_ago = timezone.now() - timedelta(hours=1)
+
+    def age(self, **filters):
+        IngestionJob.objects.filter(**filters).update(heartbeat_at=self.long_ago)
+
+    def test_beats_while_the_job_is_held(self):
+        self.age(pk=self.job.pk)
+        with ingestion_queue.Heartbeat([self.job], "worker-1", interval=0.02):
+            deadline = time.monotonic() + 5
+            while IngestionJob.objects.get(pk=self.job.pk).heartbeat_at == self.long_ago:
+                self.assertLess(time.monotonic(), deadline, "no heartbeat was sent")
+                time.sleep(0.02)
+            # A long stage no longer looks like a crashed worker
+            self.assertEqual(ingestion_queue.requeue_stale(timedelta(minutes=1)), 0)
+
+        self.age(pk=self.job.pk)
+        time.sleep(0.1)
+        self.assertEqual(IngestionJob.objects.get(pk=self.job.pk).heartbeat_at, self.long_ago)
+        self.assertEqual(ingestion_queue.requeue_stale(timedelta(minutes=1)), 1)
+
+    def test_leaves_jobs_claimed_by_another_worker(self):
+        IngestionJob.objects.filter(pk=self.job.pk).update(worker="worker-2")
+        heartbeat = ingestion_queue.Heartbeat([self.job], "worker-1")
+        self.assertEqual(heartbeat.beat(), 0)
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("alice", "alice@example.com", "pw")
+        self.file = File.objects.create(filename="notes.txt", user=user)
+
+    def test_a_file_has_one_pending_job(self):
+        job = ingestion_queue.enqueue(self.file)
+        self.assertEqual(ingestion_queue.enqueue(self.file), job)
+
+        first = QuerySet.first
+        lookups = []
+
+        def stale_first(queryset):
+            lookups.append(queryset)
+            # The first lookup ran before another request queued the file
+            return None if len(lookups) == 1 else first(queryset)
+
+        with mock.patch.object(QuerySet, "first", autospec=True, side_effect=stale_first):
+            self.assertEqual(ingestion_queue.enqueue(self.file), job)
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(IngestionJob.objects.count(), 1)
+
+        ingestion_queue.finish_job(job, ingestion_queue.JobProgress(job), "Processed")
+        self.assertNotEqual(ingestion_queue.enqueue(self.file), job)
+
+    def test_jobs_out_of_attempts_fail_their_file(self):
+        ingestion_queue.enqueue(self.file)
+        job = ingestion_queue.claim_next("worker-1")
+        long_ago = timezone.now() - timedelta(hours=1)
+        IngestionJob.objects.filter(pk=job.pk).update(heartbeat_at=long_ago, attempts=ingestion_queue.MAX_ATTEMPTS)
+
+        self.assertEqual(ingestion_queue.requeue_stale(timedelta(minutes=1)), 1)
+        job.refresh_from_db()
+        self.file.refresh_from_db()
+        self.assertEqual(job.status, IngestionJob.FAILED)
+        self.assertEqual(self.file.status, "Error")
@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from chat.utils.numpy_index import NumpyIndex
+
+DIM = 16
+
+
+def basis(i: int, noise: float = 0.0, rng=None) -> np.ndarray:
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i % DIM] = 1.0
+    if noise:
+        vector += rng.normal(0, noise, DIM).astype(np.float32)
+    return vector
+
+
+class NumpyIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def index(self, **options) -> NumpyIndex:
+        index = NumpyIndex(os.path.join(self.workdir, "index"), **options)
+        self.addCleanup(index.close)
+        return index
+
+    def fill(self, index: NumpyIndex, count: int = 4):
+        ids = [f"doc-{i}" for i in range(count)]
+        index.upsert(
+            ids,
+            [basis(i) for i in range(count)],
+            [f"text {i}" for i in range(count)],
+            [{"source": "a.txt" if i % 2 else "b.txt", "page": i} for i in range(count)],
+        )
+        return ids
+
+    def test_query_returns_the_nearest_records(self):
+        index = self.index()
+        self.fill(index)
+        self.assertEqual(index.count(), 4)
+
+        results = index.query(basis(2) + 0.1 * basis(3), 2)
+        self.assertEqual([record.id for record in results], ["doc-2", "doc-3"])
+        self.assertEqual(results[0].document, "text 2")
+        self.assertEqual(results[0].metadata, {"source": "b.txt", "page": 2})
+        np.testing.assert_array_equal(results[0].vector, basis(2))
+
+    def test_upserting_an_id_replaces_it(self):
+        index = self.index()
+        self.fill(index)
+        index.upsert(["doc-0"], [basis(5)], ["moved"], [{"source": "c.txt"}])
+
+        self.assertEqual(index.count(), 4)
+        self.assertEqual([record.id for record in index.query(basis(5), 1)], ["doc-0"])
+        self.assertEqual(index.get(ids=["doc-0"])[0].document, "moved")
+        np.testing.assert_array_equal(index.get(ids=["doc-0"])[0].vector, basis(5))
+        # Its old slot was freed, and is reused
+        self.assertEqual(len(index._sync().ids), 5)
+        index.upsert(["doc-9"], [basis(9)], [""], [{}])
+        self.assertEqual(len(index._sync().ids), 5)
+        self.assertEqual(sorted(index._sync().positions), ["doc-0", "doc-1", "doc-2", "doc-3", "doc-9"])
+
+    def test_a_failed_upsert_leaves_the_stored_vectors_alone(self):
+        index = self.index()
+        self.fill(index)
+        with self.assertRaises(TypeError):
+            # Metadata that cannot be stored fails the write after the vectors went to disk
+            index.upsert(["doc-0", "doc-7"], [basis(5), basis(7)], ["moved", "new"], [{}, {"bad": object()}])
+
+        self.assertEqual(index.count(), 4)
+        record = index.get(ids=["doc-0"])[0]
+        self.assertEqual(record.document, "text 0")
+        np.testing.assert_array_equal(record.vector, basis(0))
+        self.assertEqual(index.query(basis(0), 1)[0].id, "doc-0")
+
+    def test_deleted_slots_are_reused(self):
+        index = self.index()
+        self.fill(index)
+        index.delete(["doc-1", "doc-2", "missing"])
+        self.assertEqual(index.count(), 2)
+        self.assertEqual(index.get(ids=["doc-1", "doc-3"], include=())[0].id, "doc-3")
+        self.assertNotIn("doc-1", [record.id for record in index.query(basis(1), 4)])
+
+        index.upsert(["new-1", "new-2", "new-3"], [basis(7), basis(8), basis(9)], ["", "", ""], [{}, {}, {}])
+        self.assertEqual(index.count(), 5)
+        # Two freed slots filled, one appended
+        self.assertEqual(len(index._sync().ids), 5)
+        self.assertEqual([record.id for record in index.query(basis(8), 1)], ["new-2"])
+
+    def test_filtered_get_and_query(self):
+        index = self.index()
+        self.fill(index, 6)
+
+        self.assertEqual(
+            sorted(record.id for record in index.get(where={"source": "a.txt"}, include=())),
+            ["doc-1", "doc-3", "doc-5"],
+        )
+        self.assertEqual(
+            [record.id for record in index.get(ids=["doc-0", "doc-1"], where={"source": "a.txt"})],
+            ["doc-1"],
+        )
+        self.assertEqual(
+            [record.id for record in index.get(where={"page": {"$gte": 2}}, include=(), limit=2, offset=1)],
+            ["doc-3", "doc-4"],
+        )
+        results = index.query(basis(0), 2, where={"source": "a.txt"})
+        self.assertTrue(all(record.metadata["source"] == "a.txt" for record in results))
+        self.assertEqual(index.query(basis(0), 2, where={"source": "none.txt"}), [])
+
+        index.update_metadatas(["doc-0"], [{"source": "a.txt", "page": 0}])
+        self.assertEqual(len(index.get(where={"source": "a.txt"}, include=())), 4)
+
+    def test_other_instances_see_writes(self):
+        writer = self.index()
+        reader = self.index()
+        self.fill(writer)
+        self.assertEqual(reader.count(), 4)
+        writer.delete(["doc-0"])
+        writer.upsert(["doc-9"], [basis(9)], ["nine"], [{}])
+        self.assertEqual([record.id for record in reader.query(basis(9), 1)], ["doc-9"])
+        self.assertEqual(reader.get(ids=["doc-0"]), [])
+
+    def test_closed_index_reopens(self):
+        index = self.index()
+        self.fill(index)
+        index.close()
+        self.assertEqual(index.count(), 4)
+        index.upsert(["doc-9"], [basis(9)], [""], [{}])
+        self.assertEqual(index.count(), 5)
+
+    def test_vector_format_is_fixed_by_the_first_write(self):
+        index = self.index(quantization="int8")
+        self.fill(index)
+        with self.assertRaises(ValueError):
+            index.upsert(["wide"], [np.ones(DIM * 2, dtype=np.float32)], [""], [{}])
+        with self.assertRaises(ValueError):
+            NumpyIndex(os.path.join(self.workdir, "index"), quantization="binary")
+
+    def test_quantized_search_rescores_on_full_vectors(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(200, DIM)).astype(np.float32)
+        ids = [f"doc-{i}" for i in range(len(vectors))]
+        exact = self.index()
+        coded = NumpyIndex(os.path.join(self.workdir, "coded"), quantization="binary", rescore=8)
+        self.addCleanup(coded.close)
+        for index in (exact, coded):
+            index.upsert(ids, vectors, [""] * len(ids), [{}] * len(ids))
+
+        query = vectors[17] + 0.05 * rng.normal(size=DIM).astype(np.float32)
+        found = coded.query(query, 5)
+        self.assertEqual(found[0].id, "doc-17")
+        # Records carry the full vectors, not decoded codes
+        np.testing.assert_array_equal(found[0].vector, vectors[17])
+        overlap = {r.id for r in found} & {r.id for r in exact.query(query, 5)}
+        self.assertGreaterEqual(len(overlap), 4)
+
+    def test_ivf_is_trained_once_large_enough_and_probes_near_lists(self):
+        rng = np.random.default_rng(0)
+        index = self.index(ivf_min_vectors=40, ivf_lists=4, ivf_nprobe=1)
+        # Four tight clusters around orthogonal axes
+        ids = [f"doc-{i}" for i in range(40)]
+        vectors = [basis(i % 4, 0.05, rng) for i in range(40)]
+        index.upsert(ids[:20], vectors[:20], [""] * 20, [{}] * 20)
+        self.assertIsNone(index._sync().centroids)
+
+        index.upsert(ids[20:], vectors[20:], [""] * 20, [{}] * 20)
+        snapshot = index._sync()
+        self.assertEqual(len(snapshot.centroids), 4)
+        self.assertTrue((snapshot.lists[snapshot.alive] >= 0).all())
+        # Each cluster is one list
+        for cluster in range(4):
+            self.assertEqual(len(set(snapshot.lists[cluster::4])), 1)
+
+        results = index.query(basis(1), 40)
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(int(record.id.split("-")[1]) % 4 == 1 for record in results))
+
+        # Rows written after training are assigned to their list
+        index.upsert(["late"], [basis(2)], [""], [{}])
+        self.assertIn("late", [record.id for record in index.query(basis(2), 40)])
+
+    def test_ivf_is_retrained_when_the_index_doubles(self):
+        rng = np.random.default_rng(0)
+        index = self.index(ivf_min_vectors=20, ivf_lists=2)
+        first_ids, later_ids = [f"a-{i}" for i in range(20)], [f"b-{i}" for i in range(19)]
+        index.upsert(first_ids, [basis(i % 2, 0.05, rng) for i in range(20)], [""] * 20, [{}] * 20)
+        first = index._sync().ivf_version
+        index.upsert(later_ids, [basis(i % 2, 0.05, rng) for i in range(19)], [""] * 19, [{}] * 19)
+        self.assertEqual(index._sync().ivf_version, first)
+        index.upsert(["b-19"], [basis(0)], [""], [{}])
+        self.assertEqual(index._sync().ivf_version, first + 1)
@@ -0,0 +1,200 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from langchain_core.documents import Document
+
+from chat.models import File, IngestionJob
+from chat.utils import bm25, vector_stores
+from chat.utils.process_file import assign_chunk_ids, chunk_id, process_file
+from chat.utils.progress import RecordingProgress
+from chat.utils.upload_storage import get_upload_storage
+from chat.tests.base import IsolatedStoresMixin
+
+
+def paragraphs(*topics) -> str:
+    # Paragraphs longer than the splitter's chunk size, so each topic is its own chunks
+    return "\n\n".join(" ".join([f"{topic} sentence {i}." for i in range(80)]) for topic in topics)
+
+
+class ChunkIdTests(TestCase):
+    def chunk(self, text="Some text", **metadata):
+        return Document(page_content=text, metadata={"source": "a.txt", "file_id": 1, "page": 0, **metadata})
+
+    def test_ignores_character_offsets(self):
+        self.assertEqual(chunk_id(self.chunk(start_index=0)), chunk_id(self.chunk(start_index=500)))
+
+    def test_keyed_by_file_not_display_name(self):
+        self.assertNotEqual(chunk_id(self.chunk(file_id=1)), chunk_id(self.chunk(file_id=2)))
+        self.assertEqual(chunk_id(self.chunk(source="a.txt")), chunk_id(self.chunk(source="b.txt")))
+
+    def test_keyed_by_blob_when_there_is_one(self):
+        blob = chunk_id(self.chunk(blob="ab/cd/abcd.txt"))
+        self.assertEqual(blob, chunk_id(self.chunk(blob="ab/cd/abcd.txt", file_id=2)))
+        self.assertNotEqual(blob, chunk_id(self.chunk(blob="ef/01/ef01.txt")))
+
+    def test_distinguishes_page_content_and_occurrence(self):
+        base = chunk_id(self.chunk())
+        self.assertNotEqual(base, chunk_id(self.chunk(page=1)))
+        self.assertNotEqual(base, chunk_id(self.chunk("Other text")))
+        self.assertNotEqual(base, chunk_id(self.chunk(), occurrence=1))
+
+    def test_counts_occurrences_across_windows(self):
+        occurrences = {}
+        first = assign_chunk_ids([self.chunk(), self.chunk()], occurrences)
+        second = assign_chunk_ids([self.chunk()], occurrences)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(list(second), [chunk_id(self.chunk(), occurrence=2)])
+
+
+class IncrementalUpsertTests(IsolatedStoresMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", "alice@example.com", "pw")
+
+    def chunk_texts(self, file_record) -> list:
+        store = file_record.vector_store()
+        return sorted(record.document for record in store.get(where=file_record.vector_filter()))
+
+    def test_reprocessing_only_embeds_changed_chunks(self):
+        file_record = self.make_file("notes.txt", paragraphs("alpha", "beta", "gamma"), self.user)
+        self.assertEqual(process_file(file_record, self.upload_folder), "Processed")
+        before = set(vector_stores.get_ids(file_record.vector_store(), file_record.vector_filter()))
+
+        self.assertEqual(process_file(file_record, self.upload_folder), "Processed")
+        self.assertEqual(set(vector_stores.get_ids(file_record.vector_store(), file_record.vector_filter())), before)
+
+        # What a different parse of the same blob looks like
+        with open(get_upload_storage().path(file_record.stored_name), "w") as blob:
+            blob.write(paragraphs("alpha", "delta", "gamma"))
+        self.assertEqual(process_file(file_record, self.upload_folder), "Processed")
+        after = set(vector_stores.get_ids(file_record.vector_store(), file_record.vector_filter()))
+        self.assertTrue(before & after, "unchanged chunks were re-added")
+        texts = " ".join(self.chunk_texts(file_record))
+        self.assertIn("delta", texts)
+        self.assertNotIn("beta", texts)
+
+    def test_files_sharing_a_display_name_keep_their_own_chunks(self):
+        first = self.make_file("notes.txt", paragraphs("alpha"), self.user)
+        second = self.make_file("notes.txt", paragraphs("omega"), self.user)
+        self.assertEqual(process_file(first, self.upload_folder), "Processed")
+        self.assertEqual(process_file(second, self.upload_folder), "Processed")
+
+        self.assertTrue(all("alpha" in text for text in self.chunk_texts(first)))
+        self.assertTrue(all("omega" in text for text in self.chunk_texts(second)))
+
+        first.delete()
+        self.assertTrue(self.chunk_texts(second))
+        self.assertFalse(first.vector_store().get(where=first.vector_filter()))
+
+
+class SharedContentTests(IsolatedStoresMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", "alice@example.com", "pw")
+        self.text = paragraphs("alpha", "beta")
+
+    def processed(self, name: str):
+        file_record = self.make_file(name, self.text, self.user)
+        self.assertEqual(process_file(file_record, self.upload_folder), "Processed")
+        file_record.status = "Processed"
+        file_record.save(update_fields=["status"])
+        return file_record
+
+    def test_files_with_the_same_content_share_one_set_of_chunks(self):
+        first = self.processed("notes.txt")
+        store = first.vector_store()
+        count = store.count()
+
+        with mock.patch("chat.utils.process_file.iter_chunk_batches") as parse:
+            second = self.processed("notes (copy).txt")
+        parse.assert_not_called()
+        self.assertEqual(store.count(), count)
+        self.assertEqual(second.vector_filter(), first.vector_filter())
+
+    def test_chunks_go_with_the_last_file_sharing_them(self):
+        first = self.processed("notes.txt")
+        second = self.processed("notes (copy).txt")
+        store = first.vector_store()
+        count = store.count()
+
+        first.delete()
+        self.assertEqual(store.count(), count)
+        metadatas = vector_stores.get_metadatas(store, second.vector_filter()).values()
+        self.assertEqual({metadata["source"] for metadata in metadatas}, {"notes (copy).txt"})
+        self.assertTrue(bm25.get_sparse_index().search("alpha", 1))
+
+        second.delete()
+        self.assertEqual(store.count(), 0)
+        self.assertFalse(bm25.get_sparse_index().search("alpha", 1))
+
+    def test_private_copies_are_shared_per_owner_only(self):
+        bob = User.objects.create_user("bob", "bob@example.com", "pw")
+        mine = self.make_file("notes.txt", self.text, self.user, File.PRIVATE)
+        theirs = self.make_file("notes.txt", self.text, bob, File.PRIVATE)
+        self.assertEqual(list(mine.chunk_sharers()), [mine])
+        process_file(mine, self.upload_folder)
+        process_file(theirs, self.upload_folder)
+        self.assertEqual(mine.vector_store().count(), theirs.vector_store().count())
+        self.assertEqual(theirs.chunk_metadata()["owner_id"], bob.pk)
+
+
+class StampChunkFilesTests(IsolatedStoresMixin, TestCase):
+    def test_stamps_attributable_chunks_and_requeues_the_rest(self):
+        user = User.objects.create_user("alice", "alice@example.com", "pw")
+        only = self.make_file("only.txt", "one", user)
+        shared = [self.make_file("shared.txt", "two", user), self.make_file("shared.txt", "three", user)]
+        copies = [self.make_file("copy.txt", "four", user), self.make_file("copy 2.txt", "four", user)]
+        store = only.vector_store()
+        vectors = vector_stores.get_embeddings().embed_documents(["one", "two", "four", "four"])
+        store.upsert(
+            ["legacy-1", "legacy-2", "per-file-1", "per-file-2"],
+            vectors,
+            ["one", "two", "four", "four"],
+            [{"source": "only.txt"}, {"source": "shared.txt"}]
+            + [{"source": f.filename, "file_id": f.pk} for f in copies],
+        )
+
+        call_command("stamp_chunk_files", stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual([record.id for record in store.get(where=only.vector_filter())], ["legacy-1"])
+        self.assertFalse(store.get(ids=["legacy-2"]))
+        self.assertEqual(
+            sorted(IngestionJob.objects.values_list("file_id", flat=True)), sorted(f.pk for f in shared)
+        )
+        self.assertEqual([record.id for record in store.get(where=copies[1].vector_filter())], ["per-file-1"])
+        self.assertFalse(store.get(ids=["per-file-2"]))
+
+        # Running it again changes nothing
+        out = StringIO()
+        call_command("stamp_chunk_files", stdout=out, stderr=StringIO())
+        self.assertIn("Stamped 0 chunks; 0 duplicate", out.getvalue())
+
+
+class StageRecorder(RecordingProgress):
+    def __init__(self):
+        super().__init__()
+        self.transitions = []
+
+    def start(self, stage: str, total: int = None):
+        if stage != self.current:
+            self.transitions.append(stage)
+        super().start(stage, total)
+
+
+class StageProgressTests(IsolatedStoresMixin, TestCase):
+    @override_settings(INGEST_TEXT_SEGMENT_CHARS=2000, INGEST_WINDOW_PAGES=1, INGEST_MAX_CHUNKS_IN_MEMORY=2)
+    def test_stages_start_when_each_window_reaches_them(self):
+        user = User.objects.create_user("alice", "alice@example.com", "pw")
+        file_record = self.make_file("notes.txt", paragraphs("alpha", "beta", "gamma", "delta"), user)
+        progress = StageRecorder()
+        self.assertEqual(process_file(file_record, self.upload_folder, progress=progress), "Processed")
+
+        stages = progress.transitions
+        self.assertEqual(stages[:2], ["load", "split"])
+        # Streaming: the next window is loaded after the previous one was upserted
+        self.assertIn(["embed", "upsert", "load"], [stages[i:i + 3] for i in range(len(stages) - 2)])
+        self.assertEqual(stages[-1], "upsert")
+        self.assertEqual(progress.stages["upsert"]["done"], progress.stages["split"]["done"])
@@ -0,0 +1,91 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from chat.utils.quantization import Codec, unit
+
+DIM = 64
+
+
+class CodecTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(50, DIM)).astype(np.float32)
+        self.query = rng.normal(size=DIM).astype(np.float32)
+
+    def cosine(self, dims: int = 0) -> np.ndarray:
+        codec = Codec(dims)
+        return codec.project(self.vectors) @ codec.project(self.query)
+
+    def test_rejects_bad_settings(self):
+        with self.assertRaises(ValueError):
+            Codec(0, "int4")
+        with self.assertRaises(ValueError):
+            Codec(-1)
+        with self.assertRaises(ValueError):
+            Codec(128).row_bytes(DIM)
+
+    def test_identity(self):
+        self.assertTrue(Codec().identity)
+        self.assertFalse(Codec(32).identity)
+        self.assertFalse(Codec(0, "int8").identity)
+
+    def test_row_bytes(self):
+        self.assertEqual(Codec().row_bytes(DIM), DIM * 4)
+        self.assertEqual(Codec(32).row_bytes(DIM), 32 * 4)
+        self.assertEqual(Codec(0, "int8").row_bytes(DIM), DIM + 4)
+        self.assertEqual(Codec(0, "binary").row_bytes(DIM), DIM // 8)
+        self.assertEqual(Codec(20, "binary").row_bytes(DIM), 3)
+        for codec in (Codec(), Codec(32, "int8"), Codec(20, "binary")):
+            self.assertEqual(codec.encode(self.vectors).shape, (len(self.vectors), codec.row_bytes(DIM)))
+
+    def test_project_truncates_and_normalizes(self):
+        projected = Codec(16).project(self.vectors)
+        self.assertEqual(projected.shape, (len(self.vectors), 16))
+        np.testing.assert_allclose(np.linalg.norm(projected, axis=1), 1, rtol=1e-5)
+        np.testing.assert_allclose(projected, unit(self.vectors[:, :16]), rtol=1e-5)
+        # A single query and a zero vector work too
+        self.assertEqual(Codec(16).project(self.query).shape, (16,))
+        np.testing.assert_array_equal(Codec().project(np.zeros(DIM)), np.zeros(DIM))
+
+    def test_float_codes_round_trip(self):
+        codec = Codec(32)
+        decoded = codec.decode(codec.encode(self.vectors), DIM)
+        np.testing.assert_array_equal(decoded, codec.project(self.vectors))
+        np.testing.assert_allclose(codec.scores(codec.encode(self.vectors), self.query, DIM), self.cosine(32),
+                                   rtol=1e-5, atol=1e-6)
+
+    def test_int8_codes_are_close(self):
+        codec = Codec(0, "int8")
+        codes = codec.encode(self.vectors)
+        decoded = codec.decode(codes, DIM)
+        np.testing.assert_allclose(np.linalg.norm(decoded, axis=1), 1, rtol=1e-5)
+        self.assertLess(np.abs(decoded - codec.project(self.vectors)).max(), 0.01)
+        np.testing.assert_allclose(codec.scores(codes, self.query, DIM), self.cosine(), atol=0.01)
+        # A zero vector encodes without dividing by zero
+        np.testing.assert_array_equal(codec.decode(codec.encode(np.zeros(DIM)), DIM), np.zeros((1, DIM)))
+
+    def test_binary_codes_keep_signs(self):
+        codec = Codec(0, "binary")
+        codes = codec.encode(self.vectors)
+        decoded = codec.decode(codes, DIM)
+        np.testing.assert_array_equal(np.sign(decoded), np.where(self.vectors > 0, 1, -1))
+        np.testing.assert_allclose(np.linalg.norm(decoded, axis=1), 1, rtol=1e-5)
+
+        # 1 - 2 * hamming / dims, i.e. the cosine of the decoded sign vectors
+        expected = decoded @ codec.decode(codec.encode(self.query), DIM)[0]
+        np.testing.assert_allclose(codec.scores(codes, self.query, DIM), expected, atol=1e-5)
+        self.assertEqual(codec.scores(codec.encode(self.query), self.query, DIM)[0], 1)
+
+    def test_binary_scores_on_rows_that_are_not_whole_words(self):
+        codec = Codec(20, "binary")
+        codes = codec.encode(self.vectors)
+        expected = codec.decode(codes, DIM) @ codec.decode(codec.encode(self.query), DIM)[0]
+        np.testing.assert_allclose(codec.scores(codes, self.query, DIM), expected, atol=1e-5)
+
+    def test_quantized_scores_rank_like_cosine(self):
+        exact = np.argsort(-self.cosine())[:5]
+        for quantization in ("int8", "binary"):
+            codec = Codec(0, quantization)
+            scores = codec.scores(codec.encode(self.vectors), self.query, DIM)
+            # The true best neighbour stays near the top
+            self.assertIn(exact[0], np.argsort(-scores)[:10], quantization)
@@ -0,0 +1,78 @@
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from chat.utils import bm25
+from chat.utils.process_file import process_file
+from chat.utils.retrieval import HybridRetriever, lexical_overlap, reciprocal_rank_fusion, rerank
+from chat.tests.base import IsolatedStoresMixin
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+    def test_ids_ranked_by_both_lists_come_first(self):
+        self.assertEqual(reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "b"]], [1, 1]), ["c", "b", "a", "d"])
+
+    def test_scores_are_weighted_reciprocal_ranks(self):
+        self.assertEqual(reciprocal_rank_fusion([["a"], ["b"]], [1, 2]), ["b", "a"])
+        self.assertEqual(reciprocal_rank_fusion([["a", "b"], ["b"]], [1, 1], rrf_k=0), ["b", "a"])
+
+    def test_zero_weight_drops_a_ranking(self):
+        self.assertEqual(reciprocal_rank_fusion([["a", "b"], ["c"]], [1, 0]), ["a", "b"])
+
+
+class RerankTests(SimpleTestCase):
+    def test_orders_by_similarity_without_diversity(self):
+        vectors = [[1, 0], [0.6, 0.8], [0, 1]]
+        self.assertEqual(rerank("", [1, 0], ["a", "b", "c"], vectors, 3, mmr_lambda=1.0, lexical_weight=0), [0, 1, 2])
+
+    def test_mmr_skips_near_duplicates(self):
+        vectors = [[1, 0], [0.99, 0.14], [0.7, 0.7]]
+        texts = ["a", "b", "c"]
+        self.assertEqual(rerank("", [1, 0], texts, vectors, 2, mmr_lambda=1.0, lexical_weight=0), [0, 1])
+        self.assertEqual(rerank("", [1, 0], texts, vectors, 2, mmr_lambda=0.3, lexical_weight=0), [0, 2])
+
+    def test_lexical_overlap_favours_rare_query_terms(self):
+        texts = ["widget QZ-7781 manual", "widget overview", "widget pricing"]
+        overlap = lexical_overlap("QZ-7781 widget", texts)
+        self.assertEqual(int(overlap.argmax()), 0)
+        self.assertAlmostEqual(float(overlap[0]), 1.0, places=5)
+        vectors = [[0, 1], [1, 0], [1, 0]]
+        self.assertEqual(rerank("QZ-7781 widget", [1, 0], texts, vectors, 1, lexical_weight=0.9), [0])
+
+    def test_compares_truncated_vectors_on_their_leading_dimensions(self):
+        self.assertEqual(rerank("", [0, 1, 5], ["a", "b"], [[1, 0], [0, 1]], 1, lexical_weight=0), [1])
+
+
+class HybridRetrieverTests(IsolatedStoresMixin, TestCase):
+    def test_sparse_side_finds_exact_codes(self):
+        user = User.objects.create_user("alice", "alice@example.com", "pw")
+        text = "\n\n".join(
+            f"Section {i} discusses widgets and gadgets." + (" Part QZ-7781 is special." if i == 17 else "") + " filler" * 150
+            for i in range(30)
+        )
+        file_record = self.make_file("catalog.txt", text, user)
+        self.assertEqual(process_file(file_record, self.upload_folder), "Processed")
+
+        retriever = HybridRetriever(
+            vectorstore=file_record.vector_store(),
+            sparse_index=bm25.get_sparse_index(),
+            search_kwargs={"k": 1},
+            candidates=1,
+            dense_weight=0,
+        )
+        self.assertIn("QZ-7781", retriever.search("QZ-7781")[0].page_content)
+
+    def test_reranks_fused_candidates_down_to_k(self):
+        user = User.objects.create_user("alice", "alice@example.com", "pw")
+        text = "\n\n".join(f"Section {i} on widget colours." + " filler" * 150 for i in range(10))
+        file_record = self.make_file("widgets.txt", text, user)
+        process_file(file_record, self.upload_folder)
+
+        retriever = HybridRetriever(
+            vectorstore=file_record.vector_store(),
+            sparse_index=bm25.get_sparse_index(),
+            search_kwargs={"k": 2},
+            candidates=6,
+        )
+        docs = retriever.search("widget colours")
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(len({doc.id for doc in docs}), 2)
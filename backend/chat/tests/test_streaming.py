@@ -0,0 +1,106 @@
+import json
+import asyncio
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings
+from langchain_core.documents import Document
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.utils.process_file import process_file
+from chat.utils.public_chat import public_ask
+from chat.utils.streaming import sse_response_stream, stream_answer
+from chat.tests.base import IsolatedStoresMixin
+
+
+def parse_events(body: bytes) -> list:
+    events = []
+    for block in body.decode("utf-8").strip().split("\n\n"):
+        kind, data = block.split("\n")
+        events.append((kind[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+class SseResponseStreamTests(SimpleTestCase):
+    def test_ttfb_is_taken_once_the_first_token_was_sent(self):
+        async def events():
+            yield "sources", [Document(page_content="text", metadata={"source": "a.txt"})]
+            yield "token", "Hello"
+            yield "token", " world"
+
+        async def save(reply, sources):
+            self.assertEqual(reply, "Hello world")
+            self.assertEqual(sources[0]["source"], "a.txt")
+
+        async def consume():
+            sent = []
+            async for event in sse_response_stream(events(), "test", save):
+                sent.append(event)
+                if b"event: token" in event:
+                    # A slow client: the server only asks for more once this is written
+                    await asyncio.sleep(0.05)
+            return parse_events(b"".join(sent))
+
+        events_sent = async_to_sync(consume)()
+        self.assertEqual([kind for kind, _ in events_sent], ["sources", "token", "token", "done"])
+        done = events_sent[-1][1]
+        self.assertEqual(done["reply"], "Hello world")
+        self.assertGreaterEqual(done["ttfb_ms"] - done["first_token_ms"], 40)
+
+    def test_errors_become_an_error_event(self):
+        async def events():
+            yield "token", "Hel"
+            raise RuntimeError("LLM went away")
+
+        async def consume():
+            return parse_events(b"".join([event async for event in sse_response_stream(events(), "test", None)]))
+
+        self.assertEqual([kind for kind, _ in async_to_sync(consume)()], ["token", "error"])
+
+
+@override_settings(
+    CHAT_BACKEND="fake", FAKE_CHAT_LATENCY=0, ANSWER_CACHE_ENABLED=False, CONVERSATION_LOG_BUFFERED=False
+)
+class StreamViewTests(IsolatedStoresMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", "alice@example.com", "pw")
+        file_record = self.make_file("widgets.txt", "The XJ-9000 widget ships in blue. " * 50, self.user)
+        process_file(file_record, self.upload_folder)
+        self.client = AsyncClient()
+
+    async def stream(self, path: str, **extra) -> list:
+        response = await self.client.post(path, {"message": "What colour is the XJ-9000?"}, "application/json", **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        return parse_events(b"".join([chunk async for chunk in response.streaming_content]))
+
+    def test_public_stream(self):
+        events = async_to_sync(self.stream)("/api/chat/chat/public/stream/")
+        kinds = [kind for kind, _ in events]
+        self.assertEqual(kinds[0], "sources")
+        self.assertIn("token", kinds)
+        self.assertEqual(kinds[-1], "done")
+        self.assertEqual(events[-1][1]["reply"], "".join(data["text"] for kind, data in events if kind == "token"))
+
+    def test_public_stream_answers_from_the_answer_cache(self):
+        with override_settings(ANSWER_CACHE_ENABLED=True), \
+                mock.patch("chat.utils.public_chat.stream_answer", wraps=stream_answer) as streamed:
+            first = async_to_sync(self.stream)("/api/chat/chat/public/stream/")
+            second = async_to_sync(self.stream)("/api/chat/chat/public/stream/")
+        self.assertEqual(streamed.call_count, 1)
+        self.assertEqual([kind for kind, _ in second], ["sources", "token", "done"])
+        self.assertEqual(second[0][1], first[0][1])
+        self.assertEqual(second[-1][1]["reply"], first[-1][1]["reply"])
+        # Streamed and non-streamed answers share the cache
+        self.assertEqual(public_ask("What colour is the XJ-9000?")["result"], first[-1][1]["reply"])
+
+    def test_private_stream_requires_a_token(self):
+        response = async_to_sync(self.client.post)("/api/chat/chat/private/stream/", {"message": "hi"}, "application/json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_private_stream(self):
+        token = AccessToken.for_user(self.user)
+        events = async_to_sync(self.stream)("/api/chat/chat/private/stream/", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(events[-1][0], "done")
@@ -0,0 +1,131 @@
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.urls import path
+
+from chat.utils import metrics, tracing
+
+
+def traced(request):
+    with tracing.span("retrieval.dense", endpoint="test"):
+        pass
+    with tracing.span("llm", endpoint="test"):
+        pass
+    return HttpResponse("ok")
+
+
+async def traced_async(request):
+    with tracing.span("llm", endpoint="test"):
+        pass
+    return HttpResponse("ok")
+
+
+urlpatterns = [
+    path("traced/", traced, name="traced"),
+    path("traced-async/", traced_async, name="traced-async"),
+]
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_percentiles_over_the_recent_window(self):
+        for value in range(1, 101):
+            metrics.observe("latency", value / 100, endpoint="a")
+        [series] = metrics.snapshot()
+        self.assertEqual((series["count"], series["labels"]), (100, {"endpoint": "a"}))
+        self.assertAlmostEqual(series["sum"], 50.5)
+        self.assertEqual((series["p50"], series["p95"], series["p99"]), (0.51, 0.96, 1.0))
+
+        # Percentiles only see the last RESERVOIR_SIZE values; count and sum see all
+        for _ in range(metrics.RESERVOIR_SIZE):
+            metrics.observe("latency", 2.0, endpoint="a")
+        [series] = metrics.snapshot()
+        self.assertEqual(series["p50"], 2.0)
+        self.assertEqual(series["count"], 100 + metrics.RESERVOIR_SIZE)
+
+    def test_render_prometheus(self):
+        metrics.observe("rag_stage_seconds", 0.5, stage="llm", endpoint='say "hi"')
+        metrics.observe("rag_stage_seconds", 1.5, stage="llm", endpoint='say "hi"')
+        metrics.observe("http.request", 0.25)
+
+        self.assertEqual(metrics.render_prometheus(), "\n".join([
+            "# TYPE http_request summary",
+            'http_request{quantile="0.5"} 0.25',
+            'http_request{quantile="0.95"} 0.25',
+            'http_request{quantile="0.99"} 0.25',
+            "http_request_sum 0.25",
+            "http_request_count 1",
+            "# TYPE rag_stage_seconds summary",
+            'rag_stage_seconds{endpoint="say \\"hi\\"",stage="llm",quantile="0.5"} 1.5',
+            'rag_stage_seconds{endpoint="say \\"hi\\"",stage="llm",quantile="0.95"} 1.5',
+            'rag_stage_seconds{endpoint="say \\"hi\\"",stage="llm",quantile="0.99"} 1.5',
+            'rag_stage_seconds_sum{endpoint="say \\"hi\\"",stage="llm"} 2.0',
+            'rag_stage_seconds_count{endpoint="say \\"hi\\"",stage="llm"} 2',
+        ]) + "\n")
+
+
+@override_settings(ROOT_URLCONF=__name__, TRACING_ENABLED=True, TRACING_SLOW_REQUEST_SECONDS=0)
+class TracingTests(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def series(self, name: str) -> dict:
+        return {tuple(sorted(s["labels"].items())): s for s in metrics.snapshot() if s["name"] == name}
+
+    def test_span_observes_its_stage(self):
+        with tracing.span("retrieval.dense", endpoint="public") as span:
+            pass
+        self.assertGreaterEqual(span.duration, 0)
+        [series] = self.series(tracing.STAGE_METRIC).values()
+        self.assertEqual(series["labels"], {"stage": "retrieval.dense", "endpoint": "public"})
+        self.assertEqual(series["count"], 1)
+
+    def test_spans_are_a_no_op_when_disabled(self):
+        with override_settings(TRACING_ENABLED=False):
+            with tracing.span("llm"):
+                pass
+            response = self.client.get("/traced/")
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(metrics.snapshot(), [])
+
+    def test_server_timing_lists_the_request_spans(self):
+        response = self.client.get("/traced/")
+        stages = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["retrieval.dense", "llm"])
+        self.assertTrue(all(";dur=" in entry for entry in response["Server-Timing"].split(", ")))
+        self.assertIn((("method", "GET"), ("view", "traced")), self.series(tracing.REQUEST_METRIC))
+
+    def test_server_timing_on_async_views(self):
+        response = async_to_sync(AsyncClient().get)("/traced-async/")
+        self.assertEqual(response["Server-Timing"].split(";")[0], "llm")
+
+    def test_slow_requests_are_logged_with_their_spans(self):
+        with override_settings(TRACING_SLOW_REQUEST_SECONDS=0.000001), \
+                self.assertLogs("chat.utils.tracing", "WARNING") as logs:
+            self.client.get("/traced/")
+        self.assertIn("retrieval.dense=", logs.output[0])
+
+
+class MetricsEndpointTests(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_metrics_endpoint(self):
+        metrics.observe("rag_stage_seconds", 0.5, stage="llm")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('rag_stage_seconds_count{stage="llm"} 1', response.content.decode())
+
+    def test_metrics_token_is_required_when_set(self):
+        with override_settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            wrong = self.client.get("/metrics", headers={"Authorization": "Bearer nope"})
+            self.assertEqual(wrong.status_code, 401)
+            right = self.client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+            self.assertEqual(right.status_code, 200)
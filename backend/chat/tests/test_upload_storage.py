@@ -0,0 +1,156 @@
+import os
+import hashlib
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from chat.models import File
+from chat.tests.base import IsolatedStoresMixin
+from chat.utils.upload_storage import ShardedFileSystemStorage, blob_name, get_upload_storage, local_path
+
+
+class FailingContent(ContentFile):
+    """
+    Content whose reading fails after the first chunk, like a dropped upload.
+    """
+
+    def chunks(self, chunk_size=None):
+        yield b"partial"
+        raise OSError("connection reset")
+
+
+class MemoryStorage(Storage):
+    """
+    Storage without local paths, like an object store.
+    """
+
+    def __init__(self, blobs: dict):
+        self.blobs = blobs
+
+    def _open(self, name, mode="rb"):
+        return ContentFile(self.blobs[name], name=name)
+
+
+class ShardedFileSystemStorageTests(IsolatedStoresMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ShardedFileSystemStorage(location=os.path.join(self.workdir, "storage"))
+
+    def leftovers(self) -> list:
+        return [name for _, _, names in os.walk(self.storage.location) for name in names if name.startswith(".tmp-")]
+
+    def test_blob_name_is_sharded_on_the_content_hash(self):
+        content_hash = hashlib.sha256(b"content").hexdigest()
+        self.assertEqual(
+            blob_name(content_hash, "Report.Final.PDF"),
+            f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.pdf",
+        )
+        self.assertEqual(blob_name(content_hash, "README"), f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}")
+
+    def test_saving_an_existing_name_replaces_it(self):
+        self.assertEqual(self.storage.save("ab/cd/abcd.txt", ContentFile(b"one")), "ab/cd/abcd.txt")
+        self.assertEqual(self.storage.save("ab/cd/abcd.txt", ContentFile(b"one")), "ab/cd/abcd.txt")
+        self.assertEqual(self.storage.listdir("ab/cd")[1], ["abcd.txt"])
+        self.assertEqual(self.leftovers(), [])
+
+    def test_a_failed_write_leaves_the_existing_blob_alone(self):
+        self.storage.save("ab/cd/abcd.txt", ContentFile(b"complete"))
+        with self.assertRaises(OSError):
+            self.storage.save("ab/cd/abcd.txt", FailingContent(b""))
+        with self.storage.open("ab/cd/abcd.txt") as blob:
+            self.assertEqual(blob.read(), b"complete")
+        self.assertEqual(self.leftovers(), [])
+
+    def test_temporary_uploads_are_moved_into_place(self):
+        upload = TemporaryUploadedFile("a.txt", "text/plain", 7, "utf-8")
+        self.addCleanup(upload.close)
+        upload.write(b"content")
+        upload.flush()
+        temporary = upload.temporary_file_path()
+
+        self.storage.save("ab/cd/abcd.txt", upload)
+        self.assertFalse(os.path.exists(temporary))
+        with self.storage.open("ab/cd/abcd.txt") as blob:
+            self.assertEqual(blob.read(), b"content")
+
+    def test_local_path_copies_from_remote_storage(self):
+        self.storage.save("ab/cd/abcd.txt", ContentFile(b"content"))
+        with local_path(self.storage, "ab/cd/abcd.txt") as path:
+            self.assertEqual(path, self.storage.path("ab/cd/abcd.txt"))
+
+        with local_path(MemoryStorage({"ab/cd/abcd.txt": b"content"}), "ab/cd/abcd.txt") as path:
+            self.assertTrue(path.endswith(".txt"))
+            with open(path, "rb") as copy:
+                self.assertEqual(copy.read(), b"content")
+        self.assertFalse(os.path.exists(path))
+
+
+class MigrateUploadsTests(IsolatedStoresMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", "alice@example.com", "pw")
+
+    def flat_file(self, filename: str, content: bytes = None, stored_name: str = "") -> File:
+        if content is not None:
+            with open(os.path.join(self.upload_folder, stored_name or filename), "wb") as f:
+                f.write(content)
+        return File.objects.create(filename=filename, user=self.user, stored_name=stored_name)
+
+    def migrate(self, *args) -> str:
+        out, err = StringIO(), StringIO()
+        call_command("migrate_uploads", "--folder", self.upload_folder, *args, stdout=out, stderr=err)
+        return out.getvalue() + err.getvalue()
+
+    def test_flat_files_move_into_upload_storage(self):
+        first = self.flat_file("notes.txt", b"shared content")
+        second = self.flat_file("notes.txt")
+        renamed = self.flat_file("Report.PDF", b"%PDF report", stored_name="report-1.pdf")
+        missing = self.flat_file("gone.txt")
+
+        output = self.migrate()
+        self.assertIn("Migrated 3 files to upload storage; 1 missing on disk.", output)
+
+        content_hash = hashlib.sha256(b"shared content").hexdigest()
+        for file_record in (first, second):
+            file_record.refresh_from_db()
+            self.assertEqual(file_record.stored_name, blob_name(content_hash, "notes.txt"))
+            self.assertEqual(file_record.content_hash, content_hash)
+        renamed.refresh_from_db()
+        self.assertEqual(renamed.stored_name, blob_name(hashlib.sha256(b"%PDF report").hexdigest(), "report-1.pdf"))
+        missing.refresh_from_db()
+        self.assertEqual(missing.stored_name, "")
+
+        storage = get_upload_storage()
+        with storage.open(first.stored_name) as blob:
+            self.assertEqual(blob.read(), b"shared content")
+        self.assertEqual(os.listdir(self.upload_folder), [])
+
+        # Nothing is left to migrate
+        self.assertIn("Migrated 0 files", self.migrate())
+
+    def test_dry_run_and_keep_flat(self):
+        file_record = self.flat_file("notes.txt", b"content")
+
+        self.assertIn("Would migrate 1 files", self.migrate("--dry-run"))
+        file_record.refresh_from_db()
+        self.assertEqual(file_record.stored_name, "")
+
+        self.migrate("--keep-flat")
+        file_record.refresh_from_db()
+        self.assertTrue(get_upload_storage().exists(file_record.stored_name))
+        self.assertEqual(os.listdir(self.upload_folder), ["notes.txt"])
+
+    def test_a_failed_copy_leaves_the_rows_as_they_were(self):
+        file_record = self.flat_file("notes.txt", b"content")
+        with mock.patch("chat.management.commands.migrate_uploads.store_blob", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.migrate()
+        file_record.refresh_from_db()
+        self.assertEqual((file_record.stored_name, file_record.content_hash), ("", ""))
+        self.assertEqual(os.listdir(self.upload_folder), ["notes.txt"])
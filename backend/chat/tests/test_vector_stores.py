@@ -0,0 +1,91 @@
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from chat.utils import bm25, vector_stores
+from chat.tests.base import IsolatedStoresMixin
+
+
+class RegistryTests(SimpleTestCase):
+    def setUp(self):
+        vector_stores.reset()
+        self.addCleanup(vector_stores.reset)
+
+    def test_builds_once_per_key(self):
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return object()
+
+        first = vector_stores.get_or_create("test:once", factory)
+        self.assertIs(vector_stores.get_or_create("test:once", factory), first)
+        self.assertEqual(len(calls), 1)
+
+    def test_factory_may_resolve_other_entries(self):
+        # A store factory resolves the shared embeddings through the same registry
+        result = {}
+
+        def build_outer():
+            return "outer", vector_stores.get_or_create("test:inner", object)
+
+        def resolve():
+            result["outer"] = vector_stores.get_or_create("test:outer", build_outer)
+
+        worker = threading.Thread(target=resolve, daemon=True)
+        worker.start()
+        worker.join(timeout=5)
+        self.assertFalse(worker.is_alive(), "nested get_or_create deadlocked")
+        self.assertEqual(result["outer"][0], "outer")
+        self.assertIs(result["outer"][1], vector_stores.get_or_create("test:inner", object))
+
+    def test_rebuilds_after_fork(self):
+        first = vector_stores.get_or_create("test:fork", object)
+        # What a forked child sees: the parent's instances under another pid
+        vector_stores._owner_pid = -1
+        self.assertIsNot(vector_stores.get_or_create("test:fork", object), first)
+
+    @override_settings(PRIVATE_STORE_CACHE_SIZE=2)
+    def test_evicts_and_closes_least_recently_used(self):
+        closed = []
+
+        class Store:
+            def __init__(self, name):
+                self.name = name
+
+            def close(self):
+                closed.append(self.name)
+
+        stores = {name: vector_stores.get_or_create(name, lambda n=name: Store(n), evictable=True) for name in "ab"}
+        vector_stores.get_or_create("a", lambda: Store("a2"), evictable=True)
+        vector_stores.get_or_create("c", lambda: Store("c"), evictable=True)
+        self.assertEqual(closed, ["b"])
+        self.assertIs(vector_stores.get_or_create("a", lambda: Store("a3"), evictable=True), stores["a"])
+        self.assertIsNot(vector_stores.get_or_create("b", lambda: Store("b2"), evictable=True), stores["b"])
+        # Shared entries are never evicted
+        shared = vector_stores.get_or_create("shared", object)
+        for name in "xyz":
+            vector_stores.get_or_create(name, lambda n=name: Store(n), evictable=True)
+        self.assertIs(vector_stores.get_or_create("shared", object), shared)
+
+
+class PrivateStoreCacheTests(IsolatedStoresMixin, SimpleTestCase):
+    @override_settings(PRIVATE_STORE_CACHE_SIZE=2)
+    def test_evicted_indexes_are_closed_and_reopen(self):
+        vectors = vector_stores.get_embeddings().embed_documents(["one"])
+        store = vector_stores.get_private_store(1)
+        store.upsert(["a"], vectors, ["one"], [{"owner_id": 1}])
+        index = bm25.get_sparse_index(vector_stores.PRIVATE, 1)
+        index.add(["a"], ["one"])
+        index.flush()
+        self.assertEqual(store.query(vectors[0], 1)[0].id, "a")
+        self.assertEqual(index.search("one", 1)[0][0], "a")
+
+        vector_stores.get_private_store(2)
+        bm25.get_sparse_index(vector_stores.PRIVATE, 2)
+        self.assertEqual(store._connections, [])
+        self.assertEqual(store._snapshot.version, 0)
+        self.assertIsNot(vector_stores.get_private_store(1), store)
+        # A caller still holding the closed index can keep using it
+        self.assertEqual(store.query(vectors[0], 1)[0].id, "a")
+        self.assertEqual(index.search("one", 1)[0][0], "a")
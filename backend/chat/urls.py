@@ -1,11 +1,18 @@
 from django.urls import path
+from . import async_views
 from .views import (
     FileUploadView,
+    BulkUploadView,
     FileDeleteView,
     FileProcessView,
+    IngestionJobView,
+    IngestionBatchView,
     PublicChatView,
     PrivateChatView,
-    PrivateChatHistoryView
+    PrivateChatHistoryView,
+    EmbeddingCacheStatsView,
+    AnswerCacheStatsView,
+    MetricsView
 )
 
 app_name = "chat"
@@ -13,14 +20,26 @@ app_name = "chat"
 urlpatterns = [
     # File endpoints
     path("files/", FileUploadView.as_view(), name="upload"),
+    path("files/bulk/", BulkUploadView.as_view(), name="bulk-upload"),
     path("files/<int:pk>/", FileDeleteView.as_view(), name="delete"),
     path("files/<int:pk>/process/", FileProcessView.as_view(), name="process"),
+    path("jobs/<int:pk>/", IngestionJobView.as_view(), name="job"),
+    path("batches/<int:pk>/", IngestionBatchView.as_view(), name="batch"),
 
     # Chat endpoints
     path("chat/public/", PublicChatView.as_view(), name="public"),
     path("chat/private/", PrivateChatView.as_view(), name="private"),
+    path("chat/public/stream/", async_views.public_chat_stream, name="public-stream"),
+    path("chat/private/stream/", async_views.private_chat_stream, name="private-stream"),
+    path("chat/async/public/", async_views.public_chat, name="public-async"),
+    path("chat/async/private/", async_views.private_chat, name="private-async"),
 
     # Chat history
     path("chat/private/history/", PrivateChatHistoryView.as_view(), name="private-history"),
 
+    # Admin stats
+    path("stats/embedding-cache/", EmbeddingCacheStatsView.as_view(), name="embedding-cache-stats"),
+    path("stats/answer-cache/", AnswerCacheStatsView.as_view(), name="answer-cache-stats"),
+    path("stats/metrics/", MetricsView.as_view(), name="metrics"),
+
 ]
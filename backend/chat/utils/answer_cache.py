@@ -0,0 +1,191 @@
+import os
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from chat.utils import vector_stores
+
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(question: str) -> str:
+    """
+    Case-, whitespace- and punctuation-insensitive form used as the exact key.
+    """
+    text = PUNCTUATION_RE.sub(" ", question.lower())
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def generation_path() -> str:
+    return str(settings.ANSWER_CACHE_GENERATION_PATH)
+
+
+def current_generation() -> str:
+    """
+    Version of the public collection; changes whenever it is written to.
+    """
+    try:
+        with open(generation_path()) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def invalidate_public_answers():
+    """
+    Mark every cached public answer stale, in all processes. Called after
+    `process_file` or `File.delete` touch the public collection.
+    """
+    path = generation_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(tmp_path, path)
+
+
+class CachedAnswer:
+    __slots__ = ("query", "vector", "output", "expires_at")
+
+    def __init__(self, query: str, vector: np.ndarray, output: dict, expires_at: float):
+        self.query = query
+        self.vector = vector
+        self.output = output
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    Two-level cache of public chat answers, kept in process memory.
+
+    1. Exact: the normalized question.
+    2. Semantic: the cached question whose embedding is closest to the new
+       one, if the cosine similarity is at least `threshold`.
+
+    Entries expire after `ttl` seconds, the least recently used are evicted
+    beyond `max_entries`, and everything is dropped when the public
+    collection generation changes (see `invalidate_public_answers`).
+    """
+
+    def __init__(self, ttl: float, threshold: float, max_entries: int):
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._generation = current_generation()
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    def _check_generation(self):
+        generation = current_generation()
+        if generation != self._generation:
+            if self._entries:
+                self.counters["invalidations"] += 1
+            self._entries.clear()
+            self._matrix = None
+            self._generation = generation
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def get_exact(self, question: str):
+        """
+        Cached output for `question` itself, or None.
+        """
+        key = normalize_query(question)
+        with self._lock:
+            self._check_generation()
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.time():
+                return None
+            self._entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return entry.output
+
+    def get_similar(self, vector):
+        """
+        Cached output for the most similar question within the threshold, or None.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            self._check_generation()
+            self._expire(time.time())
+            if not self._entries:
+                self.counters["misses"] += 1
+                return None
+            if self._matrix is None:
+                self._matrix = (list(self._entries), np.stack([e.vector for e in self._entries.values()]))
+            keys, matrix = self._matrix
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(keys[best])
+            self.counters["semantic_hits"] += 1
+            return self._entries[keys[best]].output
+
+    def put(self, question: str, vector, output: dict, generation: str = None):
+        """
+        Cache `output` for `question`. Pass the `current_generation()` read
+        before retrieval so answers built from a collection that has changed
+        since are not stored.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        key = normalize_query(question)
+        with self._lock:
+            self._check_generation()
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = CachedAnswer(key, vector, output, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "similarity_threshold": self.threshold,
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+
+def get_answer_cache():
+    """
+    Process-wide public answer cache, or None when ANSWER_CACHE_ENABLED is off.
+    """
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    return vector_stores.get_or_create(
+        "answer_cache",
+        lambda: AnswerCache(
+            ttl=settings.ANSWER_CACHE_TTL,
+            threshold=settings.ANSWER_CACHE_SIMILARITY,
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+        ),
+    )
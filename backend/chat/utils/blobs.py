@@ -0,0 +1,123 @@
+import os
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+
+from chat.models import blob_lock
+from chat.utils.upload_storage import blob_name, get_upload_storage, local_path
+
+logger = logging.getLogger(__name__)
+
+
+class SpooledUpload(DjangoFile):
+    """
+    A fully received upload in a local temporary file, which local storage
+    can rename into place instead of copying.
+    """
+
+    def temporary_file_path(self) -> str:
+        return self.file.name
+
+
+class SpooledBlob:
+    """
+    Uploaded content spooled to a local temporary file and hashed, ready to
+    be stored under its content-addressed `stored_name` by `store_blob`.
+    Closing it removes the temporary file unless storage took it over.
+    """
+
+    def __init__(self, path: str, name: str, content_hash: str, size: int):
+        self.path = path
+        self.name = name
+        self.content_hash = content_hash
+        self.stored_name = blob_name(content_hash, name)
+        self.size = size
+
+    def close(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def spool_blob(chunks, name: str, max_bytes: int = None):
+    """
+    Spool `chunks` to a temporary file (in FILE_UPLOAD_TEMP_DIR), hashing
+    them on the way. Returns a SpooledBlob, or None if the content exceeds
+    `max_bytes`.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, spool_path = tempfile.mkstemp(dir=settings.FILE_UPLOAD_TEMP_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    os.remove(spool_path)
+                    return None
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        os.remove(spool_path)
+        raise
+    return SpooledBlob(spool_path, name, digest.hexdigest(), size)
+
+
+def store_blob(blob: SpooledBlob, storage=None) -> bool:
+    """
+    Store a spooled blob, unless the storage already holds that content.
+    Returns whether it was written.
+
+    Create the Files pointing at `blob.stored_name` first: the check and
+    the write hold `blob_lock`, as does deleting a blob with its last File
+    (`File.delete_from_filesystem`), so a blob a new File was found to use
+    is never deleted under it.
+    """
+    storage = storage or get_upload_storage()
+    with blob_lock(blob.stored_name):
+        if storage.exists(blob.stored_name):
+            logger.info(f"Upload {blob.name} has the same content as blob {blob.stored_name}; reusing it")
+            return False
+        with open(blob.path, "rb") as spool:
+            saved = storage.save(blob.stored_name, SpooledUpload(spool, name=blob.stored_name))
+    if saved != blob.stored_name:
+        # Stored meanwhile without a File to lock, and this storage keeps
+        # both copies (ShardedFileSystemStorage overwrites instead)
+        storage.delete(saved)
+    return True
+
+
+def save_blob(chunks, name: str, max_bytes: int = None, storage=None):
+    """
+    `spool_blob` and `store_blob` in one go, for content no File points at
+    yet. Returns (stored name, content hash, bytes read), or None if the
+    content exceeds `max_bytes`.
+    """
+    blob = spool_blob(chunks, name, max_bytes)
+    if blob is None:
+        return None
+    with blob:
+        store_blob(blob, storage)
+    return blob.stored_name, blob.content_hash, blob.size
+
+
+@contextmanager
+def blob_path(file_record, upload_folder: str):
+    """
+    Local path of a File's content: its blob in upload storage or, for rows
+    saved before it (no `stored_name`), `upload_folder`/filename.
+    """
+    if not file_record.stored_name:
+        yield os.path.join(upload_folder, file_record.filename)
+        return
+    with local_path(get_upload_storage(), file_record.stored_name) as path:
+        yield path
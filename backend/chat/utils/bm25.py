@@ -0,0 +1,424 @@
+import os
+import re
+import copy
+import json
+import math
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from chat.utils import vector_stores
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+
+# BM25 parameters (Robertson/Sparck Jones defaults)
+K1 = 1.2
+B = 0.75
+
+# Compact into one segment beyond this many segments or this deleted share
+MAX_SEGMENTS = 8
+MAX_DELETED_RATIO = 0.25
+
+# Buffered documents flushed as one segment
+WRITE_BUFFER_DOCS = 5000
+
+SEGMENT_ARRAYS = ("terms", "offsets", "postings", "tfs", "lengths", "ids")
+
+
+def term_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercased word tokens; codes like "AB-1234" become "ab" and "1234".
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+def build_segment_arrays(term_ids, doc_ids, tfs, lengths, ids) -> dict:
+    """
+    Sort (term, doc, tf) postings by term and doc into CSR-style arrays:
+    postings of terms[i] are postings[offsets[i]:offsets[i + 1]].
+    """
+    term_ids = np.asarray(term_ids, dtype=np.uint64)
+    doc_ids = np.asarray(doc_ids, dtype=np.int32)
+    tfs = np.asarray(tfs, dtype=np.uint16)
+    order = np.lexsort((doc_ids, term_ids))
+    term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+    terms, starts = np.unique(term_ids, return_index=True)
+    return {
+        "terms": terms,
+        "offsets": np.append(starts, len(term_ids)).astype(np.int64),
+        "postings": doc_ids,
+        "tfs": tfs,
+        "lengths": np.asarray(lengths, dtype=np.uint32),
+        "ids": np.asarray(ids, dtype=np.bytes_) if len(ids) else np.zeros(0, dtype="S1"),
+    }
+
+
+class Segment:
+    """
+    Immutable, memory-mapped slice of the index.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        for name in SEGMENT_ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def postings_for(self, term: int):
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return None, None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.postings[start:end], self.tfs[start:end]
+
+    def expanded(self):
+        """
+        (term, doc, tf) for every posting, e.g. for merging.
+        """
+        counts = np.diff(self.offsets)
+        return np.repeat(np.asarray(self.terms), counts), np.asarray(self.postings), np.asarray(self.tfs)
+
+
+class Snapshot:
+    """
+    The index as of one manifest: its mapped segments and tombstones, and
+    the live document count and length BM25 scores against. Never modified
+    once published, so searches run on it without holding the lock.
+    """
+
+    def __init__(self, stamp=None, manifest: dict = None, segments: dict = None):
+        self.stamp = stamp
+        self.manifest = manifest or {"segments": [], "deleted": {}, "next": 1}
+        self.segments = segments or {}  # {name: Segment}
+        self.live = {}                  # {name: bool mask}, for segments with tombstones
+        self.docs = 0
+        total_length = 0
+        for meta in self.manifest["segments"]:
+            deleted = self.manifest["deleted"].get(meta["name"])
+            self.docs += meta["docs"]
+            total_length += meta["total_length"]
+            if deleted:
+                segment = self.segments[meta["name"]]
+                live = np.ones(len(segment), dtype=bool)
+                live[deleted] = False
+                self.live[meta["name"]] = live
+                self.docs -= len(deleted)
+                total_length -= int(np.asarray(segment.lengths)[deleted].sum())
+        self.avg_length = total_length / self.docs if self.docs else 0.0
+
+
+class SparseIndex:
+    """
+    Incremental on-disk BM25 index for one vector store collection.
+
+    Documents are added in immutable segments of numpy arrays that readers
+    memory-map, so opening the index costs almost nothing. Deletes are
+    tombstones in `manifest.json`; segments are merged once there are too
+    many of them or too many tombstones. Writers from several processes are
+    serialized with a file lock (where fcntl is available); readers pick up a new manifest on their
+    next search, as a new snapshot swapped in under a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._write_mutex = threading.Lock()
+        self._snapshot = Snapshot()
+        self._manifest = self._snapshot.manifest  # writers' copy, under the file lock
+        self._pending = []
+
+    # Manifest / segment loading
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def _refresh(self, force: bool = False) -> Snapshot:
+        """
+        Publish a new snapshot if the manifest changed since the current one,
+        mapping only the segments it does not have yet.
+        """
+        try:
+            stamp = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._snapshot
+        current = self._snapshot
+        if stamp == current.stamp and not force:
+            return current
+        with self._lock:
+            current = self._snapshot
+            if stamp == current.stamp and not force:
+                return current
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            segments = {}
+            for meta in manifest["segments"]:
+                name = meta["name"]
+                segments[name] = current.segments.get(name) or Segment(os.path.join(self.path, name))
+            self._snapshot = Snapshot(stamp, manifest, segments)
+            return self._snapshot
+
+    def _write_manifest(self):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._refresh(force=True)
+
+    @contextmanager
+    def _write_lock(self):
+        with self._write_mutex, open(os.path.join(self.path, "lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._manifest = copy.deepcopy(self._refresh(force=True).manifest)
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_segment(self, arrays: dict) -> dict:
+        name = f"seg-{self._manifest['next']:06d}"
+        self._manifest["next"] += 1
+        tmp_dir = os.path.join(self.path, f"{name}.{os.getpid()}.tmp")
+        os.makedirs(tmp_dir)
+        for key, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{key}.npy"), array)
+        os.replace(tmp_dir, os.path.join(self.path, name))
+        return {"name": name, "docs": int(len(arrays["lengths"])), "total_length": int(arrays["lengths"].sum())}
+
+    # Writes
+
+    def add(self, ids, texts):
+        """
+        Buffer documents; they are written by `flush` (automatically once
+        WRITE_BUFFER_DOCS are pending).
+        """
+        for id_, text in zip(ids, texts):
+            counts = Counter(term_hash(token) for token in tokenize(text))
+            self._pending.append((id_, counts, sum(counts.values())))
+        if len(self._pending) >= WRITE_BUFFER_DOCS:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered documents as a new segment (replacing older copies of
+        the same ids) and compact if needed.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        term_ids, doc_ids, tfs = [], [], []
+        for doc, (_, counts, _) in enumerate(pending):
+            term_ids.extend(counts.keys())
+            doc_ids.extend([doc] * len(counts))
+            tfs.extend(min(tf, 65535) for tf in counts.values())
+        arrays = build_segment_arrays(
+            term_ids, doc_ids, tfs,
+            lengths=[length for _, _, length in pending],
+            ids=[id_ for id_, _, _ in pending],
+        )
+        with self._write_lock():
+            self._tombstone({id_ for id_, _, _ in pending})
+            self._manifest["segments"].append(self._write_segment(arrays))
+            self._write_manifest()
+            self._maybe_compact()
+
+    def delete(self, ids) -> int:
+        """
+        Tombstone documents by id. Returns how many were found.
+        """
+        self.flush()
+        ids = set(ids)
+        if not ids:
+            return 0
+        with self._write_lock():
+            removed = self._tombstone(ids)
+            if removed:
+                self._write_manifest()
+                self._maybe_compact()
+        return removed
+
+    def _tombstone(self, ids: set) -> int:
+        wanted = np.asarray(sorted(ids), dtype=np.bytes_)
+        segments = self._snapshot.segments
+        removed = 0
+        for meta in self._manifest["segments"]:
+            segment = segments[meta["name"]]
+            hits = np.nonzero(np.isin(segment.ids, wanted))[0].tolist()
+            deleted = set(self._manifest["deleted"].get(meta["name"], []))
+            new = [doc for doc in hits if doc not in deleted]
+            if new:
+                self._manifest["deleted"][meta["name"]] = sorted(deleted.union(new))
+                removed += len(new)
+        return removed
+
+    def _maybe_compact(self):
+        segments = self._manifest["segments"]
+        total = sum(meta["docs"] for meta in segments)
+        deleted = sum(len(docs) for docs in self._manifest["deleted"].values())
+        if len(segments) > MAX_SEGMENTS or (total and deleted / total > MAX_DELETED_RATIO):
+            self._compact()
+
+    def _compact(self):
+        """
+        Merge every segment into one, dropping tombstoned documents.
+        """
+        started = time.perf_counter()
+        old = list(self._manifest["segments"])
+        segments = self._snapshot.segments
+        term_parts, doc_parts, tf_parts, lengths, ids = [], [], [], [], []
+        base = 0
+        for meta in old:
+            segment = segments[meta["name"]]
+            live = np.ones(len(segment), dtype=bool)
+            live[self._manifest["deleted"].get(meta["name"], [])] = False
+            new_index = np.cumsum(live) - 1 + base
+            terms, docs, tfs = segment.expanded()
+            keep = live[docs]
+            term_parts.append(terms[keep])
+            doc_parts.append(new_index[docs[keep]])
+            tf_parts.append(tfs[keep])
+            lengths.append(np.asarray(segment.lengths)[live])
+            ids.append(np.asarray(segment.ids)[live])
+            base += int(live.sum())
+
+        def concat(parts, dtype):
+            return np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+
+        arrays = build_segment_arrays(
+            concat(term_parts, np.uint64), concat(doc_parts, np.int32), concat(tf_parts, np.uint16),
+            lengths=concat(lengths, np.uint32),
+            ids=[value for part in ids for value in part.tolist()],
+        )
+        self._manifest["segments"] = [self._write_segment(arrays)]
+        self._manifest["deleted"] = {}
+        self._write_manifest()
+        # Readers that still map the old files keep them until they reload
+        for meta in old:
+            shutil.rmtree(os.path.join(self.path, meta["name"]), ignore_errors=True)
+        logger.info(f"Compacted {len(old)} BM25 segments in {self.path} ({time.perf_counter() - started:.2f}s)")
+
+    def clear(self):
+        with self._write_lock():
+            for meta in self._manifest["segments"]:
+                shutil.rmtree(os.path.join(self.path, meta["name"]), ignore_errors=True)
+            self._manifest = {"segments": [], "deleted": {}, "next": self._manifest["next"]}
+            self._write_manifest()
+
+    # Reads
+
+    def search(self, query: str, k: int) -> list:
+        """
+        [(id, score)] of the `k` best BM25 matches for `query`.
+        """
+        try:
+            snapshot = self._refresh()
+        except FileNotFoundError:
+            # A compaction removed segments between manifest read and load
+            snapshot = self._refresh(force=True)
+        return self._search(snapshot, query, k)
+
+    @staticmethod
+    def _search(snapshot: Snapshot, query: str, k: int) -> list:
+        docs = snapshot.docs
+        if not docs:
+            return []
+        segments = [(meta["name"], snapshot.segments[meta["name"]]) for meta in snapshot.manifest["segments"]]
+        terms = {term_hash(token) for token in tokenize(query)}
+
+        postings = {}
+        for term in terms:
+            per_segment = [segment.postings_for(term) for _, segment in segments]
+            # Document frequency among live documents only
+            df = 0
+            for (name, _), (doc_ids, _) in zip(segments, per_segment):
+                if doc_ids is not None:
+                    live = snapshot.live.get(name)
+                    df += len(doc_ids) if live is None else int(np.count_nonzero(live[doc_ids]))
+            if df:
+                idf = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+                postings[term] = (idf, per_segment)
+
+        candidates = []
+        for position, (name, segment) in enumerate(segments):
+            scores = None
+            for idf, per_segment in postings.values():
+                doc_ids, tfs = per_segment[position]
+                if doc_ids is None:
+                    continue
+                if scores is None:
+                    scores = np.zeros(len(segment), dtype=np.float32)
+                tf = np.asarray(tfs, dtype=np.float32)
+                norm = K1 * (1 - B + B * np.asarray(segment.lengths[doc_ids], dtype=np.float32) / snapshot.avg_length)
+                scores[doc_ids] += idf * tf * (K1 + 1) / (tf + norm)
+            if scores is None:
+                continue
+            live = snapshot.live.get(name)
+            if live is not None:
+                scores[~live] = 0
+            top = np.nonzero(scores)[0]
+            if len(top) > k:
+                top = top[np.argpartition(-scores[top], k - 1)[:k]]
+            candidates.extend((segment.ids[doc].decode("utf-8"), float(scores[doc])) for doc in top)
+
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:k]
+
+    def close(self):
+        """
+        Write buffered documents and unmap the segments; the next search
+        maps them again. Searches already running keep their own snapshot.
+        """
+        self.flush()
+        with self._lock:
+            self._snapshot = Snapshot()
+
+    def stats(self) -> dict:
+        snapshot = self._refresh()
+        segments = snapshot.manifest["segments"]
+        size = sum(
+            os.path.getsize(os.path.join(self.path, meta["name"], f"{name}.npy"))
+            for meta in segments for name in SEGMENT_ARRAYS
+        )
+        return {
+            "path": self.path,
+            "segments": len(segments),
+            "docs": sum(meta["docs"] for meta in segments),
+            "deleted": sum(len(docs) for docs in snapshot.manifest["deleted"].values()),
+            "size_bytes": size,
+        }
+
+
+def get_sparse_index(information_type: str = vector_stores.PUBLIC, owner_id: int = None) -> SparseIndex:
+    """
+    The BM25 index mirroring `vector_stores.get_vector_store(information_type, owner_id)`.
+    """
+    collection_name = vector_stores.COLLECTION_NAME
+    per_owner = information_type == vector_stores.PRIVATE and owner_id is not None
+    if per_owner:
+        collection_name = vector_stores.private_collection_name(owner_id)
+    path = os.path.join(settings.BM25_INDEX_DIR, information_type.lower(), collection_name)
+    return vector_stores.get_or_create(f"sparse_index:{path}", lambda: SparseIndex(path), evictable=per_owner)
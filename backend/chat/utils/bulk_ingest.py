@@ -0,0 +1,206 @@
+import os
+import logging
+from contextlib import ExitStack
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from langchain_core.documents import Document
+
+from chat.models import File, IngestionJob
+from chat.utils import tracing
+from chat.utils.answer_cache import invalidate_public_answers
+from chat.utils.blobs import blob_path
+from chat.utils.embedding_pipeline import EmbeddingPipeline
+from chat.utils.ingestion_queue import JobProgress, finish_job
+from chat.utils.parse_pool import get_parse_pool, parse_file
+from chat.utils.process_file import SUPPORTED_EXTENSIONS, IncrementalUpsert, assign_chunk_ids, shares_processed_chunks
+
+logger = logging.getLogger(__name__)
+
+
+class BatchItem:
+    """
+    One file of a batch: its job, progress and writer, plus the chunks
+    waiting for the next cross-file embedding flush, and the other files of
+    the batch with the same content, which finish as this one does.
+    """
+
+    def __init__(self, job: IngestionJob):
+        self.job = job
+        self.file = job.file
+        self.path = None
+        self.progress = JobProgress(job)
+        self.writer = None
+        self.added = []
+        self.copies = []
+
+    def chunks_key(self) -> tuple:
+        """
+        Files with the same key share one set of chunks (see `File.vector_filter`).
+        """
+        owner_id = self.file.user_id if self.file.information_type == File.PRIVATE else None
+        return (self.file.information_type, owner_id, self.file.stored_name or self.file.pk)
+
+    def fail(self, error: str):
+        logger.error(f"Bulk ingestion of {self.file.filename} failed: {error}")
+        self.progress.fail(error)
+        finish_job(self.job, self.progress, "Error")
+        for copy in self.copies:
+            copy.fail(error)
+
+    def succeed(self):
+        removed = self.writer.finish()
+        for stage in IngestionJob.STAGES:
+            self.progress.finish(stage)
+        finish_job(self.job, self.progress, "Processed")
+        logger.info(f"Processed {self.file.filename}: {self.writer.added} added, {removed} removed")
+        self.share_with_copies(len(self.writer.seen))
+
+    def share(self, chunks: int):
+        """
+        Finish without parsing: another processed file already stored the
+        `chunks` chunks of this file's content.
+        """
+        for stage in IngestionJob.STAGES:
+            self.progress.finish(stage)
+        finish_job(self.job, self.progress, "Processed")
+        logger.info(f"{self.file.filename} shares the {chunks} chunks of its content")
+        self.share_with_copies(chunks)
+
+    def share_with_copies(self, chunks: int):
+        for copy in self.copies:
+            try:
+                copy.share(chunks)
+            except Exception as e:
+                copy.fail(str(e))
+
+
+class EmbeddingBuffer:
+    """
+    Collects new chunks from several parsed files and embeds them in one
+    `EmbeddingPipeline.embed` call, so small files share full-size batches.
+    """
+
+    def __init__(self, pipeline: EmbeddingPipeline, limit: int):
+        self.pipeline = pipeline
+        self.limit = limit
+        self.items = []
+        self.size = 0
+
+    def add(self, item: BatchItem):
+        self.items.append(item)
+        self.size += len(item.added)
+        if self.size >= self.limit:
+            self.flush()
+
+    def flush(self):
+        items, self.items, self.size = self.items, [], 0
+        if not items:
+            return
+        for item in items:
+            item.progress.start(IngestionJob.EMBED)
+        texts = [chunk.page_content for item in items for _, chunk in item.added]
+        # Identical chunks (e.g. the same document uploaded twice) are embedded once
+        unique = list(dict.fromkeys(texts))
+        try:
+            with tracing.span("ingest.embed"):
+                embedded = dict(zip(unique, self.pipeline.embed(unique)))
+        except Exception as e:
+            for item in items:
+                item.fail(str(e))
+            return
+        vectors = [embedded[text] for text in texts]
+
+        offset = 0
+        for item in items:
+            count = len(item.added)
+            try:
+                item.progress.advance(IngestionJob.EMBED, count)
+                item.writer.add(item.added, vectors[offset:offset + count])
+                item.succeed()
+            except Exception as e:
+                item.fail(str(e))
+            offset += count
+            item.added = []
+
+
+def ingest_batch(jobs: list, upload_folder: str) -> list:
+    """
+    Ingest the files of several claimed jobs together:
+    - Parse each content once: files of the batch with the same content in
+      the same store finish with the first of them
+    - Skip files whose content's chunks another processed file already stored
+    - Load and split the others in the parse pool (INGEST_PARSE_WORKERS)
+    - Diff each parsed file against its store as soon as it comes back
+    - Embed new chunks across files in shared batches of about
+      EMBEDDING_BATCH_SIZE * EMBEDDING_MAX_CONCURRENCY texts
+    - Upsert per file and mark each job finished as its chunks land
+
+    A file that fails only fails its own job and those of its copies.
+    Returns the jobs.
+    """
+    items = [BatchItem(job) for job in jobs]
+    buffer = EmbeddingBuffer(
+        EmbeddingPipeline(),
+        settings.EMBEDDING_BATCH_SIZE * settings.EMBEDDING_MAX_CONCURRENCY,
+    )
+    local_copies = ExitStack()
+
+    runnable = []
+    for item in items:
+        try:
+            item.path = local_copies.enter_context(blob_path(item.file, upload_folder))
+        except Exception as e:
+            item.fail(f"Cannot read {item.file.stored_name}: {e}")
+            continue
+        if not os.path.exists(item.path):
+            item.fail(f"File not found at {item.path}")
+        elif os.path.splitext(item.path)[1].lower() not in SUPPORTED_EXTENSIONS:
+            finish_job(item.job, item.progress, "Unsupported Format")
+        else:
+            runnable.append(item)
+
+    try:
+        with tracing.span("ingest.batch"):
+            parse = []
+            firsts = {}
+            for item in runnable:
+                first = firsts.setdefault(item.chunks_key(), item)
+                if first is not item:
+                    first.copies.append(item)
+                    continue
+                try:
+                    item.writer = IncrementalUpsert(
+                        item.file.vector_store(), item.file.sparse_index(), item.file.vector_filter(), item.progress
+                    )
+                    if item.writer.existing and shares_processed_chunks(item.file):
+                        item.share(len(item.writer.existing))
+                        continue
+                    parse.append(item)
+                except Exception as e:
+                    item.fail(str(e))
+
+            pool = get_parse_pool()
+            futures = {}
+            for item in parse:
+                item.progress.start(IngestionJob.LOAD)
+                futures[pool.submit(parse_file, item.path, item.file.chunk_metadata())] = item
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    pages, chunks = future.result()
+                    item.progress.advance(IngestionJob.LOAD, pages)
+                    item.progress.start(IngestionJob.SPLIT)
+                    item.progress.advance(IngestionJob.SPLIT, len(chunks))
+                    docs = [Document(page_content=text, metadata=metadata) for text, metadata in chunks]
+                    item.added = item.writer.diff(assign_chunk_ids(docs))
+                except Exception as e:
+                    item.fail(str(e))
+                else:
+                    buffer.add(item)
+            buffer.flush()
+    finally:
+        local_copies.close()
+        if any(item.file.information_type == File.PUBLIC for item in runnable):
+            invalidate_public_answers()
+    return jobs
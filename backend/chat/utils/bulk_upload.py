@@ -0,0 +1,120 @@
+import os
+import zipfile
+import logging
+
+from django.db import transaction
+
+from chat.models import File, IngestionBatch, IngestionJob
+from chat.utils.blobs import spool_blob, store_blob
+from chat.utils.process_file import SUPPORTED_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def iter_members(uploads):
+    """
+    Yield (name, stream, error) for every uploaded file, expanding zip
+    archives member by member without extracting them in memory. Names are
+    reduced to their base name, like single uploads.
+    """
+    for upload in uploads:
+        if not upload.name.lower().endswith(".zip"):
+            yield os.path.basename(upload.name), upload, None
+            continue
+        try:
+            archive = zipfile.ZipFile(upload)
+        except zipfile.BadZipFile:
+            yield os.path.basename(upload.name), None, "Not a valid zip archive."
+            continue
+        with archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                try:
+                    with archive.open(info) as stream:
+                        yield name, stream, None
+                except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                    yield name, None, f"Unreadable archive member: {e}"
+
+
+def iter_chunks(stream):
+    if hasattr(stream, "chunks"):
+        yield from stream.chunks(COPY_CHUNK_SIZE)
+        return
+    while True:
+        chunk = stream.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def save_uploads(uploads, max_files: int, max_bytes: int, spools):
+    """
+    Stream uploaded files and zip members to temporary files, chunk by
+    chunk, hashing each one so identical content is stored once (see
+    `spool_blob`). The spooled files are closed with the `spools` ExitStack;
+    `create_batch` stores them.
+
+    Unsupported types and repeated names are skipped, as is everything past
+    `max_files` files or `max_bytes` bytes in total. Returns
+    ([{'name', 'blob'}] saved, [{'name', 'reason'}] skipped).
+    """
+    saved = []
+    skipped = []
+    names = set()
+    budget = max_bytes
+
+    for name, stream, error in iter_members(uploads):
+        if error is None and os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+            error = "Unsupported file type."
+        if error is None and name in names:
+            error = "Duplicate file name in this upload."
+        if error is None and len(saved) >= max_files:
+            error = f"More than {max_files} files in one upload."
+        if error is not None:
+            skipped.append({"name": name, "reason": error})
+            continue
+
+        blob = spool_blob(iter_chunks(stream), name, max_bytes=budget)
+        if blob is None:
+            skipped.append({"name": name, "reason": f"Upload exceeds {max_bytes} bytes in total."})
+            continue
+        spools.enter_context(blob)
+        budget -= blob.size
+        names.add(name)
+        saved.append({"name": name, "blob": blob})
+
+    return saved, skipped
+
+
+def create_batch(user, uploads: list, information_type: str) -> IngestionBatch:
+    """
+    One batch, its File rows and their queued jobs, each written with a
+    single bulk insert. The Files are written before their blobs are stored
+    (see `store_blob`), the jobs only once the blobs are there.
+    """
+    files = File.objects.bulk_create([
+        File(
+            filename=upload["name"],
+            stored_name=upload["blob"].stored_name,
+            content_hash=upload["blob"].content_hash,
+            user=user,
+            information_type=information_type,
+            status='Queued',
+        )
+        for upload in uploads
+    ])
+    try:
+        for upload in uploads:
+            store_blob(upload["blob"])
+    except Exception:
+        File.objects.filter(pk__in=[file.pk for file in files]).delete()
+        raise
+    with transaction.atomic():
+        batch = IngestionBatch.objects.create(user=user)
+        IngestionJob.objects.bulk_create([IngestionJob(file=file, batch=batch) for file in files])
+    logger.info(f"Ingestion batch {batch.id}: {len(files)} files queued")
+    return batch
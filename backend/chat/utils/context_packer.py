@@ -0,0 +1,165 @@
+import math
+import logging
+
+from langchain_core.documents import Document
+
+from chat.utils import vector_stores
+
+logger = logging.getLogger(__name__)
+
+# Rough tokens-per-character ratio for English text, used when the real
+# tokenizer cannot be loaded (e.g. tiktoken without network access)
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    """
+    Counts tokens with the chat model's tiktoken encoding, or estimates them
+    from the character count when that encoding is unavailable.
+    """
+
+    def __init__(self, model: str):
+        try:
+            import tiktoken
+            self.encoding = tiktoken.encoding_for_model(model)
+        except Exception:
+            logger.warning(f"No tiktoken encoding for {model}; estimating tokens from characters")
+            self.encoding = None
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, tokens: int) -> str:
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:tokens])
+        return text[:tokens * CHARS_PER_TOKEN]
+
+
+def get_token_counter() -> TokenCounter:
+    return vector_stores.get_or_create("token_counter", lambda: TokenCounter(vector_stores.CHAT_MODEL))
+
+
+def chunk_span(doc):
+    start = doc.metadata.get("start_index")
+    if start is None:
+        return None
+    return start, start + len(doc.page_content)
+
+
+def overlap_length(left: str, right: str, expected: int) -> int:
+    """
+    Length of the suffix of `left` that is a prefix of `right`, checking the
+    overlap the character offsets predict first.
+    """
+    if 0 < expected <= min(len(left), len(right)) and left.endswith(right[:expected]):
+        return expected
+    for size in range(min(len(left), len(right)), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class Block:
+    """
+    One or more adjacent chunks of the same page of one file, merged.
+    """
+
+    def __init__(self, doc: Document, rank: int):
+        self.docs = [doc]
+        self.text = doc.page_content
+        self.rank = rank
+        self.span = chunk_span(doc)
+
+    def follows(self, doc: Document) -> bool:
+        """
+        Whether `doc` starts inside or right at the end of this block.
+        """
+        span = chunk_span(doc)
+        return self.span is not None and span is not None and self.span[0] <= span[0] <= self.span[1]
+
+    def extend(self, doc: Document, rank: int):
+        span = chunk_span(doc)
+        if span[1] <= self.span[1]:
+            # Fully contained (e.g. the same chunk retrieved twice)
+            self.docs.append(doc)
+            self.rank = min(self.rank, rank)
+            return
+        overlap = overlap_length(self.text, doc.page_content, self.span[1] - span[0])
+        self.text += doc.page_content[overlap:]
+        self.docs.append(doc)
+        self.span = (self.span[0], span[1])
+        self.rank = min(self.rank, rank)
+
+
+def group_key(doc: Document):
+    metadata = doc.metadata
+    return (
+        metadata.get("source"), metadata.get("blob"), metadata.get("file_id"), metadata.get("owner_id"),
+        metadata.get("page"),
+    )
+
+
+def merge_adjacent(docs: list) -> list:
+    """
+    Merge chunks of the same page of one file whose character ranges touch or
+    overlap, dropping the duplicated overlap. Blocks keep the best
+    (lowest) retrieval rank of their chunks.
+    """
+    groups = {}
+    for rank, doc in enumerate(docs):
+        groups.setdefault(group_key(doc), []).append((rank, doc))
+
+    blocks = []
+    for members in groups.values():
+        members.sort(key=lambda item: (chunk_span(item[1]) or (math.inf,))[0])
+        current = None
+        for rank, doc in members:
+            if current is not None and current.follows(doc):
+                current.extend(doc, rank)
+            else:
+                current = Block(doc, rank)
+                blocks.append(current)
+    blocks.sort(key=lambda block: block.rank)
+    return blocks
+
+
+def pack_context(docs: list, budget: int, counter: TokenCounter = None):
+    """
+    Merge adjacent chunks and keep blocks, most relevant first, while they
+    fit in `budget` tokens. Returns (documents, stats).
+
+    Each returned document's metadata gains `chunks`, `tokens` and
+    `tokens_saved` (tokens of its chunks minus tokens of the merged text).
+    If even the most relevant block is over budget it is truncated.
+    """
+    counter = counter or get_token_counter()
+    tokens_in = sum(counter.count(doc.page_content) for doc in docs)
+
+    packed = []
+    used = 0
+    for block in merge_adjacent(docs):
+        tokens = counter.count(block.text)
+        text = block.text
+        if used + tokens > budget:
+            if packed:
+                continue
+            text = counter.truncate(text, budget)
+            tokens = counter.count(text)
+        chunk_tokens = sum(counter.count(doc.page_content) for doc in block.docs)
+        first = block.docs[0]
+        metadata = {**first.metadata, "chunks": len(block.docs), "tokens": tokens, "tokens_saved": chunk_tokens - tokens}
+        if block.span is not None:
+            metadata["start_index"] = block.span[0]
+        packed.append(Document(page_content=text, metadata=metadata, id=first.id))
+        used += tokens
+
+    stats = {
+        "chunks": len(docs),
+        "blocks": len(packed),
+        "tokens_in": tokens_in,
+        "tokens": used,
+        "tokens_saved": tokens_in - used,
+    }
+    return packed, stats
@@ -0,0 +1,424 @@
+import os
+import glob
+import json
+import time
+import uuid
+import atexit
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+
+from chat.models import Conversation
+from chat.utils import metrics, tracing, vector_stores
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = ".jsonl"
+# Turns the database refused, kept in the spool directory for inspection
+# (not replayed: its name does not end in SPOOL_SUFFIX)
+DEAD_LETTER_FILE = "dead-letter.jsonl.rejected"
+# Errors that are about one row (its user was deleted, a malformed spool
+# record, ...) rather than about the database
+ROW_ERRORS = (IntegrityError, DataError, KeyError, TypeError, ValueError)
+
+
+def try_lock(handle) -> bool:
+    """
+    Take an exclusive, non-blocking lock on an open spool file. The lock is
+    held for as long as the handle is open, so a process that can lock a
+    spool file knows its writer is gone.
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def read_spool(handle) -> list:
+    """
+    Records in a spool file. A torn last line (the writer died mid-append)
+    is skipped.
+    """
+    handle.seek(0)
+    records = []
+    for line in handle:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            logger.warning(f"Skipping a torn record in conversation spool {handle.name}")
+    return records
+
+
+def to_conversation(record: dict) -> Conversation:
+    return Conversation(
+        log_id=uuid.UUID(record["log_id"]),
+        user_id=record["user_id"],
+        conversation_type=record["conversation_type"],
+        query=record["query"],
+        answer=record["answer"],
+        sources=record["sources"],
+    )
+
+
+def write_records(records: list) -> tuple:
+    """
+    Insert `records` in one bulk statement per batch. Rows whose log_id is
+    already stored are skipped, which makes replaying a spool idempotent.
+    If the batch fails because of some of its rows, they are retried one
+    at a time. Returns (written, rejected): `rejected` lists the
+    (record, error) pairs the database refused. Errors that are not about
+    a row (the database is down) are raised.
+    """
+    if not records:
+        return 0, []
+    with tracing.span("db.conversation_flush"):
+        try:
+            with transaction.atomic():
+                Conversation.objects.bulk_create(
+                    [to_conversation(record) for record in records],
+                    batch_size=settings.CONVERSATION_LOG_MAX_RECORDS,
+                    ignore_conflicts=True,
+                )
+            written, rejected = len(records), []
+        except ROW_ERRORS:
+            written, rejected = write_rows(records)
+    metrics.observe("conversation_log_flushed_records", written)
+    return written, rejected
+
+
+def write_rows(records: list) -> tuple:
+    """
+    `write_records` one row at a time, collecting the rows that fail.
+    """
+    written, rejected = 0, []
+    for record in records:
+        try:
+            with transaction.atomic():
+                Conversation.objects.bulk_create([to_conversation(record)], ignore_conflicts=True)
+        except ROW_ERRORS as e:
+            rejected.append((record, f"{type(e).__name__}: {e}"))
+        else:
+            written += 1
+    return written, rejected
+
+
+def dead_letter(spool_dir, rejected: list):
+    """
+    Log turns the database refused and append them to the dead-letter file
+    of `spool_dir` (if any), so they are neither retried forever nor lost.
+    """
+    if not rejected:
+        return
+    for record, error in rejected:
+        logger.error(f"Dropping a buffered conversation the database refused ({error}): {record!r}")
+    metrics.observe("conversation_log_rejected_records", len(rejected))
+    if not spool_dir:
+        return
+    lines = "".join(json.dumps({"record": record, "error": error}) + "\n" for record, error in rejected)
+    with open(os.path.join(str(spool_dir), DEAD_LETTER_FILE), "a", encoding="utf-8") as handle:
+        handle.write(lines)
+
+
+class ConversationLog:
+    """
+    Write-behind buffer for chat turns, one per process.
+
+    `append` queues a turn in memory and, with a spool directory, appends it
+    to this process's spool file, then returns without touching the
+    database. A background thread writes queued turns with `bulk_create`
+    once `max_records` are waiting or `flush_seconds` have passed. The spool
+    is rotated at each flush and a segment deleted once its turns are
+    committed, so turns that were only spooled when a worker died are
+    replayed (see `replay_spools`) rather than lost. Turns the database
+    refuses (e.g. their user was deleted) go to the dead-letter file
+    instead of blocking the ones behind them.
+
+    Until they are flushed, a user's queued turns are readable by every
+    worker sharing the spool directory (see `spooled_records`), and by
+    this process through `pending` when there is no spool.
+    """
+
+    def __init__(self, spool_dir: str = None, max_records: int = 100, flush_seconds: float = 1.0):
+        self.spool_dir = str(spool_dir) if spool_dir else None
+        self.max_records = max_records
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flushing = threading.Lock()
+        self._pending = []
+        # Turns taken by a flush, visible to `pending` until committed
+        self._in_flight = []
+        self._spool = None
+        self._segments = []
+        self._closed = False
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+        self._thread.start()
+
+    def _open_segment(self):
+        path = os.path.join(self.spool_dir, f"{os.getpid()}-{uuid.uuid4().hex}{SPOOL_SUFFIX}")
+        handle = open(path, "a+", encoding="utf-8")
+        try_lock(handle)
+        return handle
+
+    def append(self, user_id, conversation_type: str, query: str, answer: str, sources) -> Conversation:
+        """
+        Queue one turn. Returns it as an unsaved Conversation (no id yet)
+        carrying its log_id.
+        """
+        record = {
+            "log_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "conversation_type": conversation_type,
+            "query": query,
+            "answer": answer,
+            "sources": sources,
+            # Orders turns read back from several workers' spools
+            "logged_at": time.time(),
+        }
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The conversation log is closed")
+            if self.spool_dir:
+                if self._spool is None:
+                    self._spool = self._open_segment()
+                self._spool.write(line)
+                self._spool.flush()
+            self._pending.append(record)
+            if len(self._pending) >= self.max_records:
+                self._wakeup.notify()
+        return to_conversation(record)
+
+    def pending(self, user_id, conversation_type: str) -> list:
+        """
+        The user's turns not written yet, newest first.
+        """
+        with self._lock:
+            records = [
+                record for record in self._in_flight + self._pending
+                if record["user_id"] == user_id and record["conversation_type"] == conversation_type
+            ]
+        return [to_conversation(record) for record in reversed(records)]
+
+    def flush(self) -> int:
+        """
+        Write every queued turn now. Returns the number written. Turns the
+        database refuses are dead-lettered; if the database itself fails,
+        every turn stays queued (and spooled) for the next try.
+        """
+        with self._flushing:
+            with self._lock:
+                records, self._pending = self._pending, []
+                self._in_flight = records
+                if self._spool is not None:
+                    self._segments.append(self._spool)
+                    self._spool = None
+                segments, self._segments = self._segments, []
+            try:
+                written, rejected = write_records(records)
+                dead_letter(self.spool_dir, rejected)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = records
+                    self._segments[:0] = segments
+                    self._in_flight = []
+                raise
+            with self._lock:
+                self._in_flight = []
+            for segment in segments:
+                segment.close()
+                os.remove(segment.name)
+            return written
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closed and len(self._pending) < self.max_records:
+                    self._wakeup.wait(self.flush_seconds)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not write buffered conversations; retrying")
+                time.sleep(self.flush_seconds)
+            finally:
+                close_old_connections()
+            if closed:
+                return
+
+    def close(self):
+        """
+        Stop the flusher after a last flush (at interpreter exit).
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+
+
+def spooled_records(spool_dir: str, user_id, conversation_type: str) -> list:
+    """
+    The user's turns in every spool file in `spool_dir`, whichever worker
+    queued them, oldest first. A segment is only deleted once its turns
+    are committed, so these are all the turns not in the database yet.
+    """
+    # Records are written by json.dumps, so other users' lines are skipped unparsed
+    needle = f'"user_id": {json.dumps(user_id)},'
+    records = []
+    for path in glob.glob(os.path.join(str(spool_dir), f"*{SPOOL_SUFFIX}")):
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                lines = handle.readlines()
+        except OSError:  # Flushed and deleted meanwhile
+            continue
+        for line in lines:
+            if needle not in line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:  # Still being appended
+                continue
+            if record.get("user_id") == user_id and record.get("conversation_type") == conversation_type:
+                records.append(record)
+    records.sort(key=lambda record: record.get("logged_at", 0))
+    return records
+
+
+def replay_spools(spool_dir: str) -> int:
+    """
+    Write the turns of every spool file in `spool_dir` whose writer is gone
+    (its lock can be taken), then delete it. Turns the database refuses are
+    dead-lettered; a file that cannot be written is kept for the next
+    replay. Returns the number replayed.
+    """
+    replayed = 0
+    for path in sorted(glob.glob(os.path.join(str(spool_dir), f"*{SPOOL_SUFFIX}"))):
+        try:
+            handle = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            continue
+        with handle:
+            if not try_lock(handle):
+                continue
+            records = read_spool(handle)
+            try:
+                written, rejected = write_records(records)
+                dead_letter(spool_dir, rejected)
+            except Exception:
+                logger.exception(f"Could not replay buffered conversations from {path}; keeping it")
+                continue
+            replayed += written
+            os.remove(path)
+        logger.info(f"Replayed {written} buffered conversations from {path}")
+    return replayed
+
+
+def build_conversation_log():
+    spool_dir = settings.CONVERSATION_LOG_SPOOL_DIR
+    if spool_dir:
+        os.makedirs(spool_dir, exist_ok=True)
+        # Never fails the request that builds the log: unreplayed spools
+        # stay on disk for the next worker start
+        try:
+            replay_spools(spool_dir)
+        except Exception:
+            logger.exception("Could not replay conversation spools")
+    log = ConversationLog(
+        spool_dir,
+        max_records=settings.CONVERSATION_LOG_MAX_RECORDS,
+        flush_seconds=settings.CONVERSATION_LOG_FLUSH_SECONDS,
+    )
+    atexit.register(log.close)
+    return log
+
+
+def get_conversation_log():
+    """
+    This process's write-behind buffer (built on first use, after replaying
+    spools left by workers that died).
+    """
+    return vector_stores.get_or_create("conversation_log", build_conversation_log)
+
+
+def log_conversation(user, conversation_type: str, query: str, answer: str, sources) -> Conversation:
+    """
+    Record a chat turn: queued in the write-behind buffer, or written
+    straight away when CONVERSATION_LOG_BUFFERED is off. Without a spool
+    directory private turns are written straight away too: the user's next
+    request may reach another worker, which could not see them otherwise.
+    """
+    user_id = user.id if user is not None else None
+    inline = not settings.CONVERSATION_LOG_BUFFERED or (
+        conversation_type == Conversation.PRIVATE and not settings.CONVERSATION_LOG_SPOOL_DIR
+    )
+    if inline:
+        return Conversation.objects.create(
+            user_id=user_id,
+            conversation_type=conversation_type,
+            query=query,
+            answer=answer,
+            sources=sources,
+            log_id=uuid.uuid4(),
+        )
+    return get_conversation_log().append(user_id, conversation_type, query, answer, sources)
+
+
+def pending_conversations(user_id, conversation_type: str) -> list:
+    """
+    The user's buffered turns, newest first: those in any worker's spool,
+    or those in this process without a spool.
+    """
+    if not settings.CONVERSATION_LOG_BUFFERED:
+        return []
+    if settings.CONVERSATION_LOG_SPOOL_DIR:
+        records = spooled_records(settings.CONVERSATION_LOG_SPOOL_DIR, user_id, conversation_type)
+        return [to_conversation(record) for record in reversed(records)]
+    return get_conversation_log().pending(user_id, conversation_type)
+
+
+def with_pending(pending: list, conversations, limit: int = None) -> list:
+    """
+    Newest-first `conversations` from the database with the user's buffered
+    turns (`pending_conversations`) on top, for read-your-writes. Take
+    `pending` before querying the database: a turn flushed in between is
+    then in both and kept once, never in neither.
+    """
+    conversations = list(conversations)
+    if not pending:
+        return conversations[:limit] if limit is not None else conversations
+    stored = {conversation.log_id for conversation in conversations}
+    merged = [conversation for conversation in pending if conversation.log_id not in stored] + conversations
+    return merged[:limit] if limit is not None else merged
+
+
+def recent_conversations(user_id, conversation_type: str, limit: int, fields=None) -> list:
+    """
+    The user's last `limit` turns, newest first, including buffered ones.
+    `fields` restricts the columns loaded from the database.
+    """
+    pending = pending_conversations(user_id, conversation_type)
+    conversations = Conversation.objects.filter(user_id=user_id, conversation_type=conversation_type)
+    if fields:
+        conversations = conversations.only(*fields)
+    return with_pending(pending, conversations.order_by('-id')[:limit], limit)
+
+
+alog_conversation = sync_to_async(log_conversation)
+arecent_conversations = sync_to_async(recent_conversations)
@@ -0,0 +1,298 @@
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from chat.models import Conversation
+from chat.utils import tracing, vector_stores
+from chat.utils.conversation_log import recent_conversations
+from chat.utils.context_packer import get_token_counter
+
+logger = logging.getLogger(__name__)
+
+CONDENSE_PROMPT = (
+    "Given the conversation below and a follow-up question, rewrite the follow-up "
+    "as a standalone question that can be understood without the conversation. "
+    "Return only the question.\n\n{history}\n\nFollow-up question: {question}\nStandalone question:"
+)
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in a few sentences, keeping names, facts "
+    "and open questions the user may refer back to. Build on the existing summary.\n\n"
+    "Existing summary: {summary}\n\n{turns}\n\nSummary:"
+)
+# How long a memory update waits for the user's lock, and how long a lock
+# whose holder died blocks others
+MEMORY_LOCK_SECONDS = 5
+
+
+class ConversationMemory:
+    """
+    What the model remembers of a user's private chat: the last
+    CHAT_MEMORY_TURNS turns verbatim, and a rolling summary of the older ones.
+    """
+
+    __slots__ = ("summary", "turns")
+
+    def __init__(self, summary: str = "", turns: list = None):
+        self.summary = summary
+        # [(turn key, query, answer)], oldest first
+        self.turns = turns or []
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+    def __contains__(self, key) -> bool:
+        return any(turn[0] == key for turn in self.turns)
+
+    def render(self, budget: int) -> str:
+        """
+        The summary and the most recent turns that fit in `budget` tokens.
+        """
+        counter = get_token_counter()
+        lines = []
+        used = 0
+        if self.summary:
+            summary = counter.truncate(f"Summary of earlier conversation: {self.summary}", budget)
+            lines.append(summary)
+            used = counter.count(summary)
+
+        turns = []
+        for _, query, answer in reversed(self.turns):
+            turn = f"User: {query}\nAssistant: {answer}"
+            cost = counter.count(turn)
+            if used + cost > budget:
+                if not turns:
+                    # Always keep (the start of) the latest turn
+                    turns.append(counter.truncate(turn, budget - used))
+                break
+            turns.append(turn)
+            used += cost
+        return "\n".join(lines + turns[::-1])
+
+    def to_cache(self) -> dict:
+        return {"summary": self.summary, "turns": self.turns}
+
+
+def turn_key(conversation: Conversation) -> str:
+    """
+    Identify a turn whether or not it has been written yet: by its log id,
+    or by its id for turns saved before log ids existed.
+    """
+    if conversation.log_id:
+        return conversation.log_id.hex
+    return f"id:{conversation.id}"
+
+
+def memory_key(user_id: int) -> str:
+    return f"chat_memory:{user_id}"
+
+
+def get_memory_cache():
+    return caches[settings.CHAT_MEMORY_CACHE]
+
+
+@contextmanager
+def memory_lock(user_id: int, timeout: float = MEMORY_LOCK_SECONDS):
+    """
+    Hold the user's memory for a read-modify-write. The lock is a cache key
+    taken with `cache.add`, which is atomic in every backend, so it holds
+    across workers sharing the cache. Raises TimeoutError after `timeout`
+    seconds; a lock left by a dead holder expires after as long.
+    """
+    cache = get_memory_cache()
+    key = f"{memory_key(user_id)}:lock"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    while not cache.add(key, token, timeout):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Memory of user {user_id} is locked")
+        time.sleep(0.01)
+    try:
+        yield cache
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def get_summarizer() -> ThreadPoolExecutor:
+    """
+    The background thread that folds old turns into summaries, off the request path.
+    """
+    return vector_stores.get_or_create(
+        "memory_summarizer", lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-memory")
+    )
+
+
+def load_memory(user_id: int) -> ConversationMemory:
+    """
+    The user's memory from the cache or, on a miss, the last
+    CHAT_MEMORY_TURNS private turns from the database (one indexed query,
+    no summary of anything older) and the write-behind buffer.
+    """
+    if not settings.CHAT_MEMORY_TURNS:
+        return ConversationMemory()
+    cached = get_memory_cache().get(memory_key(user_id))
+    if cached is not None:
+        return ConversationMemory(**cached)
+
+    with tracing.span("db.memory", endpoint="private"):
+        conversations = recent_conversations(
+            user_id, Conversation.PRIVATE, settings.CHAT_MEMORY_TURNS,
+            fields=['id', 'log_id', 'query', 'answer'],
+        )
+    memory = ConversationMemory(turns=[
+        (turn_key(conversation), conversation.query, conversation.answer)
+        for conversation in reversed(conversations)
+    ])
+    # Never replaces an entry a concurrent `remember_turn` already updated
+    get_memory_cache().add(memory_key(user_id), memory.to_cache(), settings.CHAT_MEMORY_TTL)
+    return memory
+
+
+def chat_text(message) -> str:
+    return getattr(message, "content", message).strip()
+
+
+def question_with_history(memory: ConversationMemory, question: str) -> str:
+    """
+    The question as the answering prompt sees it: prefixed with at most
+    CHAT_MEMORY_TOKENS of conversation, whatever the history length.
+    """
+    if not memory:
+        return question
+    history = memory.render(settings.CHAT_MEMORY_TOKENS)
+    return f"Conversation so far:\n{history}\n\nCurrent question: {question}"
+
+
+def condense_prompt(memory: ConversationMemory, question: str):
+    if not memory or not settings.CHAT_MEMORY_CONDENSE:
+        return None
+    return CONDENSE_PROMPT.format(history=memory.render(settings.CHAT_MEMORY_TOKENS), question=question)
+
+
+def condense_question(memory: ConversationMemory, question: str) -> str:
+    """
+    A standalone rewrite of a follow-up `question` to retrieve with, or the
+    question itself when there is no history (or condensing fails).
+    """
+    prompt = condense_prompt(memory, question)
+    if prompt is None:
+        return question
+    try:
+        with tracing.span("llm.condense", endpoint="private"):
+            return chat_text(vector_stores.get_chat_model().invoke(prompt)) or question
+    except Exception:
+        logger.exception("Could not condense the follow-up question; retrieving with it as is")
+        return question
+
+
+async def acondense_question(memory: ConversationMemory, question: str) -> str:
+    """
+    Async variant of `condense_question`.
+    """
+    prompt = condense_prompt(memory, question)
+    if prompt is None:
+        return question
+    try:
+        with tracing.span("llm.condense", endpoint="private"):
+            return chat_text(await vector_stores.get_chat_model().ainvoke(prompt)) or question
+    except Exception:
+        logger.exception("Could not condense the follow-up question; retrieving with it as is")
+        return question
+
+
+def summarize(summary: str, turns: list) -> str:
+    """
+    Fold `turns` into the rolling summary, capped at CHAT_MEMORY_SUMMARY_TOKENS.
+    """
+    text = "\n".join(f"User: {query}\nAssistant: {answer}" for _, query, answer in turns)
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", turns=text)
+    with tracing.span("llm.summarize", endpoint="private"):
+        new_summary = chat_text(vector_stores.get_chat_model().invoke(prompt))
+    return get_token_counter().truncate(new_summary, settings.CHAT_MEMORY_SUMMARY_TOKENS)
+
+
+def fold_count(memory: ConversationMemory) -> int:
+    """
+    How many of the oldest turns to fold into the summary: none up to
+    CHAT_MEMORY_TURNS, then enough to keep half of them, so summarizing
+    happens every few turns rather than on each one.
+    """
+    limit = settings.CHAT_MEMORY_TURNS
+    if len(memory.turns) <= limit:
+        return 0
+    return max(1, limit // 2) + len(memory.turns) - limit - 1
+
+
+def remember_turn(user_id: int, conversation: Conversation):
+    """
+    Add a logged private turn to the user's cached memory. Once more than
+    CHAT_MEMORY_TURNS are kept, folding the oldest into the summary is
+    handed to the summarizer thread (see `fold_memory`); returns its future,
+    else None. Without a cached entry there is nothing to update: the next
+    `load_memory` reads the turn from the database or the buffer.
+    """
+    if not settings.CHAT_MEMORY_TURNS:
+        return None
+    try:
+        with memory_lock(user_id) as cache:
+            cached = cache.get(memory_key(user_id))
+            if cached is None:
+                return None
+            memory = ConversationMemory(**cached)
+            key = turn_key(conversation)
+            if key in memory:
+                return None
+            memory.turns.append((key, conversation.query, conversation.answer))
+            cache.set(memory_key(user_id), memory.to_cache(), settings.CHAT_MEMORY_TTL)
+    except TimeoutError:
+        logger.warning(f"Memory of user {user_id} stayed locked; reloading it on the next turn")
+        get_memory_cache().delete(memory_key(user_id))
+        return None
+    if not fold_count(memory):
+        return None
+    return get_summarizer().submit(fold_memory, user_id)
+
+
+def fold_memory(user_id: int):
+    """
+    Fold the user's oldest turns into the summary. The LLM call runs
+    without the lock; the result is only stored if no one else folded
+    those turns in the meantime.
+    """
+    cached = get_memory_cache().get(memory_key(user_id))
+    if cached is None:
+        return
+    memory = ConversationMemory(**cached)
+    fold = fold_count(memory)
+    if not fold:
+        return
+    old = memory.turns[:fold]
+    try:
+        summary = summarize(memory.summary, old)
+    except Exception:
+        logger.exception(f"Could not summarize the conversation of user {user_id}; dropping {len(old)} turns")
+        summary = memory.summary
+
+    try:
+        with memory_lock(user_id) as cache:
+            cached = cache.get(memory_key(user_id))
+            if cached is None:
+                return
+            current = ConversationMemory(**cached)
+            if current.summary != memory.summary or [t[0] for t in current.turns[:fold]] != [t[0] for t in old]:
+                return
+            current.summary = summary
+            current.turns = current.turns[fold:]
+            cache.set(memory_key(user_id), current.to_cache(), settings.CHAT_MEMORY_TTL)
+    except TimeoutError:
+        logger.warning(f"Memory of user {user_id} stayed locked; summarizing it on a later turn")
+
+
+aload_memory = sync_to_async(load_memory)
+aremember_turn = sync_to_async(remember_turn)
@@ -0,0 +1,47 @@
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    `connection_created` receiver: apply settings.SQLITE_PRAGMAS to each new
+    SQLite connection. Pragmas are per connection (journal_mode=WAL also
+    sticks to the database file), so every thread and worker needs them.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+            if name == "journal_mode":
+                mode = cursor.fetchone()[0]
+                if mode.lower() != str(value).lower() and not connection.is_in_memory_db():
+                    logger.warning(f"SQLite kept journal_mode={mode} (asked for {value})")
+
+
+def describe(connection) -> dict:
+    """
+    The settings a connection actually runs with, for benchmarks and checks.
+    """
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size"):
+                cursor.execute(f"PRAGMA {name}")
+                row = cursor.fetchone()
+                # None where the pragma does not apply (mmap_size in memory)
+                pragmas[name] = row[0] if row else None
+        return {
+            "vendor": "sqlite",
+            "transaction_mode": connection.settings_dict["OPTIONS"].get("transaction_mode") or "DEFERRED",
+            **pragmas,
+        }
+    return {
+        "vendor": connection.vendor,
+        "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+        "conn_health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+        "pool": connection.settings_dict["OPTIONS"].get("pool") or None,
+    }
@@ -0,0 +1,190 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from chat.utils import vector_stores
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# The row count, kept as a counter so writes don't scan the table (seeded
+# once for cache files written before it existed)
+SEED_ENTRIES = "INSERT OR IGNORE INTO counters (name, value) SELECT 'entries', COUNT(*) FROM embeddings"
+
+# SQLite caps the number of bound parameters per statement
+SQL_BATCH = 500
+
+
+def model_id(embeddings) -> str:
+    """
+    Identify the embedding model so vectors from different models never mix.
+    """
+    model = getattr(embeddings, "model", None)
+    dimensions = getattr(embeddings, "dimensions", None) or getattr(embeddings, "size", None)
+    name = model or type(embeddings).__name__
+    return f"{name}:{dimensions}" if dimensions else name
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding cache in a local SQLite file.
+
+    Keys are sha256(model id, chunk text); values are float32 vectors.
+    The least recently used entries are evicted beyond `max_entries`.
+    Hit/miss counters and the entry count live in the same file so every
+    worker process contributes to the totals reported by `stats()`.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute(SEED_ENTRIES)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _bump(self, conn, name: str, amount: int):
+        if amount:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount),
+            )
+
+    def _counter(self, conn, name: str) -> int:
+        row = conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def get_many(self, model: str, texts: list) -> dict:
+        """
+        Return {index: vector} for every text in `texts` that is cached.
+        """
+        keys = [cache_key(model, text) for text in texts]
+        positions = {}
+        for index, key in enumerate(keys):
+            positions.setdefault(key, []).append(index)
+
+        found = {}
+        conn = self._connect()
+        unique = list(positions)
+        for start in range(0, len(unique), SQL_BATCH):
+            batch = unique[start:start + SQL_BATCH]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                for index in positions[key]:
+                    found[index] = vector
+
+        hit_keys = list({keys[index] for index in found})
+        with conn:
+            now = time.time()
+            for start in range(0, len(hit_keys), SQL_BATCH):
+                batch = hit_keys[start:start + SQL_BATCH]
+                conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(batch))})",
+                    [now, *batch],
+                )
+            self._bump(conn, "hits", len(found))
+            self._bump(conn, "misses", len(texts) - len(found))
+        return found
+
+    def put_many(self, model: str, texts: list, vectors: list):
+        """
+        Store vectors for `texts`, then evict least recently used entries.
+        Texts already cached (e.g. stored meanwhile by another worker) keep
+        their vector.
+        """
+        now = time.time()
+        rows = [
+            (cache_key(model, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        conn = self._connect()
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._bump(conn, "entries", conn.total_changes - before)
+            overflow = self._counter(conn, "entries") - self.max_entries
+            if overflow > 0:
+                evicted = conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+                self._bump(conn, "entries", -evicted)
+                self._bump(conn, "evictions", evicted)
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "path": self.path,
+            "entries": counters.get("entries", 0),
+            "max_entries": self.max_entries,
+            "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / lookups if lookups else None,
+        }
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM embeddings")
+            conn.execute("DELETE FROM counters")
+            conn.execute(SEED_ENTRIES)
+
+
+def get_embedding_cache():
+    """
+    Process-wide cache instance, or None when EMBEDDING_CACHE_ENABLED is off.
+    """
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    return vector_stores.get_or_create(
+        "embedding_cache",
+        lambda: EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_ENTRIES),
+    )
@@ -0,0 +1,203 @@
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+
+from chat.models import IngestionJob
+from chat.utils import vector_stores
+from chat.utils.embedding_cache import get_embedding_cache, model_id
+from chat.utils.progress import Progress
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingError(Exception):
+    """
+    A batch still failed after all retries.
+    """
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    """
+    True for HTTP 429 errors from the OpenAI client (or anything shaped like one).
+    """
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Rate limits, timeouts, connection errors and 5xx responses are worth retrying.
+    """
+    if is_rate_limited(exc):
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in ("APITimeoutError", "APIConnectionError", "InternalServerError"):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+def retry_after(exc: Exception):
+    """
+    Seconds the server asked us to wait, if it said so.
+    """
+    value = getattr(exc, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class Backpressure:
+    """
+    Shared pause gate: once any request is rate limited, every worker thread
+    waits until the back-off has elapsed before sending its next request.
+    """
+
+    def __init__(self):
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+
+class EmbeddingPipeline:
+    """
+    Embed texts in fixed-size batches with at most `max_concurrency`
+    requests in flight.
+
+    Each batch is retried on its own with exponential back-off and jitter,
+    so a failure never re-embeds batches that already succeeded. A 429
+    pauses all in-flight workers (honouring Retry-After when present).
+
+    Texts already in the embedding cache are never sent; each finished
+    batch is written to the cache as soon as it completes.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        batch_size: int = None,
+        max_concurrency: int = None,
+        max_retries: int = None,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        use_cache: bool = True,
+    ):
+        self.embeddings = embeddings or vector_stores.get_embeddings()
+        self.cache = get_embedding_cache() if use_cache else None
+        self.model = model_id(self.embeddings)
+        self.batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+        self.max_concurrency = max(1, max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY)
+        self.max_retries = settings.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.backpressure = Backpressure()
+        self.stats = {"batches": 0, "retries": 0, "rate_limited": 0, "cache_hits": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _delay(self, attempt: int, exc: Exception) -> float:
+        delay = retry_after(exc)
+        if delay is None:
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+            delay = random.uniform(delay / 2, delay)
+        return delay
+
+    def embed_batch(self, texts: list) -> list:
+        """
+        Embed one batch, retrying transient failures.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.backpressure.wait()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                self._count("batches")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise EmbeddingError(
+                        f"Embedding batch of {len(texts)} texts failed after {attempt + 1} attempts: {e}"
+                    ) from e
+
+                delay = self._delay(attempt, e)
+                self._count("retries")
+                if is_rate_limited(e):
+                    self._count("rate_limited")
+                    logger.warning(f"Embedding rate limited, backing off {delay:.1f}s")
+                    self.backpressure.pause(delay)
+                else:
+                    logger.warning(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+
+    def embed(self, texts: list, progress: Progress = None) -> list:
+        """
+        Embed `texts`, returning vectors in the same order.
+        """
+        progress = progress or Progress()
+        texts = list(texts)
+        vectors = [None] * len(texts)
+        if not texts:
+            return vectors
+
+        if self.cache is not None:
+            cached = self.cache.get_many(self.model, texts)
+            for index, vector in cached.items():
+                vectors[index] = vector
+            self.stats["cache_hits"] += len(cached)
+            progress.advance(IngestionJob.EMBED, len(cached))
+
+        pending = [index for index, vector in enumerate(vectors) if vector is None]
+        batches = [
+            pending[start:start + self.batch_size]
+            for start in range(0, len(pending), self.batch_size)
+        ]
+
+        def collect(indexes, batch_vectors):
+            for index, vector in zip(indexes, batch_vectors):
+                vectors[index] = vector
+            if self.cache is not None:
+                self.cache.put_many(self.model, [texts[i] for i in indexes], batch_vectors)
+            progress.advance(IngestionJob.EMBED, len(indexes))
+
+        if len(batches) <= 1 or self.max_concurrency == 1:
+            for indexes in batches:
+                collect(indexes, self.embed_batch([texts[i] for i in indexes]))
+            return vectors
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {
+                pool.submit(self.embed_batch, [texts[i] for i in indexes]): indexes
+                for indexes in batches
+            }
+            try:
+                for future in as_completed(futures):
+                    collect(futures[future], future.result())
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        return vectors
@@ -0,0 +1,257 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class FakeRateLimitError(Exception):
+    """
+    Raised by FakeEmbeddings when more requests are in flight than allowed,
+    shaped like an HTTP 429 so the embedding pipeline treats it as one.
+    """
+
+    status_code = 429
+
+    def __init__(self, retry_after: float = None):
+        super().__init__("Rate limit exceeded (fake)")
+        self.retry_after = retry_after
+
+
+@lru_cache(maxsize=1 << 16)
+def _bucket(token: str, dim: int):
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, 1.0 if (value >> 63) & 1 else -1.0
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic, offline embeddings for benchmarks.
+
+    Each text is a normalized signed bag of hashed words, so texts sharing
+    words are close in cosine space and the same text always maps to the
+    same vector. `latency` is slept once per request; `max_in_flight` makes
+    concurrent requests beyond the limit fail with a fake 429.
+    """
+
+    def __init__(self, size: int = 3072, latency: float = 0.0, max_in_flight: int = None):
+        self.size = size
+        self.latency = latency
+        self.max_in_flight = max_in_flight
+        self.requests = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> list:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in TOKEN_RE.findall(text.lower()):
+            index, sign = _bucket(token, self.size)
+            vector[index] += sign
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+        else:
+            vector /= norm
+        return vector.tolist()
+
+    def _request(self, texts):
+        with self._lock:
+            if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+                raise FakeRateLimitError(retry_after=self.latency or 0.01)
+            self._in_flight += 1
+            self.requests += 1
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return [self._vector(text) for text in texts]
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def embed_documents(self, texts):
+        return self._request(list(texts))
+
+    def embed_query(self, text):
+        return self._request([text])[0]
+
+    async def _arequest(self, texts):
+        # Same as _request, but waits without holding a thread so async
+        # views can be load-tested against it.
+        with self._lock:
+            if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+                raise FakeRateLimitError(retry_after=self.latency or 0.01)
+            self._in_flight += 1
+            self.requests += 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return [self._vector(text) for text in texts]
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def aembed_documents(self, texts):
+        return await self._arequest(list(texts))
+
+    async def aembed_query(self, text):
+        return (await self._arequest([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic, offline chat model for benchmarks.
+
+    Every call waits `latency` seconds (time to first token) and answers
+    `answer`; streaming then yields it word by word, `token_latency`
+    seconds apart. The async methods wait without holding a thread.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer: str = "This is a fake answer."
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _words(self):
+        words = self.answer.split(" ")
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for i, word in enumerate(self._words()):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for i, word in enumerate(self._words()):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible API: POST /v1/embeddings and
+    POST /v1/chat/completions (plain or `stream: true`). Every request
+    sleeps `server.latency` seconds before answering.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        payload = self._read_json()
+        time.sleep(self.server.latency)
+        if self.path.endswith("/embeddings"):
+            self._embeddings(payload)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(payload)
+        else:
+            self._send(404, b'{"error": {"message": "not found"}}')
+
+    def _embeddings(self, payload):
+        inputs = payload.get("input", [])
+        if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # Token-id inputs (tiktoken on the client) are hashed as text too
+        texts = [item if isinstance(item, str) else " ".join(map(str, item)) for item in inputs]
+        vectors = self.server.embeddings.embed_documents(texts)
+        body = {
+            "object": "list",
+            "model": payload.get("model", "fake"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector}
+                for i, vector in enumerate(vectors)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+        self._send(200, json.dumps(body).encode("utf-8"))
+
+    def _chat(self, payload):
+        answer = self.server.answer
+        common = {"id": "chatcmpl-fake", "created": int(time.time()), "model": payload.get("model", "fake")}
+        if not payload.get("stream"):
+            body = {
+                **common,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+            self._send(200, json.dumps(body).encode("utf-8"))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            chunk = {**common, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        last = {**common, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.wfile.write(f"data: {json.dumps(last)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.close_connection = True
+
+
+def start_fake_openai_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                             dim: int = 256, answer: str = "This is a fake answer."):
+    """
+    Serve FakeOpenAIHandler on a daemon thread. Returns the server; its
+    base URL is `f"http://{host}:{server.server_port}/v1"`. Call
+    `server.shutdown()` when done.
+    """
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.answer = answer
+    server.embeddings = FakeEmbeddings(size=dim)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,329 @@
+import os
+import time
+import socket
+import signal
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from chat.models import File, IngestionJob, default_job_progress
+from chat.utils.progress import RecordingProgress
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the `ingest_worker` command
+POLL_INTERVAL = 2.0
+STALE_AFTER = timedelta(minutes=10)
+# Seconds between heartbeats of claimed jobs; keep it well below STALE_AFTER
+HEARTBEAT_INTERVAL = 30.0
+MAX_ATTEMPTS = 3
+# Minimum seconds between progress writes while a stage is running
+PROGRESS_SAVE_INTERVAL = 1.0
+
+
+class JobProgress(RecordingProgress):
+    """
+    Persist stage progress on the IngestionJob row (throttled). Liveness is
+    reported separately, by `Heartbeat`.
+    """
+
+    def __init__(self, job: IngestionJob):
+        super().__init__()
+        self.job = job
+        self.stages = default_job_progress()
+        self._last_save = 0.0
+
+    def start(self, stage: str, total: int = None):
+        changed = stage != self.current
+        super().start(stage, total)
+        self.save(force=changed or total is not None)
+
+    def advance(self, stage: str, count: int = 1):
+        super().advance(stage, count)
+        self.save()
+
+    def finish(self, stage: str):
+        super().finish(stage)
+        self.save(force=True)
+
+    def save(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_save < PROGRESS_SAVE_INTERVAL:
+            return
+        self._last_save = now
+        IngestionJob.objects.filter(pk=self.job.pk).update(
+            stage=self.current or '',
+            progress=self.stages,
+        )
+
+
+class Heartbeat:
+    """
+    Refresh `heartbeat_at` on claimed jobs from a background thread for as
+    long as the worker holds them, so a long stage (a big PDF, a slow
+    embedding batch) never looks like a crashed worker to `requeue_stale`.
+
+        with Heartbeat(jobs, worker_id):
+            run_batch(jobs, upload_folder)
+
+    Only jobs still RUNNING on `worker_id` are touched, so a job that was
+    requeued and claimed elsewhere is left to its new worker.
+    """
+
+    def __init__(self, jobs: list, worker_id: str, interval: float = HEARTBEAT_INTERVAL):
+        self.job_ids = [job.pk for job in jobs]
+        self.worker_id = worker_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="ingest-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.beat()
+                except Exception:
+                    logger.exception("Ingestion heartbeat failed")
+        finally:
+            # This thread has its own connection; don't leave it open
+            connection.close()
+
+    def beat(self) -> int:
+        return IngestionJob.objects.filter(
+            pk__in=self.job_ids, status=IngestionJob.RUNNING, worker=self.worker_id
+        ).update(heartbeat_at=timezone.now())
+
+
+def enqueue(file_record: File) -> IngestionJob:
+    """
+    Queue `file_record` for ingestion. Returns the already pending job, if any.
+
+    A file has at most one pending job (a partial unique constraint), so two
+    requests queueing the same file at once both get the job of the first.
+    """
+    while True:
+        pending = (
+            IngestionJob.objects
+            .filter(file=file_record, status__in=[IngestionJob.QUEUED, IngestionJob.RUNNING])
+            .first()
+        )
+        if pending:
+            return pending
+
+        try:
+            with transaction.atomic():
+                job = IngestionJob.objects.create(file=file_record)
+        except IntegrityError:
+            # Another request queued the file since we looked; return its job
+            continue
+        File.objects.filter(pk=file_record.pk).update(status='Queued')
+        return job
+
+
+def claim_next(worker_id: str) -> IngestionJob:
+    """
+    Atomically move the oldest queued job to RUNNING for `worker_id`.
+
+    Uses a conditional UPDATE rather than SELECT ... FOR UPDATE so it works the
+    same on SQLite and PostgreSQL. Returns None when the queue is empty.
+    """
+    while True:
+        job_id = (
+            IngestionJob.objects
+            .filter(status=IngestionJob.QUEUED)
+            .order_by('id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+
+        now = timezone.now()
+        claimed = IngestionJob.objects.filter(pk=job_id, status=IngestionJob.QUEUED).update(
+            status=IngestionJob.RUNNING,
+            worker=worker_id,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return IngestionJob.objects.select_related('file').get(pk=job_id)
+        # Another worker won the race; try the next one.
+
+
+def requeue_stale(stale_after: timedelta = STALE_AFTER, max_attempts: int = MAX_ATTEMPTS) -> int:
+    """
+    Requeue RUNNING jobs whose worker stopped sending heartbeats, or fail them
+    (and their files, as `finish_job` does) once they have used up
+    `max_attempts`. Returns the number of jobs touched.
+    """
+    cutoff = timezone.now() - stale_after
+    stale = IngestionJob.objects.filter(status=IngestionJob.RUNNING, heartbeat_at__lt=cutoff)
+
+    with transaction.atomic():
+        # Locked so a late heartbeat cannot revive a job whose file we fail
+        exhausted = list(
+            stale.filter(attempts__gte=max_attempts).select_for_update().values_list('pk', 'file_id')
+        )
+        failed = IngestionJob.objects.filter(pk__in=[pk for pk, _ in exhausted]).update(
+            status=IngestionJob.FAILED,
+            error='Worker stopped responding.',
+            finished_at=timezone.now(),
+        )
+        File.objects.filter(pk__in=[file_id for _, file_id in exhausted]).update(status='Error')
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status=IngestionJob.QUEUED,
+        worker='',
+    )
+    if failed or requeued:
+        logger.warning(f"Stale ingestion jobs: {requeued} requeued, {failed} failed")
+    return failed + requeued
+
+
+def run_job(job: IngestionJob, upload_folder: str) -> IngestionJob:
+    """
+    Run one claimed job to completion and record the outcome on the job and file.
+    """
+    from chat.utils.process_file import process_file
+
+    file_record = job.file
+    File.objects.filter(pk=file_record.pk).update(status='Processing')
+
+    progress = JobProgress(job)
+    new_status = process_file(file_record, upload_folder, progress=progress)
+    return finish_job(job, progress, new_status)
+
+
+def finish_job(job: IngestionJob, progress: JobProgress, new_status: str) -> IngestionJob:
+    """
+    Record the outcome of processing (`process_file`'s status) on the job and file.
+    """
+    job.status = IngestionJob.SUCCEEDED if new_status == 'Processed' else IngestionJob.FAILED
+    job.error = '' if new_status == 'Processed' else (progress.error or new_status)
+    job.stage = progress.current or ''
+    job.progress = progress.stages
+    job.finished_at = timezone.now()
+    job.heartbeat_at = job.finished_at
+    job.save(update_fields=['status', 'error', 'stage', 'progress', 'finished_at', 'heartbeat_at'])
+
+    File.objects.filter(pk=job.file_id).update(status=new_status)
+    logger.info(f"Ingestion job {job.id} for {job.file.filename}: {new_status}")
+    return job
+
+
+def claim_batch(job: IngestionJob, worker_id: str) -> list:
+    """
+    Claim the rest of `job`'s batch for the worker that claimed `job`, so one
+    worker parses and embeds the whole batch together. Returns every job of
+    the batch now running on `worker_id`.
+    """
+    now = timezone.now()
+    IngestionJob.objects.filter(batch_id=job.batch_id, status=IngestionJob.QUEUED).update(
+        status=IngestionJob.RUNNING,
+        worker=worker_id,
+        attempts=F('attempts') + 1,
+        started_at=now,
+        heartbeat_at=now,
+    )
+    return list(
+        IngestionJob.objects
+        .filter(batch_id=job.batch_id, status=IngestionJob.RUNNING, worker=worker_id)
+        .select_related('file')
+        .order_by('id')
+    )
+
+
+def run_batch(jobs: list, upload_folder: str) -> list:
+    """
+    Run claimed jobs of one batch together (see `bulk_ingest.ingest_batch`).
+    """
+    from chat.utils.bulk_ingest import ingest_batch
+
+    File.objects.filter(pk__in=[job.file_id for job in jobs]).update(status='Processing')
+    return ingest_batch(jobs, upload_folder)
+
+
+def run_worker(
+    upload_folder: str,
+    worker_id: str = None,
+    poll_interval: float = POLL_INTERVAL,
+    stale_after: timedelta = STALE_AFTER,
+    stop_event: threading.Event = None,
+    exit_when_idle: bool = False,
+    heartbeat_interval: float = HEARTBEAT_INTERVAL,
+):
+    """
+    Claim and run jobs until `stop_event` is set (or the queue is empty and
+    `exit_when_idle` is True), sending heartbeats for the claimed jobs every
+    `heartbeat_interval` seconds while they run.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    stop_event = stop_event or threading.Event()
+    logger.info(f"Ingestion worker {worker_id} started")
+
+    while not stop_event.is_set():
+        close_old_connections()
+        requeue_stale(stale_after)
+
+        job = claim_next(worker_id)
+        if job is None:
+            if exit_when_idle:
+                break
+            stop_event.wait(poll_interval)
+            continue
+
+        jobs = claim_batch(job, worker_id) if job.batch_id else [job]
+        try:
+            with Heartbeat(jobs, worker_id, heartbeat_interval):
+                if job.batch_id:
+                    run_batch(jobs, upload_folder)
+                else:
+                    run_job(job, upload_folder)
+        except Exception as e:
+            logger.exception(f"Ingestion job {job.id} crashed")
+            unfinished = IngestionJob.objects.filter(
+                pk__in=[j.pk for j in jobs], status=IngestionJob.RUNNING
+            )
+            File.objects.filter(pk__in=unfinished.values('file_id')).update(status='Error')
+            unfinished.update(
+                status=IngestionJob.FAILED,
+                error=str(e),
+                finished_at=timezone.now(),
+            )
+
+    logger.info(f"Ingestion worker {worker_id} stopped")
+
+
+def worker_process_main(index: int, options: dict):
+    """
+    Entry point for worker processes started by the `ingest_worker` command.
+    """
+    import django
+    django.setup()
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    run_worker(
+        upload_folder=options['upload_folder'],
+        worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}",
+        poll_interval=options['poll_interval'],
+        stale_after=options['stale_after'],
+        stop_event=stop_event,
+        exit_when_idle=options['exit_when_idle'],
+        heartbeat_interval=options['heartbeat_interval'],
+    )
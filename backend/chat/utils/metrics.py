@@ -0,0 +1,122 @@
+import re
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Most recent observations kept per metric for percentile estimates
+RESERVOIR_SIZE = 2048
+
+_lock = threading.Lock()
+_series = {}
+
+
+class Series:
+    """
+    Running count/sum plus a sliding window of recent observations.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def quantile(self, q: float):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def observe(name: str, value: float, **labels):
+    """
+    Record one observation of metric `name` (seconds, bytes, tokens, ...).
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = Series()
+        series.observe(value)
+
+
+@contextmanager
+def timed(name: str, **labels):
+    """
+    Observe the wall time of the `with` block, in seconds, as metric `name`.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def snapshot() -> list:
+    """
+    [{'name', 'labels', 'count', 'sum', 'p50', 'p95', 'p99'}] for every series.
+    """
+    with _lock:
+        items = list(_series.items())
+        return [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": series.count,
+                "sum": series.total,
+                "p50": series.quantile(0.50),
+                "p95": series.quantile(0.95),
+                "p99": series.quantile(0.99),
+            }
+            for (name, labels), series in items
+        ]
+
+
+def reset():
+    with _lock:
+        _series.clear()
+
+
+QUANTILES = [("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")]
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{_metric_name(key)}="{_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+def render_prometheus() -> str:
+    """
+    Every series in the Prometheus text exposition format, as a summary:
+    p50/p95/p99 quantiles over the recent window plus lifetime _sum and
+    _count. Values are per process; scrape each worker to aggregate.
+    """
+    families = {}
+    for series in snapshot():
+        families.setdefault(_metric_name(series["name"]), []).append(series)
+
+    lines = []
+    for name, members in sorted(families.items()):
+        lines.append(f"# TYPE {name} summary")
+        for series in members:
+            labels = series["labels"]
+            for quantile, key in QUANTILES:
+                value = series[key]
+                lines.append(f"{name}{_labels({**labels, 'quantile': quantile})} {'NaN' if value is None else repr(float(value))}")
+            lines.append(f"{name}_sum{_labels(labels)} {float(series['sum'])!r}")
+            lines.append(f"{name}_count{_labels(labels)} {series['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,619 @@
+import os
+import json
+import math
+import sqlite3
+import logging
+import threading
+
+import numpy as np
+
+from chat.utils.quantization import QUANTIZATIONS, Codec, unit
+from chat.utils.vector_backends import INCLUDE_ALL, Record, VectorBackend, matches
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    slot INTEGER PRIMARY KEY,
+    id TEXT UNIQUE,
+    document TEXT,
+    metadata TEXT,
+    list INTEGER NOT NULL DEFAULT -1,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rows_version ON rows (version);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# SQLite caps the number of bound parameters per statement
+SQL_BATCH = 500
+# Rows scored per matrix product when assigning vectors to IVF lists
+ASSIGN_BATCH = 16384
+# The vector and code files grow by at least this many rows at a time
+MIN_GROWTH = 1024
+KMEANS_ITERATIONS = 10
+# Training sample per IVF list
+KMEANS_SAMPLE_PER_LIST = 64
+# Metadata filters whose matching slots a snapshot remembers
+FILTER_CACHE_SIZE = 32
+
+
+def map_matrix(path: str, dtype, width: int, rows: int, current=None):
+    """
+    The file at `path` mapped as a (capacity, width) matrix with at least
+    `rows` rows (`current` if it is big enough already), or None if it is
+    not there yet. A plain ndarray view: slicing a memmap subclass is much
+    slower.
+    """
+    if current is not None and current.shape[0] >= rows:
+        return current
+    if not width or not os.path.exists(path):
+        return None
+    capacity = os.path.getsize(path) // (np.dtype(dtype).itemsize * width)
+    if not capacity:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r+", shape=(capacity, width)).view(np.ndarray)
+
+
+def write_rows(path: str, dtype, width: int, positions: np.ndarray, values: np.ndarray):
+    """
+    Write `values` to rows `positions` of the matrix file at `path` and
+    flush them, growing the file (doubling it) if needed.
+    """
+    row_bytes = np.dtype(dtype).itemsize * width
+    capacity = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+    rows = int(positions.max()) + 1
+    if rows > capacity:
+        capacity = max(rows, 2 * capacity, MIN_GROWTH)
+        with open(path, "ab") as f:
+            f.truncate(capacity * row_bytes)
+    matrix = np.memmap(path, dtype=dtype, mode="r+", shape=(capacity, width))
+    matrix[positions] = values
+    matrix.flush()
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the `k` highest finite scores, highest first.
+    """
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def spherical_kmeans(vectors: np.ndarray, lists: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    `lists` unit centroids clustering the unit rows of `vectors` by cosine.
+    """
+    vectors = unit(vectors)
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.flatnonzero(~sums.any(axis=1))
+        # Re-seed empty lists from random rows
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = unit(sums)
+    return centroids.astype(np.float32)
+
+
+class Snapshot:
+    """
+    The index as of one version. Apart from its filter cache it is never
+    modified once published, so searches run on it without holding the lock.
+    """
+
+    __slots__ = ("version", "ivf_version", "dim", "ids", "positions", "metadatas", "norms", "lists",
+                 "vectors", "codes", "centroids", "inverted", "unassigned", "alive", "filters")
+
+    def __init__(self):
+        self.version = 0
+        self.ivf_version = 0
+        self.dim = 0
+        self.ids = []          # per slot; None for a free slot
+        self.positions = {}    # {id: slot} of the live slots
+        self.metadatas = []    # per slot
+        self.norms = np.zeros(0, dtype=np.float32)  # of full vectors; 0 for a free slot
+        self.lists = np.zeros(0, dtype=np.int32)
+        self.vectors = None    # full vectors (mapped), rows >= len(ids) unused
+        self.codes = None      # coded vectors (mapped), unless the codec is the identity
+        self.centroids = None
+        self.inverted = None   # [slots of list i]
+        self.unassigned = None
+        self.alive = np.zeros(0, dtype=bool)
+        self.filters = {}      # {filter as JSON: matching slots}
+
+
+class NumpyIndex(VectorBackend):
+    """
+    In-process vector index in a directory of its own: float32 vectors in a
+    memory-mapped matrix (`vectors.f32`, one row per slot) and ids,
+    documents, metadata and IVF list numbers in SQLite (`records.sqlite3`).
+
+    Search is cosine similarity. Below `ivf_min_vectors` live vectors, or
+    with a metadata filter, it is a brute-force matrix product. From there
+    on an IVF partition is trained (spherical k-means, `ivf_lists` lists,
+    0 = sqrt(n)) and a query only scores the `ivf_nprobe` lists whose
+    centroids are closest. The partition is retrained whenever the index
+    has doubled since.
+
+    With `dims` and/or `quantization` set (see `quantization.Codec`) search
+    runs on compact codes (`codes.u8`) instead of the full vectors, and the
+    `rescore` × k best are re-ranked on the full vectors, which are then
+    only read for those candidates. `rescore` = 0 skips that pass and does
+    not keep the full vectors at all; records then carry decoded vectors.
+    The storage format is fixed when the first vector is written.
+
+    Every write bumps a version in SQLite, so other processes sharing the
+    directory pick up only the rows changed since their last search.
+    Writers serialize on SQLite's write lock. Deleted slots are reused. An
+    upserted id always moves to a free or new slot, freeing its old one, so
+    vectors are written before the commit without touching live rows.
+    """
+
+    def __init__(self, path: str, embeddings=None, name: str = "", ivf_min_vectors: int = 20000,
+                 ivf_lists: int = 0, ivf_nprobe: int = 8, dims: int = 0, quantization: str = "none",
+                 rescore: int = 4):
+        self.path = str(path)
+        self.embeddings = embeddings
+        self.name = name or os.path.basename(self.path)
+        self.ivf_min_vectors = ivf_min_vectors
+        self.ivf_lists = ivf_lists
+        self.ivf_nprobe = ivf_nprobe
+        self.codec = Codec(dims, quantization)
+        self.rescore = rescore
+        # Full vectors are what the identity codec searches, and what rescoring reads
+        self.keep_vectors = self.codec.identity or rescore > 0
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.codes_path = os.path.join(self.path, "codes.u8")
+        self.centroids_path = os.path.join(self.path, "centroids.npy")
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._connections = []  # [(pid, connection)] of every thread, for close()
+        self._snapshot = Snapshot()
+        os.makedirs(self.path, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        if self._meta(conn, "dim"):
+            self._check_format(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            # Still used by this thread only; other threads may just close it
+            conn = sqlite3.connect(
+                os.path.join(self.path, "records.sqlite3"), timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            with self._lock:
+                self._connections.append((os.getpid(), conn))
+        return conn
+
+    def close(self):
+        """
+        Close every thread's SQLite connection and drop the mapped vectors.
+        The index stays usable: the next call reconnects and maps again,
+        and searches already running keep the snapshot they hold.
+        """
+        with self._lock:
+            for pid, conn in self._connections:
+                if pid == os.getpid():
+                    conn.close()
+            self._connections = []
+            self._local = threading.local()
+            self._snapshot = Snapshot()
+
+    @staticmethod
+    def _meta(conn, name: str, default: int = 0) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    @staticmethod
+    def _set_meta(conn, name: str, value: int):
+        conn.execute(
+            "INSERT INTO meta (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, value),
+        )
+
+    def _format(self) -> dict:
+        return {
+            "codec_dims": self.codec.dims,
+            "codec_quantization": QUANTIZATIONS.index(self.codec.quantization),
+            "full_vectors": int(self.keep_vectors),
+        }
+
+    def _check_format(self, conn):
+        stored = {name: self._meta(conn, name) for name in self._format()}
+        if stored != self._format():
+            raise ValueError(
+                f"Index {self.name} was built with {stored}, not {self._format()}; "
+                f"re-process its files into an empty store to change the vector format"
+            )
+
+    def _map_vectors(self, dim: int, rows: int, current=None):
+        return map_matrix(self.vectors_path, np.float32, dim, rows, current) if self.keep_vectors else None
+
+    def _map_codes(self, dim: int, rows: int, current=None):
+        if self.codec.identity or not dim:
+            return None
+        return map_matrix(self.codes_path, np.uint8, self.codec.row_bytes(dim), rows, current)
+
+    def _search_vectors(self, vectors, codes, slots, dim: int) -> np.ndarray:
+        """
+        Unit float rows in the searched dimensions for `slots`: projected
+        full vectors, or decoded codes when those are all there is.
+        """
+        if vectors is not None:
+            return self.codec.project(np.asarray(vectors[slots]))
+        return self.codec.decode(codes[slots], dim)
+
+    # Reading
+
+    def _sync(self) -> Snapshot:
+        """
+        Publish a new snapshot if another writer (or process) changed the
+        index since the current one, reading only the changed rows.
+        """
+        conn = self._connect()
+        with self._lock:
+            current = self._snapshot
+            version = self._meta(conn, "version")
+            if version == current.version:
+                return current
+
+            ivf_version = self._meta(conn, "ivf_version")
+            since = current.version if ivf_version == current.ivf_version else 0
+            changed = conn.execute(
+                "SELECT slot, id, metadata, list FROM rows WHERE version > ? ORDER BY slot", (since,)
+            ).fetchall()
+            slots = max((row[0] for row in changed), default=-1) + 1
+
+            snapshot = Snapshot()
+            snapshot.version = version
+            snapshot.ivf_version = ivf_version
+            size = max(len(current.ids), slots)
+            snapshot.ids = current.ids + [None] * (size - len(current.ids))
+            snapshot.positions = dict(current.positions)
+            snapshot.metadatas = current.metadatas + [None] * (size - len(current.metadatas))
+            snapshot.lists = np.resize(current.lists, size) if len(current.lists) else np.full(size, -1, np.int32)
+            snapshot.lists[len(current.lists):] = -1
+            snapshot.norms = np.zeros(size, dtype=np.float32)
+            snapshot.norms[:len(current.norms)] = current.norms
+            for slot, id_, metadata, list_number in changed:
+                previous = snapshot.ids[slot]
+                # Unless the previous id already moved to a slot updated before this one
+                if previous is not None and snapshot.positions.get(previous) == slot:
+                    del snapshot.positions[previous]
+                if id_ is not None:
+                    snapshot.positions[id_] = slot
+                snapshot.ids[slot] = id_
+                snapshot.metadatas[slot] = json.loads(metadata) if metadata else None
+                snapshot.lists[slot] = list_number
+            snapshot.alive = np.array([id_ is not None for id_ in snapshot.ids], dtype=bool)
+
+            snapshot.dim = self._meta(conn, "dim")
+            snapshot.vectors = self._map_vectors(snapshot.dim, size, current.vectors)
+            snapshot.codes = self._map_codes(snapshot.dim, size, current.codes)
+            changed_slots = np.array([row[0] for row in changed if row[1] is not None], dtype=np.int64)
+            if len(changed_slots) and snapshot.vectors is not None:
+                snapshot.norms[changed_slots] = np.linalg.norm(snapshot.vectors[changed_slots], axis=1)
+            snapshot.norms[~snapshot.alive] = 0
+
+            snapshot.centroids = current.centroids
+            if ivf_version != current.ivf_version:
+                snapshot.centroids = np.load(self.centroids_path) if ivf_version else None
+            if snapshot.centroids is not None:
+                live = np.flatnonzero(snapshot.alive)
+                order = live[np.argsort(snapshot.lists[live], kind="stable")]
+                bounds = np.searchsorted(snapshot.lists[order], np.arange(len(snapshot.centroids) + 1))
+                snapshot.unassigned = order[:bounds[0]]
+                snapshot.inverted = [order[bounds[i]:bounds[i + 1]] for i in range(len(snapshot.centroids))]
+
+            self._snapshot = snapshot
+            return snapshot
+
+    def count(self) -> int:
+        return int(self._sync().alive.sum())
+
+    def _documents(self, slots, ids) -> dict:
+        """
+        {slot: document} for `slots`, skipping any whose id changed since
+        the snapshot was taken.
+        """
+        conn = self._connect()
+        expected = dict(zip(slots, ids))
+        documents = {}
+        for start in range(0, len(slots), SQL_BATCH):
+            batch = slots[start:start + SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for slot, id_, document in conn.execute(
+                f"SELECT slot, id, document FROM rows WHERE slot IN ({placeholders})", batch
+            ):
+                if expected[slot] == id_:
+                    documents[slot] = document
+        return documents
+
+    def _records(self, snapshot: Snapshot, slots, include=INCLUDE_ALL) -> list:
+        slots = [int(slot) for slot in slots]
+        ids = [snapshot.ids[slot] for slot in slots]
+        documents = self._documents(slots, ids) if "documents" in include else None
+        records = []
+        for slot, id_ in zip(slots, ids):
+            if documents is not None and slot not in documents:
+                continue
+            records.append(Record(
+                id_,
+                documents[slot] if documents is not None else None,
+                snapshot.metadatas[slot] if "metadatas" in include else None,
+                self._vector(snapshot, slot) if "embeddings" in include else None,
+            ))
+        return records
+
+    def _vector(self, snapshot: Snapshot, slot: int) -> np.ndarray:
+        if snapshot.vectors is not None:
+            return np.array(snapshot.vectors[slot])
+        return self.codec.decode(snapshot.codes[slot:slot + 1], snapshot.dim)[0]
+
+    def _filtered(self, snapshot: Snapshot, where: dict) -> np.ndarray:
+        """
+        Live slots matching `where`, remembered for the snapshot's lifetime.
+        """
+        key = json.dumps(where, sort_keys=True)
+        slots = snapshot.filters.get(key)
+        if slots is None:
+            slots = np.array([
+                slot for slot in np.flatnonzero(snapshot.alive)
+                if matches(snapshot.metadatas[slot] or {}, where)
+            ], dtype=np.int64)
+            if len(snapshot.filters) >= FILTER_CACHE_SIZE:
+                snapshot.filters.clear()
+            snapshot.filters[key] = slots
+        return slots
+
+    def get(self, ids=None, where: dict = None, include=INCLUDE_ALL, limit: int = None, offset: int = 0) -> list:
+        snapshot = self._sync()
+        if ids is not None:
+            slots = [snapshot.positions[id_] for id_ in ids if id_ in snapshot.positions]
+            if where:
+                slots = [slot for slot in slots if matches(snapshot.metadatas[slot] or {}, where)]
+        elif where:
+            slots = list(self._filtered(snapshot, where))
+        else:
+            slots = list(np.flatnonzero(snapshot.alive))
+        end = None if limit is None else offset + limit
+        return self._records(snapshot, slots[offset:end], include)
+
+    def _candidates(self, snapshot: Snapshot, vector: np.ndarray):
+        """
+        Slots to score for an unfiltered query, or None to score them all.
+        """
+        if snapshot.centroids is None or snapshot.alive.sum() < self.ivf_min_vectors:
+            return None
+        probes = np.argsort(-(snapshot.centroids @ self.codec.project(vector)))[:self.ivf_nprobe]
+        return np.concatenate([snapshot.unassigned] + [snapshot.inverted[i] for i in probes])
+
+    def _exact_scores(self, snapshot: Snapshot, slots, vector: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of the full vectors in `slots` (None = every
+        slot) to `vector`; -inf for free slots.
+        """
+        if slots is None:
+            rows, norms = snapshot.vectors[:len(snapshot.ids)], snapshot.norms
+        else:
+            rows, norms = snapshot.vectors[slots], snapshot.norms[slots]
+        scores = np.asarray(rows @ unit(vector))
+        return np.where(norms > 0, scores / np.where(norms > 0, norms, 1), -np.inf)
+
+    def _coded_scores(self, snapshot: Snapshot, slots, vector: np.ndarray) -> np.ndarray:
+        if slots is None:
+            codes, alive = snapshot.codes[:len(snapshot.ids)], snapshot.alive
+        else:
+            codes, alive = snapshot.codes[slots], snapshot.alive[slots]
+        return np.where(alive, self.codec.scores(codes, vector, snapshot.dim), -np.inf)
+
+    def query(self, vector, k: int, where: dict = None) -> list:
+        snapshot = self._sync()
+        if not snapshot.dim or not snapshot.alive.any():
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+
+        slots = self._filtered(snapshot, where) if where else self._candidates(snapshot, vector)
+        if slots is not None and not len(slots):
+            return []
+        if self.codec.identity:
+            scores = self._exact_scores(snapshot, slots, vector)
+            rescoring = False
+        else:
+            scores = self._coded_scores(snapshot, slots, vector)
+            rescoring = snapshot.vectors is not None and self.rescore > 0
+        top = top_k(scores, k * self.rescore if rescoring else k)
+        found = top if slots is None else slots[top]
+        if rescoring:
+            found = found[top_k(self._exact_scores(snapshot, found, vector), k)]
+        return self._records(snapshot, found)
+
+    # Writing
+
+    def _assign(self, conn, vectors: np.ndarray) -> np.ndarray:
+        """
+        IVF list of each vector under the centroids current in `conn`'s transaction.
+        """
+        if not self._meta(conn, "ivf_version"):
+            return np.full(len(vectors), -1, dtype=np.int32)
+        centroids = np.load(self.centroids_path)
+        lists = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_BATCH):
+            batch = self.codec.project(vectors[start:start + ASSIGN_BATCH])
+            lists[start:start + ASSIGN_BATCH] = np.argmax(batch @ centroids.T, axis=1)
+        return lists
+
+    def upsert(self, ids, vectors, documents, metadatas):
+        ids = list(ids)
+        if not ids:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            dim = self._meta(conn, "dim")
+            if not dim:
+                dim = vectors.shape[1]
+                self.codec.search_dims(dim)
+                self._set_meta(conn, "dim", dim)
+                for name, value in self._format().items():
+                    self._set_meta(conn, name, value)
+            # Without full vectors the searched dimensions are all there is to
+            # store, so vectors read back from such an index can be written again
+            truncated = not self.keep_vectors and vectors.shape[1] == self.codec.search_dims(dim)
+            if vectors.shape[1] != dim and not truncated:
+                raise ValueError(f"Index {self.name} holds {dim}-dim vectors, got {vectors.shape[1]}")
+            version = self._meta(conn, "version") + 1
+
+            replaced = []
+            for start in range(0, len(ids), SQL_BATCH):
+                batch = ids[start:start + SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                replaced += [row[0] for row in conn.execute(
+                    f"SELECT slot FROM rows WHERE id IN ({placeholders})", batch
+                )]
+            # Every id, new or replaced, gets a free or new slot: the vectors are
+            # written before the commit, so a rollback must leave them where no
+            # row points. Replaced ids release their old slot with the commit.
+            unique = list(dict.fromkeys(ids))
+            free = [row[0] for row in conn.execute(
+                "SELECT slot FROM rows WHERE id IS NULL ORDER BY slot LIMIT ?", (len(unique),)
+            )]
+            next_slot = conn.execute("SELECT COALESCE(MAX(slot), -1) + 1 FROM rows").fetchone()[0]
+            free += range(next_slot, next_slot + len(unique) - len(free))
+            slots = dict(zip(unique, free))
+
+            positions = np.array([slots[id_] for id_ in ids], dtype=np.int64)
+            if self.keep_vectors:
+                write_rows(self.vectors_path, np.float32, dim, positions, vectors)
+            if not self.codec.identity:
+                write_rows(self.codes_path, np.uint8, self.codec.row_bytes(dim), positions, self.codec.encode(vectors))
+
+            lists = self._assign(conn, vectors)
+            conn.executemany(
+                "UPDATE rows SET id = NULL, document = NULL, metadata = NULL, list = -1, version = ? WHERE slot = ?",
+                [(version, slot) for slot in replaced],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO rows (slot, id, document, metadata, list, version) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (int(slot), id_, document, json.dumps(metadata or {}), int(list_number), version)
+                    for slot, id_, document, metadata, list_number in zip(positions, ids, documents, metadatas, lists)
+                ],
+            )
+            self._set_meta(conn, "version", version)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_train()
+
+    def update_metadatas(self, ids, metadatas):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = self._meta(conn, "version") + 1
+            conn.executemany(
+                "UPDATE rows SET metadata = ?, version = ? WHERE id = ?",
+                [(json.dumps(metadata or {}), version, id_) for id_, metadata in zip(ids, metadatas)],
+            )
+            self._set_meta(conn, "version", version)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = self._meta(conn, "version") + 1
+            for start in range(0, len(ids), SQL_BATCH):
+                batch = ids[start:start + SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(
+                    f"UPDATE rows SET id = NULL, document = NULL, metadata = NULL, list = -1, version = ? "
+                    f"WHERE id IN ({placeholders})",
+                    [version, *batch],
+                )
+            self._set_meta(conn, "version", version)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _maybe_train(self):
+        conn = self._connect()
+        live = conn.execute("SELECT COUNT(*) FROM rows WHERE id IS NOT NULL").fetchone()[0]
+        trained_on = self._meta(conn, "ivf_trained_on")
+        if live < self.ivf_min_vectors or (trained_on and live < 2 * trained_on):
+            return
+        self.train()
+
+    def train(self, seed: int = 0):
+        """
+        (Re)build the IVF partition over the live vectors: k-means on a
+        sample, then every vector assigned to its nearest centroid.
+        """
+        snapshot = self._sync()
+        live = np.flatnonzero(snapshot.alive)
+        if not len(live):
+            return
+        lists = self.ivf_lists or int(math.sqrt(len(live)))
+        lists = max(1, min(lists, len(live)))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(live, min(len(live), lists * KMEANS_SAMPLE_PER_LIST), replace=False))
+        centroids = spherical_kmeans(
+            self._search_vectors(snapshot.vectors, snapshot.codes, sample, snapshot.dim), lists, rng,
+        )
+        logger.info(f"Trained {lists} IVF lists for {self.name} on {len(sample)} of {len(live)} vectors")
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            temp_path = f"{self.centroids_path}.{os.getpid()}.tmp.npy"
+            np.save(temp_path, centroids)
+            os.replace(temp_path, self.centroids_path)
+            ivf_version = self._meta(conn, "ivf_version") + 1
+            self._set_meta(conn, "ivf_version", ivf_version)
+
+            # Assign under the write lock, so no row keeps a list of the old centroids
+            rows = conn.execute("SELECT slot FROM rows WHERE id IS NOT NULL ORDER BY slot").fetchall()
+            slots = np.array([row[0] for row in rows], dtype=np.int64)
+            dim = self._meta(conn, "dim")
+            size = int(slots.max()) + 1 if len(slots) else 0
+            vectors, codes = self._map_vectors(dim, size), self._map_codes(dim, size)
+            assignment = np.empty(len(slots), dtype=np.int32)
+            for start in range(0, len(slots), ASSIGN_BATCH):
+                batch = self._search_vectors(vectors, codes, slots[start:start + ASSIGN_BATCH], dim)
+                assignment[start:start + ASSIGN_BATCH] = np.argmax(batch @ centroids.T, axis=1)
+            version = self._meta(conn, "version") + 1
+            conn.executemany(
+                "UPDATE rows SET list = ?, version = ? WHERE slot = ?",
+                [(int(list_number), version, int(slot)) for slot, list_number in zip(slots, assignment)],
+            )
+            self._set_meta(conn, "version", version)
+            self._set_meta(conn, "ivf_trained_on", len(slots))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
@@ -0,0 +1,185 @@
+import os
+import atexit
+import logging
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+
+from chat.utils import vector_stores
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker():
+    """
+    Pool initializer: spawned children start without Django configured.
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def split_pages(pages: list):
+    """
+    Split [(text, metadata)] pages. Returns (pages, chunks) with chunks as
+    plain (text, metadata) pairs, cheap to send back to the parent.
+    """
+    from langchain_core.documents import Document
+    from chat.utils.process_file import get_splitter
+
+    documents = [Document(page_content=text, metadata=metadata) for text, metadata in pages]
+    chunks = get_splitter().split_documents(documents)
+    return len(pages), [(chunk.page_content, chunk.metadata) for chunk in chunks]
+
+
+def parse_file(file_path: str, metadata: dict):
+    """
+    Load and split a whole document. Returns (pages, chunks) like `split_pages`.
+    """
+    from chat.utils.process_file import iter_pages
+
+    pages = []
+    for page in iter_pages(file_path):
+        page.metadata.update(metadata)
+        pages.append((page.page_content, page.metadata))
+    return split_pages(pages)
+
+
+def pdf_page_count(file_path: str) -> int:
+    import pypdf
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def pdf_metadata(reader, file_path: str) -> dict:
+    """
+    Document metadata of a PDF, normalized the way PyPDFLoader does it:
+    keys lowercased without their leading "/", values as str or int, and
+    PDF dates as ISO 8601.
+    """
+    raw = (
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": file_path, "total_pages": len(reader.pages)}
+    )
+    metadata = {}
+    for key, value in raw.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = key.lstrip("/").lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                value = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                pass
+        elif key == "page_count":
+            metadata["total_pages"] = value
+        elif key == "file_path":
+            metadata["source"] = value
+        elif isinstance(value, str):
+            value = value.strip()
+        metadata[key] = value
+    return metadata
+
+
+def parse_pdf_pages(file_path: str, start: int, stop: int, metadata: dict):
+    """
+    Extract and split pages [start, stop) of a PDF, with the same text and
+    page metadata PyPDFLoader produces for them.
+    """
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    document_metadata = pdf_metadata(reader, file_path)
+    pages = []
+    for number in range(start, min(stop, len(reader.pages))):
+        text = reader.pages[number].extract_text(extraction_mode="plain").strip()
+        pages.append((text, {
+            **document_metadata,
+            "page": number,
+            "page_label": reader.page_labels[number],
+            **metadata,
+        }))
+    return split_pages(pages)
+
+
+def parse_tasks(file_path: str, metadata: dict):
+    """
+    Pool tasks (function, *args) that together parse and split one file, in
+    document order: ranges of INGEST_PDF_PAGES_PER_TASK pages for PDFs,
+    windows of text segments read here for .txt, the whole file otherwise.
+    """
+    from chat.utils.process_file import iter_text_segments, iter_windows
+
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        step = max(1, settings.INGEST_PDF_PAGES_PER_TASK)
+        for start in range(0, pdf_page_count(file_path), step):
+            yield parse_pdf_pages, file_path, start, start + step, metadata
+    elif ext == ".txt":
+        for window in iter_windows(iter_text_segments(file_path), settings.INGEST_WINDOW_PAGES):
+            yield split_pages, [(page.page_content, {**page.metadata, **metadata}) for page in window]
+    else:
+        yield parse_file, file_path, metadata
+
+
+def ordered_results(pool: Executor, tasks, max_in_flight: int):
+    """
+    Submit `tasks` with at most `max_in_flight` outstanding and yield their
+    results in submission order.
+    """
+    tasks = iter(tasks)
+    pending = deque(pool.submit(*task) for task in islice(tasks, max_in_flight))
+    while pending:
+        result = pending.popleft().result()
+        for task in islice(tasks, 1):
+            pending.append(pool.submit(*task))
+        yield result
+
+
+class InlineExecutor(Executor):
+    """
+    Runs each task in the calling process when it is submitted.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def parse_workers() -> int:
+    """
+    INGEST_PARSE_WORKERS, with 0 meaning one per CPU.
+    """
+    return max(1, settings.INGEST_PARSE_WORKERS or os.cpu_count() or 1)
+
+
+def get_parse_pool() -> Executor:
+    """
+    Process-wide pool for CPU-bound parsing and splitting, so the GIL of
+    the calling process is not held through it. Children are spawned
+    rather than forked so they never inherit the parent's Chroma/DB client
+    threads. With a single worker, tasks run inline instead.
+    """
+    def build():
+        workers = parse_workers()
+        if workers == 1:
+            return InlineExecutor()
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+        atexit.register(pool.shutdown, cancel_futures=True)
+        return pool
+
+    return vector_stores.get_or_create("parse_pool", build)
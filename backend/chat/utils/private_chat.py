@@ -1,42 +1,63 @@
-import os
 import logging
-from django.conf import settings
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_chroma import Chroma
-from langchain.chains import RetrievalQA
+import warnings
+from asgiref.sync import sync_to_async
+from chat.utils import vector_stores
+from chat.utils.bm25 import get_sparse_index
+from chat.utils.conversation_memory import (
+    acondense_question,
+    aload_memory,
+    condense_question,
+    load_memory,
+    question_with_history,
+)
+from chat.utils.retrieval import HybridRetriever, arun_qa, run_qa
+from chat.utils.streaming import stream_answer
 
 logger = logging.getLogger(__name__)
 
-# Constants
-PRIVATE_DB_PATH = os.path.join(settings.BASE_DIR, "private_chroma_db")
-COLLECTION_NAME = "example_collection"
 
-# Embeddings and vector store
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-private_vector_store = Chroma(
-    collection_name=COLLECTION_NAME,
-    embedding_function=embeddings,
-    persist_directory=PRIVATE_DB_PATH,
-)
+def get_private_answer_chain():
+    """
+    Build (once per process) the "stuff" chain that answers from retrieved
+    chunks, shared by every user's private chain.
+    """
+    def build():
+        from langchain.chains.question_answering import load_qa_chain
 
-# Retriever
-private_retriever = private_vector_store.as_retriever(search_kwargs={"k": 3})
+        # The chain `RetrievalQA.from_chain_type` builds, where LangChain
+        # silences its deprecation warning as an internal call
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            return load_qa_chain(vector_stores.get_chat_model(), chain_type="stuff")
 
-# LLM model
-chat_model = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+    return vector_stores.get_or_create("private_answer_chain", build)
 
-# QA Chain
-private_qa_chain = RetrievalQA.from_chain_type(
-    llm=chat_model,
-    chain_type="stuff",
-    retriever=private_retriever,
-    return_source_documents=True,
-)
+
+def get_user_qa_chain(user_id: int):
+    """
+    The private RetrievalQA chain with retrieval over `user_id`'s own
+    collection. Built per request around the shared answer chain.
+    """
+    from langchain.chains import RetrievalQA
+
+    retriever = HybridRetriever.from_settings(
+        vector_stores.get_private_store(user_id),
+        get_sparse_index(vector_stores.PRIVATE, user_id),
+        endpoint="private",
+    )
+    return RetrievalQA(
+        combine_documents_chain=get_private_answer_chain(),
+        retriever=retriever,
+        return_source_documents=True,
+    )
 
 
-def ask(question: str) -> dict:
+def ask(question: str, user_id: int) -> dict:
     """
-    Run RetrievalQA chain on a user question using the private vector DB.
+    Run RetrievalQA chain on a user question over that user's chunks in the
+    private vector DB. The user's conversation memory is sent with the
+    question, and a follow-up is condensed into a standalone query for
+    retrieval (see `conversation_memory`).
     
     Returns:
         dict: {
@@ -45,10 +66,46 @@ def ask(question: str) -> dict:
         }
     """
     try:
-        return private_qa_chain.invoke({"query": question})
+        memory = load_memory(user_id)
+        query = condense_question(memory, question)
+        return run_qa(
+            get_user_qa_chain(user_id), question_with_history(memory, question), endpoint="private", query=query
+        )
+    except Exception as e:
+        logger.exception(f"Error in private chat retrieval for question: {question}")
+        return {
+            "result": "Sorry, something went wrong while processing your question.",
+            "source_documents": []
+        }
+
+
+async def ask_async(question: str, user_id: int) -> dict:
+    """
+    Async variant of `ask` using the chain's async interface, so the
+    embedding, vector search and LLM calls don't block the event loop.
+    """
+    try:
+        chain = await sync_to_async(get_user_qa_chain, thread_sensitive=False)(user_id)
+        memory = await aload_memory(user_id)
+        query = await acondense_question(memory, question)
+        return await arun_qa(chain, question_with_history(memory, question), endpoint="private", query=query)
     except Exception as e:
         logger.exception(f"Error in private chat retrieval for question: {question}")
         return {
             "result": "Sorry, something went wrong while processing your question.",
             "source_documents": []
         }
+
+
+async def ask_stream(question: str, user_id: int):
+    """
+    Streaming variant of `ask_async`: an async generator of
+    ('sources', docs) and then ('token', text) events (see `stream_answer`).
+    """
+    chain = await sync_to_async(get_user_qa_chain, thread_sensitive=False)(user_id)
+    memory = await aload_memory(user_id)
+    query = await acondense_question(memory, question)
+    async for event in stream_answer(
+        chain, question_with_history(memory, question), endpoint="private", query=query
+    ):
+        yield event
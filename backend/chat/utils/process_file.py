@@ -1,82 +1,369 @@
 import os
+import hashlib
 import logging
+from itertools import islice
 from django.conf import settings
-from chat.models import File
-
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from chat.models import File, IngestionJob
+from chat.utils import tracing, vector_stores
+from chat.utils.answer_cache import invalidate_public_answers
+from chat.utils.blobs import blob_path
+from chat.utils.embedding_pipeline import EmbeddingPipeline
+from chat.utils.parse_pool import get_parse_pool, ordered_results, parse_tasks, parse_workers
+from chat.utils.progress import Progress
 
 logger = logging.getLogger(__name__)
 
-# Embedding model
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
 
-# Vector DB paths
-PRIVATE_DB_PATH = os.path.join(settings.BASE_DIR, "private_chroma_db")
-PUBLIC_DB_PATH = os.path.join(settings.BASE_DIR, "public_chroma_db")
+def get_splitter():
+    """
+    Shared text splitter config.
+    """
+    def build():
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=100,
+            add_start_index=True,
+        )
+
+    return vector_stores.get_or_create("splitter", build)
+
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
+def get_loader(file_path: str):
+    """
+    Pick a LangChain document loader by file extension, or None if unsupported.
+    """
+    from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        return PyPDFLoader(file_path)
+    elif ext == ".docx":
+        return Docx2txtLoader(file_path)
+    elif ext == ".txt":
+        return TextLoader(file_path, encoding="utf-8")
+    return None
+
+
+def iter_text_segments(file_path: str, segment_chars: int = None):
+    """
+    Stream a text file as Documents of roughly `segment_chars` characters,
+    cut at line boundaries. Each segment is numbered like a PDF page.
+    """
+    from langchain_core.documents import Document
+
+    segment_chars = segment_chars or settings.INGEST_TEXT_SEGMENT_CHARS
+    page = 0
+    lines = []
+    size = 0
+    with open(file_path, encoding="utf-8") as f:
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= segment_chars:
+                yield Document(page_content="".join(lines), metadata={"page": page})
+                page += 1
+                lines = []
+                size = 0
+    if lines or page == 0:
+        yield Document(page_content="".join(lines), metadata={"page": page})
+
+
+def iter_pages(file_path: str):
+    """
+    Lazily yield the pages of a document without loading the whole file.
+    """
+    if os.path.splitext(file_path)[1].lower() == ".txt":
+        return iter_text_segments(file_path)
+    return get_loader(file_path).lazy_load()
+
+
+def iter_windows(iterable, size: int):
+    """
+    Yield lists of at most `size` consecutive items.
+    """
+    iterator = iter(iterable)
+    while True:
+        window = list(islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+
+def chunk_id(chunk, occurrence: int = 0) -> str:
+    """
+    Stable id for a chunk derived from its content's blob (or file), page,
+    content and its occurrence number among identical chunks on that page.
+    Character offsets are left out so an edit early in a page doesn't change
+    the id of every chunk after it. The display name is left out too: files
+    uploaded under one name never share chunk ids, and files with the same
+    content always do.
+    """
+    metadata = chunk.metadata
+    if "blob" in metadata:
+        owner = f"blob:{metadata['blob']}"
+    elif "file_id" in metadata:
+        owner = f"file:{metadata['file_id']}"
+    else:
+        owner = str(metadata.get("source", ""))
+    parts = [
+        owner,
+        str(metadata.get("page", "")),
+        chunk.page_content,
+        str(occurrence),
+    ]
+    key = "\0".join(parts)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
-# Chroma vector stores
-private_store = Chroma(
-    collection_name="example_collection",
-    embedding_function=embeddings,
-    persist_directory=PRIVATE_DB_PATH,
-)
 
-public_store = Chroma(
-    collection_name="example_collection",
-    embedding_function=embeddings,
-    persist_directory=PUBLIC_DB_PATH,
-)
+def assign_chunk_ids(chunks, occurrences: dict = None) -> dict:
+    """
+    Map stable chunk id -> chunk, preserving document order. Pass the same
+    `occurrences` dict across windows of one document.
+    """
+    occurrences = {} if occurrences is None else occurrences
+    result = {}
+    for chunk in chunks:
+        position = (chunk.metadata.get("page"), chunk.page_content)
+        occurrence = occurrences.get(position, 0)
+        occurrences[position] = occurrence + 1
+        result[chunk_id(chunk, occurrence)] = chunk
+    return result
 
-# Text splitter config
-splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=100,
-)
 
+def iter_split_windows(file_path: str, metadata: dict, progress: Progress = None):
+    """
+    Load pages in windows of INGEST_WINDOW_PAGES and split each window in
+    this process. Yields (pages, chunks).
+    """
+    progress = progress or Progress()
+    splitter = get_splitter()
+    windows = iter_windows(iter_pages(file_path), settings.INGEST_WINDOW_PAGES)
+    while True:
+        progress.start(IngestionJob.LOAD)
+        with tracing.span("ingest.load"):
+            window = next(windows, None)
+        if window is None:
+            return
+        for page in window:
+            page.metadata.update(metadata)
+        progress.start(IngestionJob.SPLIT)
+        with tracing.span("ingest.split"):
+            chunks = splitter.split_documents(window)
+        yield len(window), chunks
 
-def process_file(file_record: File, upload_folder: str) -> str:
+
+def iter_pooled_splits(file_path: str, metadata: dict, pool, workers: int, progress: Progress = None):
     """
-    Process one uploaded file:
-    - Choose the correct Chroma store based on `information_type`
-    - Remove existing embeddings
-    - Load and tag the document
-    - Split it into chunks
-    - Upsert into Chroma
+    Parse and split the file's page ranges in the parse pool, keeping at
+    most two tasks per worker in flight. Yields (pages, chunks) in document
+    order, so chunk occurrences are counted exactly as in a single process.
     """
+    from langchain_core.documents import Document
+
+    progress = progress or Progress()
+    results = ordered_results(pool, parse_tasks(file_path, metadata), 2 * workers)
+    while True:
+        # Workers load and split together; waiting on them counts as loading
+        progress.start(IngestionJob.LOAD)
+        with tracing.span("ingest.parse"):
+            result = next(results, None)
+        if result is None:
+            return
+        progress.start(IngestionJob.SPLIT)
+        pages, chunks = result
+        yield pages, [Document(page_content=text, metadata=meta) for text, meta in chunks]
+
+
+def iter_chunk_batches(file_path: str, metadata: dict, progress: Progress):
+    """
+    Parse and split the file, in the parse pool when INGEST_PARSE_WORKERS
+    allows more than one process, and yield {chunk id: chunk} batches of at
+    most INGEST_MAX_CHUNKS_IN_MEMORY chunks. `metadata` (source, file, owner) is
+    stamped on every page.
+    """
+    max_chunks = settings.INGEST_MAX_CHUNKS_IN_MEMORY
+    occurrences = {}
+    buffer = {}
+
+    workers = parse_workers()
+    if workers > 1:
+        splits = iter_pooled_splits(file_path, metadata, get_parse_pool(), workers, progress)
+    else:
+        splits = iter_split_windows(file_path, metadata, progress)
+
+    for pages, chunks in splits:
+        progress.advance(IngestionJob.LOAD, pages)
+        progress.advance(IngestionJob.SPLIT, len(chunks))
+        for id_, chunk in assign_chunk_ids(chunks, occurrences).items():
+            buffer[id_] = chunk
+            if len(buffer) >= max_chunks:
+                yield buffer
+                buffer = {}
+
+    if buffer:
+        yield buffer
+
+
+class IncrementalUpsert:
+    """
+    Apply chunk batches to a store, diffing them against the ids the store
+    held for one file (the `where` filter) before processing started.
+
+    The re-index is not atomic: new chunks are written as their batches
+    are embedded and stale ones only removed by `finish`. While a file is
+    re-processed, retrieval never sees it without chunks, but may return
+    its old and new chunks together. Unchanged chunks keep their ids, so
+    this only concerns chunks whose text changed. The BM25 `index` gets the
+    same additions and deletions.
+    """
+
+    def __init__(self, store, index, where: dict, progress: Progress):
+        self.store = store
+        self.index = index
+        self.progress = progress
+        self.pipeline = EmbeddingPipeline()
+        self.existing = vector_stores.get_metadatas(store, where=where)
+        self.seen = set()
+        self.added = 0
+
+    def write(self, batch: dict):
+        """
+        Embed and add the unseen chunks of `batch`; refresh moved ones.
+        """
+        added = self.diff(batch)
+        self.progress.start(IngestionJob.EMBED)
+        with tracing.span("ingest.embed"):
+            vectors = self.pipeline.embed([chunk.page_content for _, chunk in added], progress=self.progress)
+        self.add(added, vectors)
+
+    def diff(self, batch: dict) -> list:
+        """
+        Record `batch` as seen, refresh the metadata of chunks that moved,
+        and return the [(id, chunk)] that still need embedding.
+        """
+        added = [(id_, chunk) for id_, chunk in batch.items() if id_ not in self.existing]
+        # Unchanged chunks may have moved (e.g. text inserted before them)
+        moved = [
+            (id_, chunk.metadata) for id_, chunk in batch.items()
+            if id_ in self.existing and self.existing[id_] != chunk.metadata
+        ]
+        self.seen.update(batch)
+        if moved:
+            vector_stores.update_metadatas(
+                self.store,
+                ids=[id_ for id_, _ in moved],
+                metadatas=[metadata for _, metadata in moved],
+            )
+        return added
+
+    def add(self, added: list, vectors: list):
+        """
+        Add the chunks returned by `diff` with their embeddings.
+        """
+        texts = [chunk.page_content for _, chunk in added]
+        self.progress.start(IngestionJob.UPSERT)
+        with tracing.span("ingest.upsert"):
+            for written in vector_stores.upsert_vectors(
+                self.store,
+                ids=[id_ for id_, _ in added],
+                vectors=vectors,
+                texts=texts,
+                metadatas=[chunk.metadata for _, chunk in added],
+            ):
+                self.progress.advance(IngestionJob.UPSERT, written)
+        with tracing.span("ingest.index"):
+            self.index.add([id_ for id_, _ in added], texts)
+        self.added += len(added)
+
+    def finish(self) -> int:
+        """
+        Delete chunks that no longer exist in the file. Returns how many.
+        """
+        stale_ids = self.existing.keys() - self.seen
+        self.progress.start(IngestionJob.UPSERT)
+        with tracing.span("ingest.index"):
+            self.index.flush()
+        with tracing.span("ingest.delete"):
+            self.progress.advance(IngestionJob.UPSERT, vector_stores.delete_ids(self.store, stale_ids))
+            self.index.delete(stale_ids)
+        return len(stale_ids)
+
+
+def shares_processed_chunks(file_record: File) -> bool:
+    """
+    Whether another processed File with the same content already stored the
+    chunks this one shares (see `File.chunk_sharers`), so processing it
+    has nothing to parse or embed.
+    """
+    return file_record.chunk_sharers().exclude(pk=file_record.pk).filter(status='Processed').exists()
+
+
+def process_file(file_record: File, upload_folder: str, progress: Progress = None) -> str:
+    """
+    Process one uploaded file as a stream:
+    - Choose the correct Chroma store based on `information_type` (and owner)
+    - Load pages in bounded windows (or page ranges in the parse pool) and
+      split them into chunks with stable ids
+    - Diff each batch of chunks against the ids already stored for this file
+    - Embed and add only the new chunks as soon as a batch is full
+    - Delete the chunks that disappeared once the whole file has been read
+
+    Files with the same content in one store share one set of chunks, so a
+    file whose chunks another processed file already stored is neither
+    parsed nor embedded.
+
+    At most INGEST_MAX_CHUNKS_IN_MEMORY chunks are held at a time, and
+    embedding starts before the whole file has been parsed.
+
+    Each stage is reported to `progress` (see IngestionJob.STAGES) and
+    traced as an `ingest.<stage>` span.
+    """
+    progress = progress or Progress()
+    with tracing.span("ingest.process_file", information_type=file_record.information_type):
+        return _process_file(file_record, upload_folder, progress)
+
+
+def _process_file(file_record: File, upload_folder: str, progress: Progress) -> str:
     try:
-        store = private_store if file_record.information_type == File.PRIVATE else public_store
-        file_path = os.path.join(upload_folder, file_record.filename)
-
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found at {file_path}")
-
-        # Step 1: Delete any existing vectors
-        store.delete(where={"source": file_record.filename})
-
-        # Step 2: Load the document
-        ext = os.path.splitext(file_record.filename)[1].lower()
-        if ext == ".pdf":
-            loader = PyPDFLoader(file_path)
-        elif ext == ".docx":
-            loader = Docx2txtLoader(file_path)
-        elif ext == ".txt":
-            loader = TextLoader(file_path, encoding="utf-8")
-        else:
-            return "Unsupported Format"
-
-        docs = loader.load()
-        for doc in docs:
-            doc.metadata["source"] = file_record.filename
-
-        # Step 3: Chunk + Upsert
-        chunks = splitter.split_documents(docs)
-        store.add_documents(chunks)
-
-        return "Processed"
-    
+        with blob_path(file_record, upload_folder) as file_path:
+            store = file_record.vector_store()
+
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"File not found at {file_path}")
+
+            if os.path.splitext(file_path)[1].lower() not in SUPPORTED_EXTENSIONS:
+                return "Unsupported Format"
+
+            writer = IncrementalUpsert(store, file_record.sparse_index(), file_record.vector_filter(), progress)
+            if writer.existing and shares_processed_chunks(file_record):
+                for stage in IngestionJob.STAGES:
+                    progress.finish(stage)
+                logger.info(f"{file_record.filename} shares the {len(writer.existing)} chunks of its content")
+                return "Processed"
+            try:
+                for batch in iter_chunk_batches(file_path, file_record.chunk_metadata(), progress):
+                    writer.write(batch)
+                removed = writer.finish()
+            finally:
+                # Even a partial run may have changed what public answers see
+                if file_record.information_type == File.PUBLIC:
+                    invalidate_public_answers()
+
+            for stage in IngestionJob.STAGES:
+                progress.finish(stage)
+
+            logger.info(
+                f"Processed {file_record.filename}: {writer.added} added, {removed} removed, "
+                f"{len(writer.seen) - writer.added} unchanged"
+            )
+
+            return "Processed"
+
     except Exception as e:
         logger.exception(f"Error processing file {file_record.filename}")
+        progress.fail(str(e))
         return "Error"
@@ -0,0 +1,51 @@
+class Progress:
+    """
+    Progress sink for the ingestion stages (load, split, embed, upsert).
+
+    The base class ignores everything so `process_file` can report
+    unconditionally; the job queue plugs in a DB-backed subclass.
+
+    `start` is called whenever the pipeline enters a stage, so with a
+    streamed file it runs again for each window (load, split, embed, upsert,
+    then load again) and the current stage is always the one running.
+    """
+
+    def start(self, stage: str, total: int = None):
+        pass
+
+    def advance(self, stage: str, count: int = 1):
+        pass
+
+    def finish(self, stage: str):
+        pass
+
+    def fail(self, error: str):
+        pass
+
+
+class RecordingProgress(Progress):
+    """
+    Keep per-stage counters in memory, e.g. {'load': {'done': 3, 'total': 3}}.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.current = None
+        self.error = None
+
+    def start(self, stage: str, total: int = None):
+        self.current = stage
+        entry = self.stages.setdefault(stage, {"done": 0, "total": None})
+        if total is not None:
+            entry["total"] = total
+
+    def advance(self, stage: str, count: int = 1):
+        entry = self.stages.setdefault(stage, {"done": 0, "total": None})
+        entry["done"] += count
+
+    def finish(self, stage: str):
+        entry = self.stages.setdefault(stage, {"done": 0, "total": None})
+        entry["total"] = entry["done"]
+
+    def fail(self, error: str):
+        self.error = error
@@ -1,37 +1,104 @@
-import os
 import logging
-from django.conf import settings
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_chroma import Chroma
-from langchain.chains import RetrievalQA
+from asgiref.sync import sync_to_async
+from chat.utils import tracing, vector_stores
+from chat.utils.answer_cache import current_generation, get_answer_cache
+from chat.utils.bm25 import get_sparse_index
+from chat.utils.retrieval import HybridRetriever, arun_qa, run_qa
+from chat.utils.streaming import stream_answer
 
 logger = logging.getLogger(__name__)
 
-# Constants
-PUBLIC_DB_PATH = os.path.join(settings.BASE_DIR, "public_chroma_db")
-COLLECTION_NAME = "example_collection"
 
-# Embedding function and vector store
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-public_vector_store = Chroma(
-    collection_name=COLLECTION_NAME,
-    embedding_function=embeddings,
-    persist_directory=PUBLIC_DB_PATH,
-)
+def get_public_qa_chain():
+    """
+    Build (once per process) the RetrievalQA chain over the public vector DB.
+    """
+    def build():
+        from langchain.chains import RetrievalQA
+
+        retriever = HybridRetriever.from_settings(
+            vector_stores.get_public_store(),
+            get_sparse_index(vector_stores.PUBLIC),
+            endpoint="public",
+        )
+        return RetrievalQA.from_chain_type(
+            llm=vector_stores.get_chat_model(),
+            chain_type="stuff",
+            retriever=retriever,
+            return_source_documents=True,
+        )
+
+    return vector_stores.get_or_create("public_qa_chain", build)
+
+
+def cached_ask(chain, cache, question: str) -> dict:
+    """
+    Answer through the answer cache: exact match, then semantic match on the
+    query embedding, and only on a miss run the hybrid search (reusing that
+    embedding) and the LLM, caching the result with its sources.
+    """
+    output = cache.get_exact(question)
+    if output is not None:
+        return output
+
+    with tracing.span("retrieval.embed", endpoint="public"):
+        vector = vector_stores.get_embeddings().embed_query(question)
+    output = cache.get_similar(vector)
+    if output is not None:
+        return output
 
-# Retriever
-public_retriever = public_vector_store.as_retriever(search_kwargs={"k": 3})
+    generation = current_generation()
+    output = run_qa(chain, question, vector, endpoint="public")
+    cache.put(question, vector, output, generation)
+    return output
 
-# LLM
-chat_model = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
 
-# QA Chain
-public_qa_chain = RetrievalQA.from_chain_type(
-    llm=chat_model,
-    chain_type="stuff",
-    retriever=public_retriever,
-    return_source_documents=True,
-)
+async def cached_ask_async(chain, cache, question: str) -> dict:
+    """
+    Async variant of `cached_ask`.
+    """
+    output = cache.get_exact(question)
+    if output is not None:
+        return output
+
+    with tracing.span("retrieval.embed", endpoint="public"):
+        vector = await vector_stores.get_embeddings().aembed_query(question)
+    output = cache.get_similar(vector)
+    if output is not None:
+        return output
+
+    generation = current_generation()
+    output = await arun_qa(chain, question, vector, endpoint="public")
+    cache.put(question, vector, output, generation)
+    return output
+
+
+async def cached_stream(chain, cache, question: str):
+    """
+    Streaming variant of `cached_ask_async`: a cached answer is replayed as
+    its sources and a single token; otherwise the answer is streamed and
+    cached once the LLM has finished (not if the client went away first).
+    """
+    output = cache.get_exact(question)
+    vector = None
+    if output is None:
+        with tracing.span("retrieval.embed", endpoint="public"):
+            vector = await vector_stores.get_embeddings().aembed_query(question)
+        output = cache.get_similar(vector)
+    if output is not None:
+        yield "sources", output["source_documents"]
+        yield "token", output["result"]
+        return
+
+    generation = current_generation()
+    docs, tokens = [], []
+    async for kind, payload in stream_answer(chain, question, endpoint="public", vector=vector):
+        if kind == "sources":
+            docs = payload
+        else:
+            tokens.append(payload)
+        yield kind, payload
+    cache.put(question, vector, {"query": question, "result": "".join(tokens), "source_documents": docs}, generation)
 
 
 def public_ask(question: str) -> dict:
@@ -48,10 +115,48 @@ def public_ask(question: str) -> dict:
         }
     """
     try:
-        return public_qa_chain.invoke({"query": question})
+        cache = get_answer_cache()
+        if cache is not None:
+            return cached_ask(get_public_qa_chain(), cache, question)
+        return run_qa(get_public_qa_chain(), question, endpoint="public")
+    except Exception as e:
+        logger.exception(f"Error in public chat retrieval for question: {question}")
+        return {
+            "result": "Sorry, something went wrong while answering your question.",
+            "source_documents": []
+        }
+
+
+async def public_ask_async(question: str) -> dict:
+    """
+    Async variant of `public_ask` using the chain's async interface, so the
+    embedding, vector search and LLM calls don't block the event loop.
+    """
+    try:
+        chain = await sync_to_async(get_public_qa_chain, thread_sensitive=False)()
+        cache = get_answer_cache()
+        if cache is not None:
+            return await cached_ask_async(chain, cache, question)
+        return await arun_qa(chain, question, endpoint="public")
     except Exception as e:
         logger.exception(f"Error in public chat retrieval for question: {question}")
         return {
             "result": "Sorry, something went wrong while answering your question.",
             "source_documents": []
         }
+
+
+async def public_stream(question: str):
+    """
+    Streaming variant of `public_ask_async`: an async generator of
+    ('sources', docs) and then ('token', text) events (see `stream_answer`),
+    answered from the answer cache when it can be.
+    """
+    chain = await sync_to_async(get_public_qa_chain, thread_sensitive=False)()
+    cache = get_answer_cache()
+    if cache is not None:
+        events = cached_stream(chain, cache, question)
+    else:
+        events = stream_answer(chain, question, endpoint="public")
+    async for event in events:
+        yield event
@@ -0,0 +1,128 @@
+import numpy as np
+
+QUANTIZATIONS = ("none", "int8", "binary")
+# Float32 bytes decoded per scoring step: small enough to stay in cache,
+# which matters more than the matrix product itself for int8 codes
+SCORE_BATCH_BYTES = 1 << 20
+
+
+def unit(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class Codec:
+    """
+    How the numpy index stores the vectors it searches: the leading `dims`
+    components (Matryoshka truncation, 0 keeps them all), re-normalized,
+    then quantized:
+
+    - "none": float32, 4 bytes per dimension.
+    - "int8": one signed byte per dimension plus a float32 scale per row;
+      scores are dot products on the integers, times the scale.
+    - "binary": one sign bit per dimension; scores come from the Hamming
+      distance to the query's signs (1 - 2 * distance / dims).
+
+    Codes are rows of `row_bytes` bytes, so every kind shares one uint8
+    matrix on disk.
+    """
+
+    def __init__(self, dims: int = 0, quantization: str = "none"):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}; expected one of {', '.join(QUANTIZATIONS)}")
+        if dims < 0:
+            raise ValueError(f"Truncated dimensions must be positive, got {dims}")
+        self.dims = dims
+        self.quantization = quantization
+
+    def __repr__(self):
+        return f"Codec(dims={self.dims}, quantization={self.quantization!r})"
+
+    @property
+    def identity(self) -> bool:
+        """
+        Whether codes would just be the full float32 vectors.
+        """
+        return not self.dims and self.quantization == "none"
+
+    def search_dims(self, dim: int) -> int:
+        if self.dims > dim:
+            raise ValueError(f"Cannot truncate {dim}-dim vectors to {self.dims} dimensions")
+        return self.dims or dim
+
+    def row_bytes(self, dim: int) -> int:
+        dims = self.search_dims(dim)
+        if self.quantization == "int8":
+            return dims + 4
+        if self.quantization == "binary":
+            return (dims + 7) // 8
+        return dims * 4
+
+    def project(self, vectors) -> np.ndarray:
+        """
+        Truncated, unit-length float32 vectors (a query works too).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return unit(vectors[..., :self.dims] if self.dims else vectors)
+
+    def encode(self, vectors) -> np.ndarray:
+        projected = np.atleast_2d(self.project(vectors))
+        if self.quantization == "int8":
+            peaks = np.abs(projected).max(axis=1, keepdims=True)
+            scales = np.where(peaks == 0, 1.0, peaks / 127).astype(np.float32)
+            quantized = np.rint(projected / scales).astype(np.int8)
+            return np.hstack([quantized.view(np.uint8), scales.view(np.uint8)])
+        if self.quantization == "binary":
+            return np.packbits(projected > 0, axis=1)
+        return projected.view(np.uint8)
+
+    def decode(self, codes: np.ndarray, dim: int) -> np.ndarray:
+        """
+        Approximate unit vectors (in the truncated dimensions) from codes.
+        """
+        dims = self.search_dims(dim)
+        codes = np.atleast_2d(np.asarray(codes))
+        if self.quantization == "int8":
+            quantized, scales = self._int8(codes, dims)
+            return unit(quantized.astype(np.float32) * scales)
+        if self.quantization == "binary":
+            signs = np.unpackbits(codes, axis=1, count=dims).astype(np.float32) * 2 - 1
+            return signs / np.sqrt(dims, dtype=np.float32)
+        return np.ascontiguousarray(codes).view(np.float32)
+
+    @staticmethod
+    def _int8(codes: np.ndarray, dims: int):
+        codes = np.ascontiguousarray(codes)
+        return codes[:, :dims].view(np.int8), codes[:, dims:dims + 4].copy().view(np.float32)
+
+    def scores(self, codes: np.ndarray, query, dim: int) -> np.ndarray:
+        """
+        Approximate cosine similarity of every coded row to `query` (a full
+        vector), in batches of about SCORE_BATCH_BYTES.
+        """
+        dims = self.search_dims(dim)
+        projected = self.project(query)
+        if self.quantization == "binary":
+            signs = np.packbits(projected > 0)
+            # Count bits a word at a time when rows are whole words
+            word = np.uint64 if len(signs) % 8 == 0 else np.uint8
+            signs = signs.view(word)
+        rows = max(64, SCORE_BATCH_BYTES // (4 * dims))
+        if self.quantization == "int8":
+            # numpy has no BLAS path for int8 @ float32; convert into a reused buffer
+            buffer = np.empty((rows, dims), dtype=np.float32)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), rows):
+            batch = np.asarray(codes[start:start + rows])
+            end = start + len(batch)
+            if self.quantization == "int8":
+                quantized, scales = self._int8(batch, dims)
+                converted = buffer[:len(batch)]
+                converted[...] = quantized
+                scores[start:end] = (converted @ projected) * scales[:, 0]
+            elif self.quantization == "binary":
+                distance = np.bitwise_count(np.ascontiguousarray(batch).view(word) ^ signs).sum(axis=1, dtype=np.int32)
+                scores[start:end] = 1 - 2 * distance / dims
+            else:
+                scores[start:end] = np.ascontiguousarray(batch).view(np.float32) @ projected
+        return scores
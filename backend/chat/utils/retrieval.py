@@ -0,0 +1,236 @@
+from typing import Any
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from chat.utils import metrics, tracing
+from chat.utils.bm25 import tokenize
+from chat.utils.context_packer import pack_context
+
+
+def reciprocal_rank_fusion(rankings: list, weights: list, rrf_k: int = 60) -> list:
+    """
+    Fuse ranked id lists: score(id) = sum of weight / (rrf_k + rank), rank
+    starting at 1. Returns ids ordered by fused score.
+    """
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        if not weight:
+            continue
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def unit_rows(matrix) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def lexical_overlap(query: str, texts: list) -> np.ndarray:
+    """
+    Weighted share of the query's distinct terms found in each text. Terms
+    are weighted by their rarity among `texts`, so a product code found in
+    one candidate counts for more than a word most candidates share.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms or not texts:
+        return np.zeros(len(texts), dtype=np.float32)
+    index = {term: column for column, term in enumerate(terms)}
+    present = np.zeros((len(texts), len(terms)), dtype=bool)
+    for row, text in enumerate(texts):
+        columns = [index[token] for token in set(tokenize(text)) if token in index]
+        present[row, columns] = True
+    df = present.sum(axis=0)
+    weights = np.where(df > 0, np.log1p(len(texts) / np.maximum(df, 1)), 0.0).astype(np.float32)
+    if not weights.sum():
+        return np.zeros(len(texts), dtype=np.float32)
+    return (present @ weights) / weights.sum()
+
+
+def rerank(query: str, query_vector, texts: list, vectors, k: int,
+           mmr_lambda: float = 0.7, lexical_weight: float = 0.3) -> list:
+    """
+    Indices of the `k` candidates to keep, in order.
+
+    Relevance blends cosine similarity to the query with lexical overlap;
+    selection is maximal marginal relevance, trading relevance against
+    similarity to the candidates already picked (`mmr_lambda` = 1 ignores
+    diversity).
+    """
+    vectors = unit_rows(vectors)
+    # A store keeping only truncated (Matryoshka) vectors returns shorter
+    # ones; compare on their leading dimensions
+    query_vector = np.asarray(query_vector, dtype=np.float32)[..., :vectors.shape[-1]]
+    relevance = (1 - lexical_weight) * (vectors @ unit_rows(query_vector)) \
+        + lexical_weight * lexical_overlap(query, texts)
+    similarity = vectors @ vectors.T
+
+    selected = []
+    redundancy = np.full(len(texts), -np.inf, dtype=np.float32)
+    for _ in range(min(k, len(texts))):
+        scores = relevance if not selected else mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores = np.where(np.isin(np.arange(len(texts)), selected), -np.inf, scores)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def fetch_candidates(vectorstore, ids) -> dict:
+    """
+    {id: (Document, embedding)} for chunks in a vector store.
+    """
+    if not ids:
+        return {}
+    return {
+        record.id: (Document(page_content=record.document, metadata=record.metadata or {}, id=record.id), record.vector)
+        for record in vectorstore.get(ids=list(ids))
+    }
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense (vector store) + sparse (BM25) retrieval fused by reciprocal rank fusion,
+    followed by a local rerank.
+
+    Each side returns its `fetch_k` best chunk ids (a weight of 0 switches a
+    side off). The fused top `candidates` are reranked with `rerank` on the
+    embeddings the vector store already holds, and the top `k` are packed into at most
+    `context_tokens` tokens (see `pack_context`; 0 disables packing). Every
+    step is traced as a `retrieval.<step>` span (see `tracing.span`).
+    """
+
+    vectorstore: Any
+    sparse_index: Any
+    endpoint: str = "default"
+    search_kwargs: dict = {"k": 3}
+    fetch_k: int = 20
+    candidates: int = 3
+    mmr_lambda: float = 0.7
+    lexical_weight: float = 0.3
+    dense_weight: float = 1.0
+    sparse_weight: float = 1.0
+    rrf_k: int = 60
+    context_tokens: int = 0
+
+    @classmethod
+    def from_settings(cls, vectorstore, sparse_index, endpoint: str):
+        """
+        Configure from RETRIEVAL_ENDPOINTS[endpoint] plus the shared fusion settings.
+        """
+        config = settings.RETRIEVAL_ENDPOINTS[endpoint]
+        k = config["k"]
+        candidates = max(k, config["candidates"])
+        return cls(
+            vectorstore=vectorstore,
+            sparse_index=sparse_index,
+            endpoint=endpoint,
+            search_kwargs={"k": k},
+            fetch_k=max(candidates, settings.RETRIEVAL_FETCH_K),
+            candidates=candidates,
+            mmr_lambda=config["mmr_lambda"],
+            lexical_weight=settings.RERANK_LEXICAL_WEIGHT,
+            dense_weight=settings.RETRIEVAL_DENSE_WEIGHT,
+            sparse_weight=settings.RETRIEVAL_SPARSE_WEIGHT,
+            rrf_k=settings.RETRIEVAL_RRF_K,
+            context_tokens=config["context_tokens"],
+        )
+
+    def _step(self, step: str):
+        return tracing.span(f"retrieval.{step}", endpoint=self.endpoint)
+
+    def search(self, query: str, vector=None) -> list:
+        """
+        Hybrid search plus rerank; pass the query embedding if it is already known.
+        """
+        with tracing.span("retrieval", endpoint=self.endpoint):
+            docs = self._search(query, vector)
+            if not self.context_tokens:
+                return docs
+            with self._step("pack"):
+                docs, stats = pack_context(docs, self.context_tokens)
+            metrics.observe("context_tokens", stats["tokens"], endpoint=self.endpoint)
+            metrics.observe("context_tokens_saved", stats["tokens_saved"], endpoint=self.endpoint)
+            return docs
+
+    def _search(self, query: str, vector) -> list:
+        k = self.search_kwargs.get("k", 3)
+        reranking = self.candidates > k
+
+        if vector is None and (self.dense_weight or reranking):
+            with self._step("embed"):
+                vector = self.vectorstore.embeddings.embed_query(query)
+
+        found = {}
+        if self.dense_weight:
+            with self._step("dense"):
+                records = self.vectorstore.query(vector, self.fetch_k)
+            for record in records:
+                found[record.id] = (
+                    Document(page_content=record.document, metadata=record.metadata or {}, id=record.id),
+                    record.vector,
+                )
+
+        sparse_ids = []
+        if self.sparse_weight:
+            with self._step("sparse"):
+                sparse_ids = [id_ for id_, _ in self.sparse_index.search(query, self.fetch_k)]
+
+        with self._step("fuse"):
+            fused = reciprocal_rank_fusion(
+                [list(found), sparse_ids],
+                [self.dense_weight, self.sparse_weight],
+                self.rrf_k,
+            )[:self.candidates]
+
+        missing = [id_ for id_ in fused if id_ not in found]
+        if missing:
+            with self._step("fetch"):
+                found.update(fetch_candidates(self.vectorstore, missing))
+        # Ids missing from the vector store (index ahead of / behind the store) are skipped
+        candidates = [found[id_] for id_ in fused if id_ in found]
+
+        if not reranking or len(candidates) <= k:
+            return [doc for doc, _ in candidates[:k]]
+        with self._step("rerank"):
+            order = rerank(
+                query,
+                vector,
+                [doc.page_content for doc, _ in candidates],
+                [embedding for _, embedding in candidates],
+                k,
+                mmr_lambda=self.mmr_lambda,
+                lexical_weight=self.lexical_weight,
+            )
+        return [candidates[i][0] for i in order]
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> list:
+        return self.search(query)
+
+
+def run_qa(chain, question: str, vector=None, endpoint: str = "default", query: str = None) -> dict:
+    """
+    Run a "stuff" RetrievalQA chain as two traced stages, the hybrid search
+    (reusing `vector` if the query embedding is known) and the LLM call.
+    Retrieval uses `query` when given (e.g. a condensed follow-up question),
+    else the question. Returns the chain's usual {query, result, source_documents}.
+    """
+    docs = chain.retriever.search(query or question, vector)
+    with tracing.span("llm", endpoint=endpoint):
+        answer = chain.combine_documents_chain.invoke({"input_documents": docs, "question": question})
+    return {"query": question, "result": answer["output_text"], "source_documents": docs}
+
+
+async def arun_qa(chain, question: str, vector=None, endpoint: str = "default", query: str = None) -> dict:
+    """
+    Async variant of `run_qa`; the search runs in a worker thread.
+    """
+    docs = await sync_to_async(chain.retriever.search, thread_sensitive=False)(query or question, vector)
+    with tracing.span("llm", endpoint=endpoint):
+        answer = await chain.combine_documents_chain.ainvoke({"input_documents": docs, "question": question})
+    return {"query": question, "result": answer["output_text"], "source_documents": docs}
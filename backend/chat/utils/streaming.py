@@ -0,0 +1,94 @@
+import json
+import time
+import logging
+
+from asgiref.sync import sync_to_async
+
+from chat.serializers import serialize_source_documents
+from chat.utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+STREAM_ERROR_MESSAGE = "Sorry, something went wrong while answering your question."
+
+
+def format_event(event: str, data) -> bytes:
+    """
+    Encode one server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def stream_answer(chain, question: str, endpoint: str = "default", query: str = None, vector=None):
+    """
+    Run a "stuff" RetrievalQA chain step by step as an async generator,
+    yielding ('sources', [Document]) once retrieval finishes and then
+    ('token', str) for every piece of the answer as the LLM streams it
+    (`astream`, so the event loop serves other requests between tokens).
+    Retrieval uses `query` when given, else the question, and reuses
+    `vector` if the query embedding is known.
+    """
+    from langchain_core.prompts import format_document
+
+    docs = await sync_to_async(chain.retriever.search, thread_sensitive=False)(query or question, vector)
+    yield "sources", docs
+
+    combine = chain.combine_documents_chain
+    context = combine.document_separator.join(
+        format_document(doc, combine.document_prompt) for doc in docs
+    )
+    prompt = combine.llm_chain.prompt.format_prompt(
+        **{combine.document_variable_name: context, "question": question}
+    )
+    with tracing.span("llm.stream", endpoint=endpoint):
+        async for chunk in combine.llm_chain.llm.astream(prompt):
+            if chunk.content:
+                yield "token", chunk.content
+
+
+async def sse_response_stream(events, endpoint: str, on_complete, started: float = None):
+    """
+    Turn `stream_answer` events into SSE bytes: `sources` first, then
+    `token` events, then `done` once `await on_complete(reply, sources)`
+    has persisted the exchange.
+
+    The ASGI handler only asks for the next event after it has sent the
+    previous one, so this generator resumes after the first `token` once
+    that token has been flushed to the client: that is the time to first
+    byte of the answer (`ttfb`). `first_token` is when the LLM produced it.
+    """
+    started = started or time.perf_counter()
+    ttfb = first_token = None
+    tokens = []
+    sources = []
+
+    try:
+        async for kind, payload in events:
+            if kind == "sources":
+                sources = serialize_source_documents(payload)
+                yield format_event("sources", sources)
+                continue
+
+            if first_token is None:
+                first_token = time.perf_counter() - started
+                metrics.observe("chat_stream_first_token_seconds", first_token, endpoint=endpoint)
+            tokens.append(payload)
+            yield format_event("token", {"text": payload})
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+                metrics.observe("chat_stream_ttfb_seconds", ttfb, endpoint=endpoint)
+
+        reply = "".join(tokens)
+        conversation = await on_complete(reply, sources)
+        total = time.perf_counter() - started
+        metrics.observe("chat_stream_total_seconds", total, endpoint=endpoint)
+        yield format_event("done", {
+            "reply": reply,
+            "conversation_id": getattr(conversation, "id", None),
+            "ttfb_ms": round(ttfb * 1000, 1) if ttfb is not None else None,
+            "first_token_ms": round(first_token * 1000, 1) if first_token is not None else None,
+            "total_ms": round(total * 1000, 1),
+        })
+    except Exception:
+        logger.exception(f"Error while streaming {endpoint} chat answer")
+        yield format_event("error", {"error": STREAM_ERROR_MESSAGE})
@@ -0,0 +1,128 @@
+import time
+import logging
+import contextvars
+from contextlib import nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from chat.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Every span is observed under this metric, labelled by stage
+STAGE_METRIC = "rag_stage_seconds"
+REQUEST_METRIC = "http_request_seconds"
+
+_current = contextvars.ContextVar("rag_trace", default=None)
+_disabled = nullcontext()
+
+
+class Trace:
+    """
+    The spans finished while handling one request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def breakdown(self) -> str:
+        return ", ".join(f"{span.name}={span.duration * 1000:.1f}ms" for span in self.spans)
+
+
+class Span:
+    """
+    Times a `with` block into STAGE_METRIC{stage=name, **labels} and, inside
+    a traced request, appends itself to that request's trace.
+    """
+
+    __slots__ = ("name", "labels", "started", "duration")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.started = self.duration = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.started
+        metrics.observe(STAGE_METRIC, self.duration, stage=self.name, **self.labels)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans.append(self)
+        return False
+
+
+def span(name: str, **labels):
+    """
+    Context manager timing one pipeline stage (e.g. "retrieval.dense",
+    "llm", "db.conversation_write"). A shared no-op when TRACING_ENABLED is
+    off, so instrumented code costs one settings lookup per stage.
+    """
+    if not settings.TRACING_ENABLED:
+        return _disabled
+    return Span(name, labels)
+
+
+class TracingMiddleware:
+    """
+    Opens a trace per request, observes REQUEST_METRIC{view, method} and
+    reports the finished spans in a `Server-Timing` header. Requests slower
+    than TRACING_SLOW_REQUEST_SECONDS are logged with their breakdown.
+    Works for both sync and async views without a thread hop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.TRACING_ENABLED:
+            return self.get_response(request)
+        trace = Trace()
+        token = _current.set(trace)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, trace)
+
+    async def __acall__(self, request):
+        if not settings.TRACING_ENABLED:
+            return await self.get_response(request)
+        trace = Trace()
+        token = _current.set(trace)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, trace)
+
+    def finish(self, request, response, trace: Trace):
+        elapsed = time.perf_counter() - trace.started
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        metrics.observe(REQUEST_METRIC, elapsed, view=view, method=request.method)
+
+        if trace.spans:
+            response["Server-Timing"] = ", ".join(
+                f"{span.name};dur={span.duration * 1000:.1f}" for span in trace.spans
+            )
+        threshold = settings.TRACING_SLOW_REQUEST_SECONDS
+        if threshold and elapsed >= threshold:
+            logger.warning(
+                f"Slow request {request.method} {request.path} ({view}): "
+                f"{elapsed * 1000:.1f}ms [{trace.breakdown()}]"
+            )
+        return response
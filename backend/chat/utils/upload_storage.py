@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage, storages
+
+
+def blob_name(content_hash: str, filename: str) -> str:
+    """
+    Storage name for uploaded content: addressed by its SHA-256 and sharded
+    two levels deep on the hash prefix (`ab/cd/abcd....pdf`), so no directory
+    grows past a few thousand entries and equal names never collide. The
+    original extension is kept because loaders are picked by it.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext}"
+
+
+class ShardedFileSystemStorage(FileSystemStorage):
+    """
+    Local upload storage whose writes are atomic: content goes to a
+    temporary file next to its destination and is renamed into place, so a
+    reader (or a crash) never sees a partial blob. Temporary uploads on the
+    same filesystem are renamed without copying.
+
+    Names are content-addressed, so saving a name that exists replaces it
+    with the same content rather than picking a free name.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        if hasattr(content, "temporary_file_path"):
+            try:
+                os.replace(content.temporary_file_path(), full_path)
+                self._set_permissions(full_path)
+                return name
+            except OSError:
+                # Different filesystem: fall back to copy + rename
+                pass
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as destination:
+                content.seek(0)
+                for chunk in content.chunks():
+                    destination.write(chunk)
+                destination.flush()
+                os.fsync(destination.fileno())
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._set_permissions(full_path)
+        return name
+
+    def _set_permissions(self, full_path: str):
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+
+def get_upload_storage():
+    """
+    The storage holding uploaded blobs (settings.STORAGES["uploads"]).
+    """
+    return storages["uploads"]
+
+
+@contextmanager
+def local_path(storage, name: str):
+    """
+    A local filesystem path with the content of `name`, for loaders that
+    need one: the file itself on local storage, otherwise a temporary copy
+    removed on exit.
+    """
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+    try:
+        with os.fdopen(fd, "wb") as copy, storage.open(name, "rb") as source:
+            shutil.copyfileobj(source, copy)
+        yield path
+    finally:
+        os.remove(path)
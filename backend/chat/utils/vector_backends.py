@@ -0,0 +1,206 @@
+import os
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# One stored chunk. Fields not asked for in `include` are None.
+Record = namedtuple("Record", ["id", "document", "metadata", "vector"])
+
+INCLUDE_ALL = ("documents", "metadatas", "embeddings")
+
+COMPARISONS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def matches(metadata: dict, where: dict) -> bool:
+    """
+    Whether `metadata` satisfies a Chroma-style `where` filter: field
+    equality, {"field": {"$op": operand}} with the operators in
+    COMPARISONS, and "$and"/"$or" lists. A missing field matches nothing.
+    """
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            value = metadata[key]
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                if op not in COMPARISONS:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+                try:
+                    if not COMPARISONS[op](value, operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
+
+
+class VectorBackend:
+    """
+    What the RAG pipeline needs from a vector store. Implemented by
+    `ChromaBackend` and `numpy_index.NumpyIndex`; pick one per store with
+    settings.VECTOR_STORE_BACKENDS (see `vector_stores.get_vector_store`).
+
+    Vectors come precomputed: `embeddings` is only there for callers that
+    embed a query before searching.
+    """
+
+    name = ""
+    embeddings = None
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def upsert(self, ids, vectors, documents, metadatas):
+        """
+        Insert or replace records by id.
+        """
+        raise NotImplementedError
+
+    def update_metadatas(self, ids, metadatas):
+        """
+        Replace the metadata of existing records, leaving documents and vectors.
+        """
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def get(self, ids=None, where: dict = None, include=INCLUDE_ALL, limit: int = None, offset: int = 0) -> list:
+        """
+        [Record] selected by `ids` and/or the metadata filter `where` (all
+        records when neither is given), paged by `limit`/`offset`.
+        """
+        raise NotImplementedError
+
+    def query(self, vector, k: int, where: dict = None) -> list:
+        """
+        The `k` records nearest to `vector` (among those matching `where`),
+        nearest first, with documents, metadata and vectors.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release open files and connections when the store is evicted (see
+        `vector_stores.get_or_create`); a later call may reopen them. A Chroma
+        collection holds none of its own: its client is shared per directory.
+        """
+
+
+class ChromaBackend(VectorBackend):
+    """
+    A Chroma collection (HNSW index, persisted under `persist_directory`).
+    """
+
+    def __init__(self, collection_name: str, embeddings, persist_directory: str = None, client=None):
+        from langchain_chroma import Chroma
+
+        self.name = collection_name
+        self.embeddings = embeddings
+        self.store = Chroma(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            persist_directory=persist_directory,
+            client=client,
+        )
+
+    @property
+    def collection(self):
+        return self.store._collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def upsert(self, ids, vectors, documents, metadatas):
+        self.collection.upsert(ids=list(ids), embeddings=vectors, documents=documents, metadatas=metadatas)
+
+    def update_metadatas(self, ids, metadatas):
+        self.collection.update(ids=list(ids), metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=list(ids))
+
+    def get(self, ids=None, where: dict = None, include=INCLUDE_ALL, limit: int = None, offset: int = 0) -> list:
+        results = self.collection.get(
+            ids=list(ids) if ids is not None else None,
+            where=where,
+            include=list(include),
+            limit=limit,
+            offset=offset or None,
+        )
+        return records_from(results)
+
+    def query(self, vector, k: int, where: dict = None) -> list:
+        include = list(INCLUDE_ALL)
+        try:
+            results = self.collection.query(query_embeddings=[vector], n_results=k, where=where, include=include)
+        except RuntimeError:
+            # hnswlib can fail when the index holds deleted vectors and fewer
+            # live ones than requested; retry asking for exactly what is left
+            live = self.collection.count()
+            if not live:
+                return []
+            if live >= k:
+                raise
+            results = self.collection.query(query_embeddings=[vector], n_results=live, where=where, include=include)
+        return records_from({key: (value[0] if value is not None else None) for key, value in results.items()})
+
+
+def records_from(results: dict) -> list:
+    """
+    [Record] from a Chroma get/query result (one query's worth of lists).
+    """
+    def column(name):
+        values = results.get(name)
+        return values if values is not None else [None] * len(results["ids"])
+
+    return [
+        Record(id_, document, metadata or {}, vector)
+        for id_, document, metadata, vector in zip(
+            results["ids"], column("documents"), column("metadatas"), column("embeddings")
+        )
+    ]
+
+
+def build_backend(backend: str, collection_name: str, path: str, embeddings) -> VectorBackend:
+    """
+    Construct the vector backend named by `backend`: "chroma", "numpy" or
+    a dotted path to a VectorBackend class taking the same arguments.
+    """
+    if backend == "chroma":
+        return ChromaBackend(collection_name, embeddings, persist_directory=path)
+    if backend == "numpy":
+        from chat.utils.numpy_index import NumpyIndex
+        return NumpyIndex(
+            os.path.join(path, "numpy_index", collection_name),
+            embeddings,
+            name=collection_name,
+            ivf_min_vectors=settings.NUMPY_INDEX_IVF_MIN_VECTORS,
+            ivf_lists=settings.NUMPY_INDEX_IVF_LISTS,
+            ivf_nprobe=settings.NUMPY_INDEX_IVF_NPROBE,
+            dims=settings.NUMPY_INDEX_DIMS,
+            quantization=settings.NUMPY_INDEX_QUANTIZATION,
+            rescore=settings.NUMPY_INDEX_RESCORE,
+        )
+
+    from django.utils.module_loading import import_string
+    return import_string(backend)(collection_name, embeddings, path)
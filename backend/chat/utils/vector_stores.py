@@ -0,0 +1,244 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Constants
+PUBLIC = "Public"
+PRIVATE = "Private"
+PUBLIC_DB_PATH = str(settings.PUBLIC_CHROMA_DB_PATH)
+PRIVATE_DB_PATH = str(settings.PRIVATE_CHROMA_DB_PATH)
+COLLECTION_NAME = "example_collection"
+EMBEDDING_MODEL = "text-embedding-3-large"
+CHAT_MODEL = "gpt-3.5-turbo"
+# Stay well below Chroma's maximum batch size per upsert call
+UPSERT_BATCH_SIZE = 1000
+
+STORE_PATHS = {
+    PUBLIC: PUBLIC_DB_PATH,
+    PRIVATE: PRIVATE_DB_PATH,
+}
+
+# Per-process registry. Clients are built on first use, never at import time,
+# and rebuilt after a fork so workers never share a Chroma/HTTP client. The
+# lock is re-entrant because factories may resolve other registry entries.
+# Evictable entries (per-owner stores and indexes) are also listed, least
+# recently used first, in `_evictable`.
+_lock = threading.RLock()
+_instances = {}
+_evictable = OrderedDict()
+_owner_pid = os.getpid()
+
+
+def close_instance(instance):
+    """
+    Release what `instance` holds open (files, connections), if it can.
+    """
+    close = getattr(instance, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            logger.exception(f"Failed to close {instance!r}")
+
+
+def get_or_create(key: str, factory, evictable: bool = False):
+    """
+    Return the cached instance registered under `key`, building it with
+    `factory()` on first use in this process.
+
+    At most settings.PRIVATE_STORE_CACHE_SIZE `evictable` entries are kept:
+    registering one more closes and drops the least recently used.
+    """
+    global _owner_pid
+
+    if _owner_pid != os.getpid():
+        with _lock:
+            if _owner_pid != os.getpid():
+                _instances.clear()
+                _evictable.clear()
+                _owner_pid = os.getpid()
+
+    if evictable:
+        with _lock:
+            instance = _instances.get(key)
+            if instance is None:
+                logger.debug(f"Initializing {key}")
+                instance = factory()
+                _instances[key] = instance
+                _evictable[key] = None
+                while len(_evictable) > max(settings.PRIVATE_STORE_CACHE_SIZE, 1):
+                    evicted, _ = _evictable.popitem(last=False)
+                    logger.debug(f"Evicting {evicted}")
+                    close_instance(_instances.pop(evicted))
+            else:
+                _evictable.move_to_end(key)
+            return instance
+
+    instance = _instances.get(key)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(key)
+            if instance is None:
+                logger.debug(f"Initializing {key}")
+                instance = factory()
+                _instances[key] = instance
+    return instance
+
+
+def reset():
+    """
+    Drop every cached client so the next call rebuilds it, closing the
+    evictable ones.
+    """
+    with _lock:
+        for key in _evictable:
+            close_instance(_instances.get(key))
+        _instances.clear()
+        _evictable.clear()
+
+
+def build_embeddings(backend: str = None):
+    """
+    Construct the embeddings backend named by `backend` (defaults to
+    settings.EMBEDDINGS_BACKEND): "openai", "fake" or a dotted class path.
+    """
+    backend = backend or settings.EMBEDDINGS_BACKEND
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    if backend == "fake":
+        from chat.utils.fakes import FakeEmbeddings
+        return FakeEmbeddings(
+            size=settings.FAKE_EMBEDDING_DIM,
+            latency=settings.FAKE_EMBEDDING_LATENCY,
+        )
+
+    from django.utils.module_loading import import_string
+    return import_string(backend)()
+
+
+def get_embeddings():
+    """
+    Shared embedding client used for both ingestion and retrieval.
+    """
+    return get_or_create("embeddings", build_embeddings)
+
+
+def build_chat_model(backend: str = None):
+    """
+    Construct the chat model named by `backend` (defaults to
+    settings.CHAT_BACKEND): "openai", "fake" or a dotted class path.
+    """
+    backend = backend or settings.CHAT_BACKEND
+    if backend == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model_name=CHAT_MODEL, temperature=0)
+    if backend == "fake":
+        from chat.utils.fakes import FakeChatModel
+        return FakeChatModel(latency=settings.FAKE_CHAT_LATENCY)
+
+    from django.utils.module_loading import import_string
+    return import_string(backend)()
+
+
+def get_chat_model():
+    """
+    Shared chat model used by the QA chains.
+    """
+    return get_or_create("chat_model", build_chat_model)
+
+
+def private_collection_name(owner_id: int) -> str:
+    return f"{COLLECTION_NAME}_user_{owner_id}"
+
+
+def get_vector_store(information_type: str = PUBLIC, owner_id: int = None):
+    """
+    Return the vector store for `information_type` ('Public' or 'Private'),
+    a `VectorBackend` of the kind set in settings.VECTOR_STORE_BACKENDS.
+
+    Private data lives in one collection per owner, so a user's search only
+    scans that user's chunks; those stores are evictable (see
+    `get_or_create`). Without `owner_id` the private store is the legacy
+    shared collection (see `split_private_collection`).
+    """
+    if information_type not in STORE_PATHS:
+        raise ValueError(f"Unknown information type: {information_type}")
+
+    collection_name = COLLECTION_NAME
+    per_owner = information_type == PRIVATE and owner_id is not None
+    if per_owner:
+        collection_name = private_collection_name(owner_id)
+
+    def build():
+        from chat.utils.vector_backends import build_backend
+        return build_backend(
+            settings.VECTOR_STORE_BACKENDS[information_type],
+            collection_name,
+            STORE_PATHS[information_type],
+            get_embeddings(),
+        )
+
+    return get_or_create(f"vector_store:{information_type}:{collection_name}", build, evictable=per_owner)
+
+
+def get_public_store():
+    return get_vector_store(PUBLIC)
+
+
+def get_private_store(owner_id: int = None):
+    return get_vector_store(PRIVATE, owner_id)
+
+
+def upsert_vectors(store, ids, vectors, texts, metadatas, batch_size: int = UPSERT_BATCH_SIZE):
+    """
+    Write precomputed vectors to `store` in batches Chroma accepts.
+    Yields the number of records written after each batch.
+    """
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        store.upsert(ids[start:end], vectors[start:end], texts[start:end], metadatas[start:end])
+        yield len(ids[start:end])
+
+
+def get_ids(store, where: dict) -> set:
+    """
+    Ids of every vector in `store` matching the metadata filter `where`.
+    """
+    return {record.id for record in store.get(where=where, include=())}
+
+
+def get_metadatas(store, where: dict) -> dict:
+    """
+    {id: metadata} for every vector in `store` matching `where`.
+    """
+    return {record.id: record.metadata for record in store.get(where=where, include=("metadatas",))}
+
+
+def get_records(store, where: dict) -> list:
+    """
+    [(id, document, metadata, vector)] for every vector in `store` matching `where`.
+    """
+    return [tuple(record) for record in store.get(where=where)]
+
+
+def update_metadatas(store, ids, metadatas, batch_size: int = UPSERT_BATCH_SIZE):
+    """
+    Rewrite metadata in place without touching documents or vectors.
+    """
+    for start in range(0, len(ids), batch_size):
+        store.update_metadatas(ids[start:start + batch_size], metadatas[start:start + batch_size])
+
+
+def delete_ids(store, ids, batch_size: int = UPSERT_BATCH_SIZE) -> int:
+    """
+    Delete vectors by id, in batches. Returns the number of ids deleted.
+    """
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        store.delete(ids[start:start + batch_size])
+    return len(ids)
@@ -1,18 +1,36 @@
 import os
+import hmac
+from contextlib import ExitStack
+
 from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 
 from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import File, Conversation
-from .serializers import FileSerializer, ConversationSerializer
-from .utils.process_file import process_file
+from .models import File, Conversation, IngestionBatch, IngestionJob
+from .pagination import ConversationCursorPagination
+from .serializers import (
+    FileSerializer,
+    ConversationSerializer,
+    IngestionBatchSerializer,
+    IngestionJobSerializer,
+    serialize_source_documents
+)
+from .utils import metrics, tracing
+from .utils.answer_cache import get_answer_cache
+from .utils.blobs import spool_blob, store_blob
+from .utils.bulk_upload import create_batch, iter_chunks, save_uploads
+from .utils.conversation_log import log_conversation, pending_conversations, recent_conversations, with_pending
+from .utils.conversation_memory import remember_turn
+from .utils.embedding_cache import get_embedding_cache
+from .utils.ingestion_queue import enqueue
 from .utils.public_chat import public_ask
 from .utils.private_chat import ask as private_ask
 
-# Ensure uploads folder exists
+# Flat uploads folder of files saved before upload storage (no `stored_name`)
 UPLOAD_DIR = os.path.join(settings.BASE_DIR, 'uploads')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -30,27 +48,72 @@ class FileUploadView(APIView):
 
         if not file_obj:
             return Response({"error": "No file uploaded."}, status=400)
+        if info_type not in dict(File.INFO_TYPE_CHOICES):
+            return Response({"error": "Invalid information_type."}, status=400)
+
+        # Hash while spooling: identical content reuses the stored blob
+        with spool_blob(iter_chunks(file_obj), file_obj.name) as blob:
+            # The row goes first, so deleting another File with this content keeps the blob
+            file_record = File.objects.create(
+                filename=file_obj.name,
+                stored_name=blob.stored_name,
+                content_hash=blob.content_hash,
+                user=request.user,
+                information_type=info_type
+            )
+            try:
+                store_blob(blob)
+            except Exception:
+                File.objects.filter(pk=file_record.pk).delete()
+                raise
 
-        file_record = File.objects.create(
-            filename=file_obj.name,
-            user=request.user,
-            information_type=info_type
-        )
+        serializer = FileSerializer(file_record)
+        return Response(serializer.data, status=201)
 
-        # Save to disk
-        import os
-        from django.conf import settings
+class BulkUploadView(APIView):
+    """
+    POST /api/chat/files/bulk/ → many files (`files`) and/or zip archives in
+    one multipart request. Files are streamed to disk, registered in one
+    bulk insert and queued as a single ingestion batch.
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
-        upload_path = os.path.join(settings.BASE_DIR, "uploads")
-        os.makedirs(upload_path, exist_ok=True)
+    def post(self, request):
+        uploads = request.FILES.getlist("files") + request.FILES.getlist("file")
+        info_type = request.data.get("information_type", File.PUBLIC)
+
+        if not uploads:
+            return Response({"error": "No files uploaded."}, status=400)
+        if info_type not in dict(File.INFO_TYPE_CHOICES):
+            return Response({"error": "Invalid information_type."}, status=400)
+
+        with ExitStack() as spools:
+            saved, skipped = save_uploads(
+                uploads, settings.BULK_UPLOAD_MAX_FILES, settings.BULK_UPLOAD_MAX_BYTES, spools
+            )
+            if not saved:
+                return Response({"error": "No supported files in the upload.", "skipped": skipped}, status=400)
+
+            batch = create_batch(request.user, saved, info_type)
+        batch = IngestionBatch.objects.prefetch_related('jobs__file').get(pk=batch.pk)
+        return Response({
+            "batch": IngestionBatchSerializer(batch).data,
+            "skipped": skipped,
+        }, status=202)
 
-        full_path = os.path.join(upload_path, file_obj.name)
-        with open(full_path, "wb+") as destination:
-            for chunk in file_obj.chunks():
-                destination.write(chunk)
 
-        serializer = FileSerializer(file_record)
-        return Response(serializer.data, status=201)
+class IngestionBatchView(APIView):
+    """
+    GET /api/chat/batches/<pk>/ → status and progress of a whole bulk upload.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        batch = get_object_or_404(IngestionBatch.objects.prefetch_related('jobs__file'), pk=pk)
+        if batch.user != request.user:
+            return Response({'error': 'Permission denied.'}, status=403)
+        return Response(IngestionBatchSerializer(batch).data)
+
 
 class FileDeleteView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -71,15 +134,22 @@ class FileProcessView(APIView):
         if file.user != request.user:
             return Response({'error': 'Permission denied.'}, status=403)
 
-        try:
-            new_status = process_file(file, UPLOAD_DIR)
-            file.status = new_status
-            file.save()
-            return Response({'message': 'File processed successfully.', 'status': new_status}, status=200)
-        except Exception as e:
-            file.status = 'Error'
-            file.save()
-            return Response({'error': f'Processing failed: {str(e)}'}, status=500)
+        job = enqueue(file)
+        return Response({
+            'message': 'File queued for processing.',
+            'job_id': job.id,
+            'status': job.status
+        }, status=202)
+
+
+class IngestionJobView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        job = get_object_or_404(IngestionJob.objects.select_related('file'), pk=pk)
+        if job.file.user != request.user:
+            return Response({'error': 'Permission denied.'}, status=403)
+        return Response(IngestionJobSerializer(job).data)
 
 
 class PublicChatView(APIView):
@@ -94,21 +164,10 @@ class PublicChatView(APIView):
         reply = output.get('result')
         source_docs = output.get('source_documents', [])
 
-        sources = [
-            {
-                'source': doc.metadata.get('source'),
-                'content': doc.page_content[:200]
-            }
-            for doc in source_docs
-        ]
-
-        Conversation.objects.create(
-            user=None,
-            conversation_type=Conversation.PUBLIC,
-            query=message,
-            answer=reply,
-            sources=sources
-        )
+        sources = serialize_source_documents(source_docs)
+
+        with tracing.span("db.conversation_write", endpoint="public"):
+            log_conversation(None, Conversation.PUBLIC, message, reply, sources)
 
         return Response({'reply': reply})
 
@@ -121,53 +180,114 @@ class PrivateChatView(APIView):
         if not message:
             return Response({'error': 'Message is required.'}, status=400)
 
-        output = private_ask(message)
+        output = private_ask(message, request.user.id)
         reply = output.get('result')
         source_docs = output.get('source_documents', [])
 
-        sources = [
-            {
-                'source': doc.metadata.get('source'),
-                'content': doc.page_content[:200]
-            }
-            for doc in source_docs
-        ]
+        sources = serialize_source_documents(source_docs)
 
         # Save conversation
-        Conversation.objects.create(
-            user=request.user,
-            conversation_type=Conversation.PRIVATE,
-            query=message,
-            answer=reply,
-            sources=sources
-        )
-
-        recent_history = (
-            Conversation.objects
-            .filter(user=request.user, conversation_type=Conversation.PRIVATE)
-            .order_by('-id')[:4]
-        )
-        serialized = ConversationSerializer(recent_history, many=True)
+        with tracing.span("db.conversation_write", endpoint="private"):
+            conversation = log_conversation(request.user, Conversation.PRIVATE, message, reply, sources)
+        remember_turn(request.user.id, conversation)
+
+        with tracing.span("db.history", endpoint="private"):
+            recent_history = recent_conversations(request.user.id, Conversation.PRIVATE, 4)
+            serialized = ConversationSerializer(recent_history, many=True)
+            history = serialized.data[::-1]  # Oldest first
         return Response({
             'reply': reply,
             'sources': sources,
-            'history': serialized.data[::-1]  # Oldest first
+            'history': history
         })
 
 
-
 # chat/views.py
 class PrivateChatHistoryView(APIView):
+    """
+    GET /api/chat/chat/private/history/ → the user's private turns, newest
+    first, one cursor page at a time:
+    {"next": url, "previous": url, "results": [...]}.
+
+    Query parameters: `page_size` (up to CHAT_HISTORY_MAX_PAGE_SIZE),
+    `cursor` (from `next`/`previous`) and `fields`, a comma-separated subset
+    of the conversation fields, e.g. `fields=id,query` to list turns
+    without loading their answers and sources.
+
+    The first page starts with the user's turns still in this worker's
+    write-behind buffer (no `id` yet), so a reply is in the history as soon
+    as it has been returned.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        conversations = (
-            Conversation.objects
-            .filter(user=request.user, conversation_type="Private")
-            .order_by("-id")[:10]
+        conversations = Conversation.objects.filter(
+            user=request.user, conversation_type=Conversation.PRIVATE
         )
-        # Reverse in Python before serializing
-        conversations = list(conversations)[::-1]
-        serializer = ConversationSerializer(conversations, many=True)
-        return Response(serializer.data)
 
+        fields = None
+        if request.query_params.get('fields'):
+            fields = [name.strip() for name in request.query_params['fields'].split(',') if name.strip()]
+            allowed = ConversationSerializer.Meta.fields
+            unknown = sorted(set(fields) - set(allowed))
+            if unknown:
+                return Response(
+                    {'error': f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}."},
+                    status=400,
+                )
+            # log_id too, to drop buffered turns flushed while we read
+            conversations = conversations.only('log_id', *ConversationSerializer.model_fields_for(fields))
+
+        paginator = ConversationCursorPagination()
+        first_page = paginator.cursor_query_param not in request.query_params
+        pending = pending_conversations(request.user.id, Conversation.PRIVATE) if first_page else []
+        with tracing.span("db.history", endpoint="private"):
+            page = paginator.paginate_queryset(conversations, request, view=self)
+        page = with_pending(pending, page)
+        serializer = ConversationSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class AnswerCacheStatsView(APIView):
+    """
+    Hit/miss counters of this worker process's public answer cache.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        cache = get_answer_cache()
+        if cache is None:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **cache.stats()})
+
+
+class MetricsView(APIView):
+    """
+    Latency series recorded by this worker process (traced stages,
+    requests, streaming timings, ...) with p50/p95/p99.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+
+def prometheus_metrics(request):
+    """
+    GET /metrics → the same series in Prometheus text format, for scraping.
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when that is set.
+    """
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class EmbeddingCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        cache = get_embedding_cache()
+        if cache is None:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **cache.stats()})
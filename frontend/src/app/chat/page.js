@@ -43,7 +43,9 @@ export default function ChatPage() {
 
         const data = await res.json();
 
-        const formatted = data
+        // The API pages newest first; show the latest page oldest first
+        const formatted = [...data.results]
+          .reverse()
           .map((conv) => [
             {
               sender: "user",
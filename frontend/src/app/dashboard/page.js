@@ -99,17 +99,31 @@ export default function DashboardPage() {
     const token = localStorage.getItem("agenticaAccessToken");
     setProcessingFileId(id);
     try {
-      await fetch(
+      const res = await fetch(
         `${process.env.NEXT_PUBLIC_API_URL}/chat/files/${id}/process/`,
         {
           method: "POST",
           headers: { Authorization: `Bearer ${token}` },
         }
       );
-      const updated = files.map((f) =>
-        f.id === id ? { ...f, status: "Processed" } : f
+      const { job_id } = await res.json();
+
+      // Processing runs in the background; poll the job until it finishes
+      let job = { status: "Queued" };
+      while (job.status === "Queued" || job.status === "Running") {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const jobRes = await fetch(
+          `${process.env.NEXT_PUBLIC_API_URL}/chat/jobs/${job_id}/`,
+          { headers: { Authorization: `Bearer ${token}` } }
+        );
+        if (!jobRes.ok) throw new Error("Failed to load job status");
+        job = await jobRes.json();
+      }
+
+      const newStatus = job.status === "Succeeded" ? "Processed" : "Error";
+      setFiles((current) =>
+        current.map((f) => (f.id === id ? { ...f, status: newStatus } : f))
       );
-      setFiles(updated);
     } catch (err) {
       console.error("Processing failed", err);
     } finally {